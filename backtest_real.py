@@ -15,24 +15,36 @@ V2 = all improvements:
 Usage:
   python backtest_real.py --file "BTCUSDT-1h-*.csv"
   python backtest_real.py --file BTCUSDT-1h-2025-01.csv
+  python backtest_real.py --file "BTCUSDT-1m-*.csv" --profile --profile-out run.prof
+  python backtest_real.py --file "BTCUSDT-1m-*.csv" --ob ob_data/BTC.obs
+  python backtest_real.py --db klines.db --symbol BTC --interval 1h
+  python backtest_real.py --file "BTCUSDT-1m-*.csv" --chunk 50000
+  python backtest_real.py --file "BTCUSDT-1h-*.csv" --save runs/base.npz
+  python backtest_real.py --diff runs/base.npz runs/new.npz
+  python backtest_real.py --file "BTCUSDT-1m-*.csv" --cache .indicator_cache
+  python backtest_real.py --update runs/base.npz          # after adding next month's CSV
+  python backtest_real.py --file "BTCUSDT-1h-*.csv" --horizons
+  python backtest_real.py --file "BTCUSDT-1m-*.csv" --bootstrap 2000
 """
 
-import sys
 import os
 import argparse
+import cProfile
+import contextlib
+import hashlib
+import json
+import tracemalloc
+import warnings
 import requests
 import pandas as pd
 import numpy as np
 import time
-from datetime import datetime
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Iterator, NamedTuple, Optional, Tuple
 
-try:
-    from ta.momentum import RSIIndicator
-    from ta.trend import MACD, EMAIndicator, ADXIndicator
-    from ta.volatility import BollingerBands, AverageTrueRange
-except ImportError:
-    print("ERROR: pip install ta pandas numpy")
-    sys.exit(1)
+from indicators import compute_series, rolling_min, rsi_divergence, warmup_bars
+from klines import decode_klines, INTERVAL_MS
 
 BINANCE_API = "https://api.binance.com/api/v3"
 
@@ -47,6 +59,82 @@ TIMEFRAME_CONFIG = {
 LOOKBACK_24H = {'1m': 1440, '15m': 96, '1h': 24, '4h': 6, '1d': 1}
 
 
+# ---------------------------------------------------------------------------
+# Stage profiler (--profile)
+# ---------------------------------------------------------------------------
+class StageProfiler:
+    """
+    Wall time, peak allocated memory and rows/sec per named stage.
+
+    Disabled by default: stage() then returns a shared no-op context so the
+    per-window instrumentation costs next to nothing. Memory is measured with
+    tracemalloc only for stages opened with memory=True; per-window stages
+    (indicators_at, scorers, forward window) accumulate wall time only.
+    """
+    _NULL = contextlib.nullcontext()
+
+    def __init__(self):
+        self.enabled = False
+        self.stats   = {}     # name -> [calls, seconds, rows, peak_bytes]
+        self._stack  = []     # open memory stages: [start_bytes, child_peak]
+
+    def enable(self):
+        self.enabled = True
+        tracemalloc.start()
+
+    def stage(self, name: str, rows: int = 0, memory: bool = True):
+        if not self.enabled:
+            return self._NULL
+        return self._Stage(self, name, rows, memory)
+
+    class _Stage:
+        __slots__ = ('prof', 'name', 'rows', 'memory', 't0')
+
+        def __init__(self, prof, name, rows, memory):
+            self.prof, self.name, self.rows, self.memory = prof, name, rows, memory
+
+        def __enter__(self):
+            if self.memory:
+                cur, peak = tracemalloc.get_traced_memory()
+                if self.prof._stack:   # fold the parent's peak so far before resetting
+                    parent = self.prof._stack[-1]
+                    parent[1] = max(parent[1], peak)
+                tracemalloc.reset_peak()
+                self.prof._stack.append([cur, cur])
+            self.t0 = time.perf_counter()
+            return self
+
+        def __exit__(self, *exc):
+            dt = time.perf_counter() - self.t0
+            peak_bytes = 0
+            if self.memory:
+                _, peak = tracemalloc.get_traced_memory()
+                start, child_peak = self.prof._stack.pop()
+                peak = max(peak, child_peak)
+                peak_bytes = peak - start
+                if self.prof._stack:
+                    parent = self.prof._stack[-1]
+                    parent[1] = max(parent[1], peak)
+            st = self.prof.stats.setdefault(self.name, [0, 0.0, 0, 0])
+            st[0] += 1; st[1] += dt; st[2] += self.rows
+            st[3] = max(st[3], peak_bytes)
+            return False
+
+    def report(self):
+        print(f"\n{'='*65}")
+        print("  Profile (wall time / peak allocated / throughput)")
+        print(f"{'='*65}")
+        print(f"  {'stage':28s} {'calls':>8s} {'time':>9s} {'alloc':>9s} {'rows/s':>11s}")
+        for name, (calls, secs, rows, peak) in self.stats.items():
+            alloc = f"{peak / 2**20:7.1f}MB" if peak else f"{'-':>9s}"
+            rps   = f"{rows / secs:11,.0f}" if rows and secs > 0 else f"{'-':>11s}"
+            print(f"  {name:28s} {calls:8,d} {secs:8.2f}s {alloc} {rps}")
+        print("  (timings include tracemalloc overhead)")
+
+
+PROFILER = StageProfiler()
+
+
 # ---------------------------------------------------------------------------
 # Data loading
 # ---------------------------------------------------------------------------
@@ -57,133 +145,244 @@ def fetch_binance(symbol: str, interval: str, limit: int) -> pd.DataFrame:
         timeout=20
     )
     r.raise_for_status()
-    df = pd.DataFrame(r.json(), columns=[
-        'open_time', 'open', 'high', 'low', 'close', 'volume',
-        'close_time', 'quote_vol', 'trades', 'tb_base', 'tb_quote', 'ignore'
-    ])
-    for col in ['open', 'high', 'low', 'close', 'volume']:
-        df[col] = pd.to_numeric(df[col])
-    return df.reset_index(drop=True)
+    return pd.DataFrame(decode_klines(r.json()))
 
 
-def load_csv(path: str) -> pd.DataFrame:
+def _csv_paths(path: str) -> list:
     import glob
     paths = sorted(glob.glob(path)) if '*' in path else [path]
     if not paths:
         raise FileNotFoundError(f"No files matched: {path}")
-    frames = []
-    for p in paths:
+    return paths
+
+
+def _open_ms(open_time):
+    """Open times in ms — Binance Vision switched to µs in 2025."""
+    return np.where(open_time > 10 ** 14, open_time // 1000, open_time)
+
+
+def _fmt_ms(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M UTC')
+
+
+def _last_cell(path: str) -> str:
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        lines = f.read().splitlines()
+    return lines[-1].split(b',')[0].strip().decode() if lines else ''
+
+
+def iter_csv(path: str, chunk_rows: Optional[int] = None,
+             after: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    Normalised OHLCV frames from a CSV or glob, file by file — in
+    `chunk_rows` pieces if given. `after` (open time, ms) drops the candles
+    up to it, skipping whole Binance Vision files without parsing them.
+    """
+    for p in _csv_paths(path):
         with open(p, 'r') as f:
             first_line = f.readline().strip()
         first_cell = first_line.split(',')[0].strip()
         is_binance_vision = first_cell.isdigit() and len(first_cell) > 10
+        if after is not None and is_binance_vision:
+            last = _last_cell(p)
+            if last.isdigit() and _open_ms(int(last)) <= after:
+                continue
         if is_binance_vision:
-            df = pd.read_csv(p, header=None, names=[
+            reader = pd.read_csv(p, header=None, chunksize=chunk_rows, names=[
                 'open_time', 'open', 'high', 'low', 'close', 'volume',
                 'close_time', 'quote_vol', 'trades', 'tb_base', 'tb_quote', 'ignore'
             ])
         else:
-            df = pd.read_csv(p)
-            df.columns = df.columns.str.lower().str.strip()
-            renames = {}
-            for col in df.columns:
-                for target, aliases in {
-                    'open': ['open'], 'high': ['high'], 'low': ['low'],
-                    'close': ['close', 'price', 'last'],
-                    'volume': ['volume', 'vol'],
-                }.items():
-                    if col in aliases:
-                        renames[col] = target
-            df = df.rename(columns=renames)
-        for col in ['open', 'high', 'low', 'close', 'volume']:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        frames.append(df)
-    df = pd.concat(frames, ignore_index=True)
-    df = df.dropna(subset=['open', 'high', 'low', 'close']).reset_index(drop=True)
+            reader = pd.read_csv(p, chunksize=chunk_rows)
+        for df in (reader if chunk_rows else [reader]):
+            if not is_binance_vision:
+                df.columns = df.columns.str.lower().str.strip()
+                renames = {}
+                for col in df.columns:
+                    for target, aliases in {
+                        'open': ['open'], 'high': ['high'], 'low': ['low'],
+                        'close': ['close', 'price', 'last'],
+                        'volume': ['volume', 'vol'],
+                    }.items():
+                        if col in aliases:
+                            renames[col] = target
+                df = df.rename(columns=renames)
+            for col in ['open', 'high', 'low', 'close', 'volume']:
+                if col in df.columns:
+                    df[col] = pd.to_numeric(df[col], errors='coerce')
+            if after is not None and 'open_time' in df.columns:
+                df = df[_open_ms(df['open_time'].to_numpy()) > after]
+            yield df.dropna(subset=['open', 'high', 'low', 'close'])
+
+
+def load_csv(path: str) -> pd.DataFrame:
+    paths = _csv_paths(path)
+    df = pd.concat(iter_csv(path), ignore_index=True)
     src = os.path.basename(paths[0]) if len(paths) == 1 else f"{len(paths)} files"
     print(f"  Loaded {len(df):,} rows from {src}")
     return df
 
 
-# ---------------------------------------------------------------------------
-# Pre-compute all indicator series across the full dataset
-# ---------------------------------------------------------------------------
-def precompute_series(df: pd.DataFrame, fast_p: int, slow_p: int) -> pd.DataFrame:
-    closes  = df['close'].astype(float)
-    highs   = df['high'].astype(float)
-    lows    = df['low'].astype(float)
-    volumes = df['volume'].astype(float)
-
-    # RSI
+def iter_store(path: str, symbol: str, interval: str, chunk_rows: int,
+               start_ms: int = 0) -> Iterator[pd.DataFrame]:
+    """One series from a KlineStore in pages of `chunk_rows` candles, from open time `start_ms`."""
+    from klines import KlineStore, to_array
+    store = KlineStore(path)
     try:
-        df['_rsi'] = RSIIndicator(close=closes, window=14).rsi()
-    except Exception:
-        df['_rsi'] = 50.0
-
-    # MACD diff
+        start = start_ms
+        while True:
+            rows = store.load_range(symbol, interval, start, limit=chunk_rows)
+            if not rows:
+                break
+            yield pd.DataFrame(to_array(rows))
+            start = rows[-1][0] + 1
+    finally:
+        store.close()
+
+
+def load_store(path: str, symbol: str, interval: str) -> pd.DataFrame:
+    """All candles of one series from a KlineStore (e.g. filled by download_klines.py)."""
+    from klines import KlineStore, to_array
+    store = KlineStore(path)
     try:
-        diff = MACD(close=closes).macd_diff()
-        df['_macd_diff']      = diff
-        df['_macd_diff_prev'] = diff.shift(1)
-    except Exception:
-        df['_macd_diff'] = 0.0; df['_macd_diff_prev'] = 0.0
+        rows = store.load_range(symbol, interval)
+    finally:
+        store.close()
+    if not rows:
+        raise ValueError(f"No {symbol} {interval} candles in {path} — run download_klines.py first")
+    print(f"  Loaded {len(rows):,} {symbol} {interval} candles from {path}")
+    return pd.DataFrame(to_array(rows))
+
+
+def ob_scores(records, df: pd.DataFrame, interval: str) -> Tuple[np.ndarray, int]:
+    """Per-row order-book score for `df` from loaded snapshots, and how many rows had one."""
+    from orderbook import align_to_candles, imbalance_scores
+    if 'open_time' not in df.columns:
+        raise ValueError("--ob needs candle open times (Binance kline CSVs or --symbol fetch)")
+    open_ms = _open_ms(df['open_time'].to_numpy(dtype=np.int64))
+    imb, covered = align_to_candles(records, open_ms, INTERVAL_MS[interval])
+    return imbalance_scores(imb), int(covered.sum())
+
+
+def load_ob(path: str, df: pd.DataFrame, interval: str) -> Tuple[np.ndarray, int]:
+    """Per-row order-book score from a record_orderbook.py file, aligned to candle closes."""
+    from orderbook import load_snapshots
+    symbol, rec = load_snapshots(path)
+    scores, covered = ob_scores(rec, df, interval)
+    print(f"  Order book: {len(rec):,} {symbol} snapshots cover {covered:,} "
+          f"of {len(df):,} candles ({covered / max(len(df), 1) * 100:.1f}%)")
+    return scores, covered
 
-    # EMAs
-    try:
+
+# ---------------------------------------------------------------------------
+# Pre-compute all indicator series across the full dataset
+# ---------------------------------------------------------------------------
+INDICATOR_COLUMNS = [
+    '_rsi', '_macd_diff', '_macd_diff_prev', '_ema_fast', '_ema_slow', '_vol_ma20', '_vol_ma100',
+    '_bb_pband', '_bb_wband', '_bb_wband_min50', '_adx', '_adx_pos', '_adx_neg', '_atr', '_atr_pct',
+    '_div',
+]
+
+
+def precompute_series(df: pd.DataFrame, fast_p: int, slow_p: int, cache=None) -> pd.DataFrame:
+    """df plus the INDICATOR_COLUMNS, computed or (with an IndicatorCache) memory-mapped from disk."""
+    matrix = None
+    if cache is not None:
+        with PROFILER.stage('precompute.cache', rows=len(df)):
+            key    = cache.key(df, fast_p, slow_p)
+            matrix = cache.load(key)
+    if matrix is None:
+        matrix = _indicator_matrix(df, fast_p, slow_p)
+        if cache is not None:
+            cache.save(key, matrix)
+    cols = {c: df[c].to_numpy() for c in df.columns}
+    cols.update((c, matrix[:, k]) for k, c in enumerate(INDICATOR_COLUMNS))
+    return pd.DataFrame(cols, copy=False)      # no consolidation: cached columns stay views
+
+
+def _indicator_matrix(df: pd.DataFrame, fast_p: int, slow_p: int) -> np.ndarray:
+    """(rows, len(INDICATOR_COLUMNS)) float64, column-major so each column is contiguous."""
+    closes  = df['close'].to_numpy(dtype=float)
+    highs   = df['high'].to_numpy(dtype=float)
+    lows    = df['low'].to_numpy(dtype=float)
+    volumes = df['volume'].to_numpy(dtype=float)
+    n       = len(df)
+    out     = np.empty((n, len(INDICATOR_COLUMNS)), order='F')
+    col     = {c: out[:, k] for k, c in enumerate(INDICATOR_COLUMNS)}
+
+    # RSI, MACD, EMAs, volume MAs, Bollinger, ADX, ATR — one fused kernel pass
+    with PROFILER.stage('precompute.kernel', rows=n):
         fp = min(fast_p, len(df) - 1)
         sp = min(slow_p, len(df) - 1)
-        df['_ema_fast'] = EMAIndicator(close=closes, window=fp).ema_indicator()
-        df['_ema_slow'] = EMAIndicator(close=closes, window=sp).ema_indicator()
-    except Exception:
-        df['_ema_fast'] = closes; df['_ema_slow'] = closes
-
-    # Volume MAs: 20-period (trend) and 100-period (conviction)
-    df['_vol_ma20']  = volumes.rolling(20).mean()
-    df['_vol_ma100'] = volumes.rolling(100).mean()
-
-    # Bollinger Bands
-    try:
-        bb = BollingerBands(close=closes, window=20, window_dev=2)
-        df['_bb_pband']      = bb.bollinger_pband()
-        df['_bb_wband']      = bb.bollinger_wband()
-        df['_bb_wband_min50'] = df['_bb_wband'].rolling(50).min()
-    except Exception:
-        df['_bb_pband'] = 0.5; df['_bb_wband'] = 1.0; df['_bb_wband_min50'] = 1.0
-
-    # ADX
-    try:
-        adx_obj = ADXIndicator(high=highs, low=lows, close=closes, window=14)
-        df['_adx']     = adx_obj.adx()
-        df['_adx_pos'] = adx_obj.adx_pos()
-        df['_adx_neg'] = adx_obj.adx_neg()
-    except Exception:
-        df['_adx'] = 20.0; df['_adx_pos'] = 25.0; df['_adx_neg'] = 25.0
-
-    # ATR (for adaptive lookahead)
-    try:
-        atr_obj = AverageTrueRange(high=highs, low=lows, close=closes, window=14)
-        df['_atr']     = atr_obj.average_true_range()
-        df['_atr_pct'] = df['_atr'] / closes * 100
-    except Exception:
-        df['_atr'] = 0.0; df['_atr_pct'] = 1.0
-
-    # RSI divergence (vectorised approximation, n=10 lookback)
-    df['_div'] = 0
-    try:
-        rsi_s       = df['_rsi']
-        px_min_n    = closes.rolling(10).min()
-        px_max_n    = closes.rolling(10).max()
-        rsi_at_low  = rsi_s.rolling(10).min()
-        rsi_at_high = rsi_s.rolling(10).max()
-        bull = (closes <= px_min_n * 1.01) & (rsi_s > rsi_at_low + 10)
-        bear = (closes >= px_max_n * 0.99) & (rsi_s < rsi_at_high - 10)
-        df.loc[bull, '_div'] = 1
-        df.loc[bear, '_div'] = -1
-    except Exception:
-        pass
+        s  = compute_series(highs, lows, closes, volumes, fp, sp)
+        col['_rsi'][:]            = s['rsi']
+        col['_macd_diff'][:]      = s['macd_diff']
+        col['_macd_diff_prev'][:] = np.concatenate(([np.nan], s['macd_diff'][:-1]))
+        col['_ema_fast'][:]       = s['ema_fast']
+        col['_ema_slow'][:]       = s['ema_slow']
+        col['_vol_ma20'][:]       = s['vol_ma20']
+        col['_vol_ma100'][:]      = s['vol_ma100']
+        col['_bb_pband'][:]       = s['bb_pband']
+        col['_bb_wband'][:]       = s['bb_wband']
+        col['_bb_wband_min50'][:] = rolling_min(s['bb_wband'], 50)
+        col['_adx'][:]            = s['adx']
+        col['_adx_pos'][:]        = s['adx_pos']
+        col['_adx_neg'][:]        = s['adx_neg']
+        col['_atr'][:]            = s['atr']
+        col['_atr_pct'][:]        = s['atr'] / closes * 100
+
+    # RSI divergence — the live detector's rule, evaluated at every bar
+    with PROFILER.stage('precompute.divergence', rows=n):
+        col['_div'][:] = rsi_divergence(closes, s['rsi'])
+
+    return out
+
+
+class IndicatorCache:
+    """
+    Content-addressed disk cache of _indicator_matrix() results. The key
+    hashes the OHLCV values, the periods, the fixed indicator settings and
+    the source of the code that computes them, so a stale entry can only be
+    hit by identical inputs. Entries are column-major .npy files; a hit is
+    an np.load(mmap_mode='r') that precompute_series() wraps without
+    copying, so reruns that only change scoring or reporting skip the
+    indicator pass. Nothing is evicted: delete the directory to reclaim it.
+    """
 
-    return df
+    SETTINGS = {'rsi': 14, 'adx': 14, 'atr': 14, 'macd': (12, 26, 9), 'bb': (20, 2),
+                'bb_wband_min': 50, 'vol_ma': (20, 100), 'divergence': (10, 10.0, 5)}
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        import inspect
+        import indicators
+        self._code = hashlib.blake2b(
+            (inspect.getsource(indicators) + inspect.getsource(_indicator_matrix)).encode(),
+            digest_size=8).hexdigest()
+
+    def key(self, df: pd.DataFrame, fast_p: int, slow_p: int) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        for c in ('high', 'low', 'close', 'volume'):
+            h.update(np.ascontiguousarray(df[c].to_numpy(dtype=np.float64)).data)
+        h.update(json.dumps([len(df), fast_p, slow_p, self.SETTINGS, INDICATOR_COLUMNS,
+                             self._code]).encode())
+        return h.hexdigest()
+
+    def load(self, key: str) -> Optional[np.ndarray]:
+        try:
+            return np.load(os.path.join(self.path, f"{key}.npy"), mmap_mode='r')
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, key: str, matrix: np.ndarray):
+        final = os.path.join(self.path, f"{key}.npy")
+        tmp   = f"{final}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, matrix)
+        os.replace(tmp, final)                 # readers never see a partial file
 
 
 def indicators_at(df: pd.DataFrame, i: int) -> dict:
@@ -432,22 +631,174 @@ def score_v2(ind, c24=0.0, ob=0):
 # ---------------------------------------------------------------------------
 # Rolling-window backtest
 # ---------------------------------------------------------------------------
-def backtest(df, fast_p, slow_p, mpu, base_lookahead, interval, min_window=60, step=1):
+ALGOS   = ('orig', 'v1', 'v2')
+REGIMES = ('trending', 'transitioning', 'ranging')
+_REGIME_CODE = {r: k for k, r in enumerate(REGIMES)}
+
+
+def backtest(df, fast_p, slow_p, mpu, base_lookahead, interval, min_window=60, step=1, ob=None,
+             cache=None):
+    """
+    One typed row per scored window (columns in _window_loop).
+    `ob`: optional per-row order-book score (+1/-1/0 as of each candle's close, see load_ob).
+    `cache`: optional IndicatorCache for the indicator columns.
+    """
     lb24 = LOOKBACK_24H.get(interval, 24)
-    rows_o, rows_v1, rows_v2 = [], [], []
 
     print("  Pre-computing indicator series…", flush=True)
-    df = precompute_series(df.copy(), fast_p, slow_p)
-    n_windows = len(range(min_window, len(df) - base_lookahead * 2, step))
-    print(f"  Done. Running {n_windows:,} windows…", flush=True)
+    df = precompute_series(df, fast_p, slow_p, cache)
+    windows = range(min_window, len(df) - base_lookahead * 2, step)
+    print(f"  Done. Running {len(windows):,} windows…", flush=True)
+
+    with PROFILER.stage('window_loop', rows=len(windows)):
+        return _window_loop(df, mpu, base_lookahead, lb24, windows, ob)
+
+
+OHLCV_COLUMNS = ['open_time', 'open', 'high', 'low', 'close', 'volume']
+
 
-    for i in range(min_window, len(df) - base_lookahead * 2, step):
+@dataclass
+class StreamState:
+    """
+    Where a backtest stopped: the rows the next windows still need (warm-up
+    history plus the unscored lookahead tail) and the counters so far. Saved
+    with a run, it lets --update score only newly added candles.
+    """
+    tail:        pd.DataFrame   # series rows [offset, offset + len(tail))
+    offset:      int
+    next_window: int
+    rows:        int = 0
+    windows:     int = 0
+    covered:     int = 0        # rows with an order-book snapshot (--ob)
+
+    @property
+    def last_open_time(self) -> Optional[int]:
+        """Open time (ms) of the last row seen, or None when the source has no open times."""
+        if 'open_time' not in self.tail.columns or self.tail.empty:
+            return None
+        return int(_open_ms(self.tail['open_time'].to_numpy()[-1]))
+
+    @classmethod
+    def of(cls, df: pd.DataFrame, keep: int, windows: range, n_windows: int, covered: int = 0):
+        """State after an in-memory backtest() of all of df over `windows`."""
+        nxt  = windows.start + len(windows) * windows.step
+        cut  = _trim(df, 0, nxt, keep)
+        tail = df.iloc[cut:][[c for c in OHLCV_COLUMNS if c in df.columns]].reset_index(drop=True)
+        return cls(tail, cut, nxt, len(df), n_windows, covered)
+
+
+def stream_keep(fast_p: int, slow_p: int, interval: str) -> int:
+    """Rows kept before the next window: indicator warm-up plus the 24h lookback."""
+    return warmup_bars(fast_p, slow_p) + LOOKBACK_24H.get(interval, 24) + 1
+
+
+def _trim(buf: pd.DataFrame, off: int, nxt: int, keep: int) -> int:
+    """How many leading rows of buf (starting at series row `off`) no window from `nxt` on needs."""
+    return max(0, min(len(buf), nxt - 1 - keep - off))
+
+
+def backtest_stream(frames: Iterator[pd.DataFrame], fast_p, slow_p, mpu, base_lookahead, interval,
+                    min_window=60, step=1, ob_records=None, cache=None,
+                    stats=None, state: Optional[StreamState] = None, keep_results=False,
+                    horizons=0, hz=None):
+    """
+    backtest() over a stream of OHLCV frames (iter_csv / iter_store) in
+    memory bounded by the frame size. Each frame is scored together with the
+    rows before it that its windows still need (indicator warm-up from
+    warmup_bars() plus the 24h lookback) and waits for the lookahead rows
+    after it, so every window sees the same indicator values and forward
+    prices as in a whole-file run. Each frame's results are folded into the
+    running tally `stats` and dropped, unless keep_results.
+
+    Passing the tally and StreamState of an earlier run continues it: the
+    frames are then only the candles added since, and must start with the
+    candle right after the state's last one (ValueError otherwise — a
+    missing month or a fetch that did not reach back far enough). `horizons` > 0 also folds
+    horizon_tally() up to that many candles into `hz`.
+
+    Returns (tally, StreamState, results or None, horizon tally or None).
+    """
+    lb24 = LOOKBACK_24H.get(interval, 24)
+    keep = stream_keep(fast_p, slow_p, interval)
+    la2  = base_lookahead * 2
+    if state is None:
+        state = StreamState(pd.DataFrame(columns=OHLCV_COLUMNS), 0, min_window)
+    buf, off, nxt = state.tail, state.offset, state.next_window   # buf holds rows [off, off + len(buf))
+    n_rows, n_windows, covered = state.rows, state.windows, state.covered
+    buf_ob = ob_scores(ob_records, buf, interval)[0] if ob_records is not None else None
+    expect = state.last_open_time
+    kept = []
+
+    for frame in frames:
+        frame = frame[[c for c in OHLCV_COLUMNS if c in frame.columns]].reset_index(drop=True)
+        if frame.empty:
+            continue
+        if expect is not None and 'open_time' in frame.columns:
+            first = int(_open_ms(frame['open_time'].to_numpy()[0]))
+            if first != expect + INTERVAL_MS[interval]:
+                raise ValueError(f"new candles start at {_fmt_ms(first)}, expected "
+                                 f"{_fmt_ms(expect + INTERVAL_MS[interval])} — data missing in between")
+            expect = None
+        n_rows += len(frame)
+        if ob_records is not None:
+            frame_ob, cov = ob_scores(ob_records, frame, interval)
+            covered += cov
+            buf_ob = np.concatenate((buf_ob, frame_ob))
+        buf = frame if buf.empty else pd.concat([buf, frame], ignore_index=True)
+        end = off + len(buf) - la2                      # windows past this lack lookahead rows
+        if nxt >= end:
+            continue
+        windows = range(nxt - off, end - off, step)
+        with PROFILER.stage('precompute', rows=len(buf)):
+            pre = precompute_series(buf, fast_p, slow_p, cache)
+        with PROFILER.stage('window_loop', rows=len(windows)):
+            res = _window_loop(pre, mpu, base_lookahead, lb24, windows, buf_ob, offset=off)
+        stats = fold(stats, tally(res))
+        if horizons:
+            with PROFILER.stage('horizons', rows=len(res)):
+                hz = fold_horizons(hz, horizon_tally(res, buf, mpu, horizons, offset=off))
+        n_windows += len(res)
+        if keep_results:
+            kept.append(res)
+        del pre, res
+
+        nxt = off + windows[-1] + step
+        cut = _trim(buf, off, nxt, keep)
+        buf = buf.iloc[cut:].reset_index(drop=True)
+        buf_ob = buf_ob[cut:] if buf_ob is not None else None
+        off += cut
+        print(f"    … {n_rows:,} rows, {n_windows:,} windows", flush=True)
+
+    state = StreamState(buf, off, nxt, n_rows, n_windows, covered)
+    results = pd.concat(kept, ignore_index=True) if kept else None
+    return stats, state, results, hz
+
+
+def _window_loop(df, mpu, base_lookahead, lb24, windows, ob=None, offset=0) -> pd.DataFrame:
+    """
+    Score rows `windows` of df; `offset` is df's first row in the whole
+    series. Returns one row per window: window (row in the series),
+    score_<algo> int8, hit_<algo> bool (target hit), actual_pct float32,
+    market_regime categorical, ob int8 and score_no_ob int8 (V2 without the
+    order-book term; equal to score_v2 when ob is 0).
+    """
+    stage  = PROFILER.stage
+    m      = len(windows)
+    scores = np.zeros((len(ALGOS), m), dtype=np.int8)
+    hits   = np.zeros((len(ALGOS), m), dtype=bool)
+    actual_pct = np.zeros(m, dtype=np.float32)
+    regime = np.zeros(m, dtype=np.int8)
+    ob_col = np.zeros(m, dtype=np.int8)
+    no_ob  = np.zeros(m, dtype=np.int8)
+    scored = np.zeros(m, dtype=bool)
+    for j, i in enumerate(windows):
         ep  = float(df.iloc[i]['close'])
-        lb  = min(lb24, i)
+        lb  = min(lb24, i + offset)
         pp  = float(df.iloc[i - lb]['close'])
         c24 = (ep - pp) / pp * 100 if pp > 0 else 0.0
 
-        ind = indicators_at(df, i - 1)
+        with stage('indicators_at', rows=1, memory=False):
+            ind = indicators_at(df, i - 1)
 
         # ATR-adaptive lookahead (improvement #7)
         # High ATR = market moves fast → evaluate sooner
@@ -458,129 +809,638 @@ def backtest(df, fast_p, slow_p, mpu, base_lookahead, interval, min_window=60, s
         if adaptive_la < 1:
             continue
 
-        fu  = df.iloc[i: i + adaptive_la]
-        fhi = float(fu['high'].max())
-        flo = float(fu['low'].min())
-        fc  = float(fu.iloc[-1]['close'])
-        actual = (fc - ep) / ep * 100
+        with stage('forward_window', rows=1, memory=False):
+            fu  = df.iloc[i: i + adaptive_la]
+            fhi = float(fu['high'].max())
+            flo = float(fu['low'].min())
+            fc  = float(fu.iloc[-1]['close'])
+            actual = (fc - ep) / ep * 100
 
-        sc_o  = score_orig(ind, c24)
-        sc_v1 = score_v1(ind, c24)
-        sc_v2 = score_v2(ind, c24)
+        # Order book as it stood when candle i-1 closed — what the live bot would have read
+        ob_i = int(ob[i - 1]) if ob is not None else 0
 
-        for sc, rows in [(sc_o, rows_o), (sc_v1, rows_v1), (sc_v2, rows_v2)]:
-            pd_ok = bool(int(np.sign(sc)) == int(np.sign(actual))) if sc != 0 else None
+        with stage('scorers', rows=1, memory=False):
+            sc_o  = score_orig(ind, c24, ob_i)
+            sc_v1 = score_v1(ind, c24, ob_i)
+            sc_v2 = score_v2(ind, c24, ob_i)
+
+        for k, sc in enumerate((sc_o, sc_v1, sc_v2)):
             if   sc > 0: th = fhi >= ep * (1 + sc * mpu)
             elif sc < 0: th = flo <= ep * (1 + sc * mpu)
             else:        th = abs(actual) < mpu * 100
-            rows.append(dict(
-                score=sc, actual_pct=actual, dir_correct=pd_ok,
-                target_hit=th, market_regime=ind.get('market_regime', 'transitioning')
-            ))
-
-    return pd.DataFrame(rows_o), pd.DataFrame(rows_v1), pd.DataFrame(rows_v2)
+            scores[k, j], hits[k, j] = sc, th
+        actual_pct[j] = actual
+        regime[j] = _REGIME_CODE[ind.get('market_regime', 'transitioning')]
+        ob_col[j] = ob_i
+        no_ob[j]  = score_v2(ind, c24) if ob_i else sc_v2
+        scored[j] = True
+
+    res = pd.DataFrame({'window': np.asarray(windows, dtype=np.int64) + offset})
+    for k, algo in enumerate(ALGOS):
+        res[f'score_{algo}'] = scores[k]
+        res[f'hit_{algo}']   = hits[k]
+    res['actual_pct']    = actual_pct
+    res['market_regime'] = pd.Categorical.from_codes(regime, REGIMES)
+    res['ob']            = ob_col
+    res['score_no_ob']   = no_ob
+    return res[scored].reset_index(drop=True) if not scored.all() else res
+
+
+def horizon_tally(res: pd.DataFrame, df: pd.DataFrame, mpu: float, max_h: int,
+                  offset: int = 0) -> pd.DataFrame:
+    """
+    Grade every window of `res` h = 1..max_h candles after its entry close
+    instead of at the ATR-adaptive lookahead: per horizon and scorer, the
+    number of signals `n_<algo>`, right directions `dir_<algo>` and target
+    hits `tgt_<algo>`, by the same rules as _window_loop (horizon h is its
+    lookahead h + 1, the forward high/low starting at the entry candle).
+    `df` holds the OHLCV rows from series row `offset` and must reach max_h
+    rows past the last window (backtest() windows leave 2 × lookahead). The
+    forward high/low are running extremes, so each horizon is one pass over
+    the window vector. Counts add up across blocks (fold_horizons).
+    """
+    close = df['close'].to_numpy(dtype=np.float64)
+    high  = df['high'].to_numpy(dtype=np.float64)
+    low   = df['low'].to_numpy(dtype=np.float64)
+    rows  = res['window'].to_numpy() - offset
+    entry = close[rows]
+    score = np.stack([res[f'score_{a}'].to_numpy() for a in ALGOS])     # (algo, window)
+    sig   = score != 0
+    side  = np.sign(score)
+    target = entry * (1 + score * mpu)
+
+    out  = {'horizon': np.arange(1, max_h + 1, dtype=np.int64)}
+    cnt  = np.zeros((2, len(ALGOS), max_h), dtype=np.int64)
+    fhi  = high[rows]
+    flo  = low[rows]
+    for h in range(max_h):
+        fwd = rows + h + 1
+        fhi = np.maximum(fhi, high[fwd])
+        flo = np.minimum(flo, low[fwd])
+        move = np.sign(close[fwd] - entry)
+        hit  = np.where(score > 0, fhi >= target, flo <= target)
+        cnt[0, :, h] = (sig & (side == move)).sum(axis=1)
+        cnt[1, :, h] = (sig & hit).sum(axis=1)
+    for k, algo in enumerate(ALGOS):
+        out[f'n_{algo}']   = np.full(max_h, sig[k].sum(), dtype=np.int64)
+        out[f'dir_{algo}'] = cnt[0, k]
+        out[f'tgt_{algo}'] = cnt[1, k]
+    return pd.DataFrame(out)
+
+
+def fold_horizons(acc: Optional[pd.DataFrame], part: pd.DataFrame) -> pd.DataFrame:
+    """Running horizon_tally() of consecutive blocks."""
+    if acc is None:
+        return part
+    return (acc.set_index('horizon') + part.set_index('horizon')).reset_index()
 
 
 # ---------------------------------------------------------------------------
 # Reporting
 # ---------------------------------------------------------------------------
-def report(orig, v1, v2, label):
+TALLY_KEYS = ['score_orig', 'score_v1', 'score_v2', 'market_regime', 'move', 'ob', 'score_no_ob']
+TALLY_SUMS = ['n', 'hit_orig', 'hit_v1', 'hit_v2']
+
+
+def tally(res: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-window results → window count `n` and target hits per scorer for
+    every TALLY_KEYS combination (`move` is the sign of the realised
+    return), in one grouped aggregation. Every figure the report prints is a
+    ratio of these sums, so tallies of consecutive blocks add up (fold).
+    """
+    keyed = res.assign(move=np.sign(res['actual_pct']).astype(np.int8), n=np.int64(1))
+    return _regroup(keyed)
+
+
+def _regroup(df: pd.DataFrame) -> pd.DataFrame:
+    return df.groupby(TALLY_KEYS, observed=True, sort=False)[TALLY_SUMS].sum().reset_index()
+
+
+def fold(acc: Optional[pd.DataFrame], part: pd.DataFrame) -> pd.DataFrame:
+    """Running aggregate: the tally of two chunks is the sum of their tallies."""
+    return part if acc is None else _regroup(pd.concat([acc, part], ignore_index=True))
+
+
+SCORER_LABELS = {'orig': 'Original', 'v1': 'V1 regime', 'v2': 'V2 full'}
+SCORE_BANDS   = [(5, 9, 'score≥5'), (3, 4, 'score 3-4'), (2, 2, 'score=2'), (1, 1, 'score=1')]
+
+
+def report_groups(stats: pd.DataFrame):
+    """
+    (section, label, rows, score, hit column or None) for every report line:
+    which tally rows it counts, the score whose sign is graded and the
+    target-hit column. Works on per-window results too (one row per window).
+    """
+    v2 = stats['score_v2'].to_numpy()
+    ob = stats['ob'].to_numpy()
+    for algo in ALGOS:
+        score = stats[f'score_{algo}'].to_numpy()
+        yield 'scorer', SCORER_LABELS[algo], score != 0, score, f'hit_{algo}'
+    for lo, hi, lbl in SCORE_BANDS:
+        yield 'band', f'bull {lbl}', (v2 >= lo) & (v2 <= hi), v2, 'hit_v2'
+        yield 'band', f'bear {lbl}', (v2 >= -hi) & (v2 <= -lo), v2, 'hit_v2'
+    for r in REGIMES:
+        yield 'regime', r, (v2 != 0) & (stats['market_regime'] == r).to_numpy(), v2, 'hit_v2'
+    for k in (2, 3):
+        yield 'conviction', f'|score| ≥ {k}', np.abs(v2) >= k, v2, 'hit_v2'
+
+    no_ob = stats['score_no_ob'].to_numpy()
+    yield 'ob', 'bid-heavy', ob > 0, ob, None
+    yield 'ob', 'ask-heavy', ob < 0, ob, None
+    yield 'ob', 'OB sign alone', ob != 0, ob, None
+    yield 'ob', 'V2 with OB', (ob != 0) & (v2 != 0), v2, None
+    yield 'ob', 'V2 without OB', (ob != 0) & (no_ob != 0), no_ob, None
+
+
+def summarize(stats: pd.DataFrame) -> dict:
+    """
+    Every figure of the report from a tally, keyed (section, label) →
+    (n, dir %, tgt %, share of all windows %). Used by report() and diff_runs().
+    """
+    n     = stats['n'].to_numpy()
+    move  = stats['move'].to_numpy()
+    total = int(n.sum())
+    lines = {}
+    for section, label, mask, score, hit in report_groups(stats):
+        cnt = int(n[mask].sum())
+        if cnt == 0:
+            continue
+        right = n[mask & (np.sign(score) == move)].sum()
+        tgt   = stats[hit].to_numpy()[mask].sum() / cnt * 100 if hit else float('nan')
+        lines[(section, label)] = (cnt, right / cnt * 100, tgt, cnt / total * 100)
+    return lines
+
+
+def report(stats, label, with_ob=False):
+    """Print the comparison from a tally (see tally/fold)."""
+    lines = summarize(stats)
+
     print(f"\n{'='*65}")
     print(f"  {label}")
     print(f"{'='*65}")
-    for name, df in [('Original', orig), ('V1 regime', v1), ('V2 full', v2)]:
-        active = df[df['score'] != 0]
-        if len(active) == 0:
-            continue
-        da = active['dir_correct'].mean() * 100
-        ta = active['target_hit'].mean() * 100
-        sr = len(active) / len(df) * 100
-        print(f"  {name:10s}: dir={da:5.1f}%  tgt={ta:5.1f}%  sig_rate={sr:.1f}%  n={len(active)}")
+    for algo in ALGOS:
+        name = SCORER_LABELS[algo]
+        if ('scorer', name) in lines:
+            n, da, ta, sr = lines[('scorer', name)]
+            print(f"  {name:10s}: dir={da:5.1f}%  tgt={ta:5.1f}%  sig_rate={sr:.1f}%  n={n}")
 
     # Per-score band for V2
     print(f"\n  V2 score breakdown:")
-    v2_active = v2[v2['score'] != 0]
-    for lo, hi, lbl in [(5,9,'score≥5'), (3,4,'score 3-4'), (2,2,'score=2'), (1,1,'score=1')]:
-        for sign, slbl in [(1, 'bull'), (-1, 'bear')]:
-            sub = v2_active[v2_active['score'].between(
-                sign*lo if sign > 0 else sign*hi,
-                sign*hi if sign > 0 else sign*lo
-            )]
-            if len(sub) < 5:
-                continue
-            da = sub['dir_correct'].mean() * 100
-            print(f"    {slbl:4s} {lbl:10s}  n={len(sub):4d}  dir={da:.1f}%")
+    for _, _, lbl in SCORE_BANDS:
+        for slbl in ('bull', 'bear'):
+            n, da, _, _ = lines.get(('band', f'{slbl} {lbl}'), (0, 0, 0, 0))
+            if n >= 5:
+                print(f"    {slbl:4s} {lbl:10s}  n={n:4d}  dir={da:.1f}%")
 
     # Regime breakdown for V2
     print(f"\n  V2 by detected regime:")
-    for r in ['trending', 'transitioning', 'ranging']:
-        sub = v2[(v2['market_regime'] == r) & (v2['score'] != 0)]
-        if len(sub) < 5:
+    for r in REGIMES:
+        n, da, ta, _ = lines.get(('regime', r), (0, 0, 0, 0))
+        if n >= 5:
+            print(f"    {r:15s}  n={n:4d}  dir={da:.1f}%  tgt={ta:.1f}%")
+
+    # High-conviction filters: what if we only trade |score| >= 2 / >= 3?
+    for k in (2, 3):
+        print(f"\n  V2 high-conviction filter (|score| ≥ {k}):")
+        if ('conviction', f'|score| ≥ {k}') in lines:
+            n, da, ta, sr = lines[('conviction', f'|score| ≥ {k}')]
+            print(f"    dir={da:.1f}%  tgt={ta:.1f}%  sig_rate={sr:.1f}%  n={n}")
+
+    if with_ob:
+        report_ob(lines, int(stats['n'].sum()))
+
+
+def report_ob(lines: dict, total: int):
+    """V2 with the recorded order-book term vs the same windows scored without it."""
+    n = lines.get(('ob', 'OB sign alone'), (0,))[0]
+    print(f"\n  V2 order book (--ob): non-zero on {n:,} of {total:,} windows "
+          f"(bid-heavy {lines.get(('ob', 'bid-heavy'), (0,))[0]}, "
+          f"ask-heavy {lines.get(('ob', 'ask-heavy'), (0,))[0]})")
+    if n == 0:
+        return
+    print(f"    OB sign alone:  dir={lines[('ob', 'OB sign alone')][1]:5.1f}%  n={n}")
+    for lbl in ('with OB', 'without OB'):
+        if ('ob', f'V2 {lbl}') in lines:
+            na, da, _, _ = lines[('ob', f'V2 {lbl}')]
+            print(f"    V2 {lbl:11s} dir={da:5.1f}%  n={na}")
+
+
+def report_horizons(hz: pd.DataFrame):
+    """Direction accuracy and target hit of every scorer against the candles held after entry."""
+    print(f"\n  Accuracy by horizon (candles after entry, dir% / tgt%):")
+    print(f"    {'h':>3s}" + ''.join(f"  {SCORER_LABELS[a]:>13s}" for a in ALGOS))
+    for row in hz.itertuples(index=False):
+        cells = []
+        for algo in ALGOS:
+            n = getattr(row, f'n_{algo}')
+            cells.append(f"  {getattr(row, f'dir_{algo}') / max(n, 1) * 100:5.1f} / "
+                         f"{getattr(row, f'tgt_{algo}') / max(n, 1) * 100:5.1f}")
+        print(f"    {row.horizon:3d}" + ''.join(cells))
+    print("    " + " " * 3 + ''.join(f"  {'n=' + str(hz[f'n_{a}'].iloc[0]):>13s}" for a in ALGOS))
+
+
+# ---------------------------------------------------------------------------
+# Bootstrap confidence intervals
+# ---------------------------------------------------------------------------
+BOOTSTRAP_SECTIONS = ('scorer', 'band', 'regime', 'conviction')
+BOOTSTRAP_TASK     = 50            # resamples per pool task
+
+_block_sums = None                 # per-process, set by _init_bootstrap
+
+
+def _init_bootstrap(block_sums: np.ndarray):
+    global _block_sums
+    _block_sums = block_sums
+
+
+def _resample(seed, reps: int, n_blocks: int) -> np.ndarray:
+    """Counts of `reps` resamples, each `n_blocks` blocks drawn with replacement."""
+    rng    = np.random.default_rng(seed)
+    starts = rng.integers(0, len(_block_sums), size=(reps, n_blocks))
+    return _block_sums[starts].sum(axis=1, dtype=np.int64)
+
+
+def bootstrap_ci(res: pd.DataFrame, n_resamples: int = 2000, block: Optional[int] = None,
+                 workers: Optional[int] = None, level: float = 95.0, seed: int = 0) -> dict:
+    """
+    Circular block-bootstrap intervals for the dir % and tgt % of every
+    scorer / band / regime / conviction line, keyed like summarize() →
+    (dir_lo, dir_hi, tgt_lo, tgt_hi). Windows overlap their neighbours'
+    lookahead, so whole runs of `block` consecutive windows are resampled
+    (default n^(1/3)). Each line's per-window count / right / hit indicators
+    are summed once per possible block start; a resample is then a gather of
+    n/block rows of that table and a sum, spread over `workers` processes in
+    tasks of BOOTSTRAP_TASK resamples. Results depend on `seed` only.
+    """
+    res   = res.sort_values('window')
+    n     = len(res)
+    block = max(1, min(n, block or round(n ** (1 / 3))))
+    move  = np.sign(res['actual_pct'].to_numpy()).astype(np.int8)
+    keys, cols = [], []
+    for section, label, mask, score, hit in report_groups(res):
+        if section in BOOTSTRAP_SECTIONS and mask.any():
+            keys.append((section, label))
+            cols += [mask, mask & (np.sign(score) == move), mask & res[hit].to_numpy()]
+    if not keys:
+        return {}
+
+    # Sum of each indicator over the block starting at every window (wrapping around)
+    dtype = np.int16 if block < 2 ** 15 else np.int32
+    block_sums = np.empty((n, len(cols)), dtype=dtype)
+    for j, col in enumerate(cols):
+        c = np.concatenate(([0], np.cumsum(np.concatenate((col, col[:block - 1])), dtype=np.int64)))
+        block_sums[:, j] = c[block:] - c[:-block]
+
+    n_blocks = max(1, round(n / block))
+    tasks    = [min(BOOTSTRAP_TASK, n_resamples - k) for k in range(0, n_resamples, BOOTSTRAP_TASK)]
+    seeds    = np.random.SeedSequence(seed).spawn(len(tasks))
+    workers  = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_bootstrap,
+                                 initargs=(block_sums,)) as pool:
+            parts = list(pool.map(_resample, seeds, tasks, [n_blocks] * len(tasks)))
+    else:
+        _init_bootstrap(block_sums)
+        parts = [_resample(sd, reps, n_blocks) for sd, reps in zip(seeds, tasks)]
+        _init_bootstrap(None)
+    sums = np.concatenate(parts).reshape(n_resamples, len(keys), 3).astype(np.float64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rates = sums[:, :, 1:] / sums[:, :, :1] * 100          # (resample, line, dir|tgt)
+    tail = (100 - level) / 2
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)         # lines absent from every resample
+        lo, hi = np.nanpercentile(rates, [tail, 100 - tail], axis=0)
+    return {key: (lo[k, 0], hi[k, 0], lo[k, 1], hi[k, 1]) for k, key in enumerate(keys)}
+
+
+def report_ci(stats: pd.DataFrame, ci: dict, n_resamples: int, block: int, level: float = 95.0):
+    """The bootstrap intervals next to the point estimates of summarize()."""
+    lines = summarize(stats)
+    print(f"\n  {level:g}% block-bootstrap intervals ({n_resamples:,} resamples, "
+          f"blocks of {block:,} windows):")
+    section = None
+    for key, (dlo, dhi, tlo, thi) in ci.items():
+        if key not in lines:
             continue
-        da = sub['dir_correct'].mean() * 100
-        ta = sub['target_hit'].mean() * 100
-        print(f"    {r:15s}  n={len(sub):4d}  dir={da:.1f}%  tgt={ta:.1f}%")
-
-    # High-conviction filter: what if we only trade |score| >= 2?
-    print(f"\n  V2 high-conviction filter (|score| ≥ 2):")
-    hc = v2[v2['score'].abs() >= 2]
-    if len(hc) > 0:
-        da = hc['dir_correct'].mean() * 100
-        ta = hc['target_hit'].mean() * 100
-        sr = len(hc) / len(v2) * 100
-        print(f"    dir={da:.1f}%  tgt={ta:.1f}%  sig_rate={sr:.1f}%  n={len(hc)}")
-
-    print(f"\n  V2 high-conviction filter (|score| ≥ 3):")
-    hc3 = v2[v2['score'].abs() >= 3]
-    if len(hc3) > 0:
-        da = hc3['dir_correct'].mean() * 100
-        ta = hc3['target_hit'].mean() * 100
-        sr = len(hc3) / len(v2) * 100
-        print(f"    dir={da:.1f}%  tgt={ta:.1f}%  sig_rate={sr:.1f}%  n={len(hc3)}")
+        if key[0] != section:
+            section = key[0]
+            print(f"    [{section}]")
+        n, da, ta, _ = lines[key]
+        print(f"      {key[1]:16s} n={n:<7d} dir={da:5.1f}% [{dlo:5.1f}, {dhi:5.1f}]  "
+              f"tgt={ta:5.1f}% [{tlo:5.1f}, {thi:5.1f}]")
+
+
+# ---------------------------------------------------------------------------
+# Saved runs
+# ---------------------------------------------------------------------------
+RUN_FORMAT = 1
+
+
+def _column(col: pd.Series) -> np.ndarray:
+    return col.cat.codes.to_numpy() if isinstance(col.dtype, pd.CategoricalDtype) else col.to_numpy()
+
+
+class SavedRun(NamedTuple):
+    meta:  dict
+    stats: pd.DataFrame
+    res:   Optional[pd.DataFrame]
+    state: Optional[StreamState]
+    horizons: Optional[pd.DataFrame] = None
+
+
+def save_run(path: str, meta: dict, stats: pd.DataFrame, res: Optional[pd.DataFrame] = None,
+             state: Optional[StreamState] = None, horizons: Optional[pd.DataFrame] = None):
+    """
+    Tally, per-window columns (when the run kept them), the horizon tally,
+    the StreamState to resume from and run metadata in one compressed .npz,
+    so runs can be reported, diffed or extended with --update without
+    rerunning. Categoricals are stored as their int8 codes.
+    """
+    arrays = {f'tally.{c}': _column(stats[c]) for c in stats.columns}
+    if res is not None:
+        arrays.update({f'res.{c}': _column(res[c]) for c in res.columns})
+    if horizons is not None:
+        arrays.update({f'horizon.{c}': horizons[c].to_numpy() for c in horizons.columns})
+    if state is not None:
+        arrays.update({f'state.{c}': state.tail[c].to_numpy() for c in state.tail.columns})
+        meta = dict(meta, state={'offset': state.offset, 'next_window': state.next_window,
+                                 'rows': state.rows, 'windows': state.windows,
+                                 'covered': state.covered})
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez_compressed(path, meta=np.array(json.dumps(dict(meta, format=RUN_FORMAT))), **arrays)
+
+
+def load_run(path: str) -> SavedRun:
+    """A save_run() file; res, state and horizons are None when the run did not keep them."""
+    with np.load(path, allow_pickle=False) as z:
+        meta  = json.loads(str(z['meta']))
+        parts = {'tally': {}, 'res': {}, 'state': {}, 'horizon': {}}
+        for key in z.files:
+            if key != 'meta':
+                part, col = key.split('.', 1)
+                parts[part][col] = z[key]
+    if meta.get('format') != RUN_FORMAT:
+        raise ValueError(f"{path}: run format {meta.get('format')}, expected {RUN_FORMAT}")
+    frames = []
+    for cols in (parts['tally'], parts['res']):
+        if 'market_regime' in cols:
+            cols['market_regime'] = pd.Categorical.from_codes(cols['market_regime'], REGIMES)
+        frames.append(pd.DataFrame(cols) if cols else None)
+    state = None
+    if 'state' in meta:
+        tail  = pd.DataFrame(parts['state'], columns=list(parts['state']) or OHLCV_COLUMNS)
+        state = StreamState(tail, **meta.pop('state'))
+    horizons = pd.DataFrame(parts['horizon']) if parts['horizon'] else None
+    return SavedRun(meta, frames[0], frames[1], state, horizons)
+
+
+def _describe(meta: dict) -> str:
+    return (f"{meta['symbol']} {meta['interval']}, {meta['windows']:,} windows, "
+            f"{meta['source']}, {meta['created']}")
+
+
+def diff_runs(old_path: str, new_path: str):
+    """Every report figure of two saved runs side by side."""
+    old_meta, old_stats = load_run(old_path)[:2]
+    new_meta, new_stats = load_run(new_path)[:2]
+    old, new = summarize(old_stats), summarize(new_stats)
+    print(f"{'='*80}")
+    print(f"  OLD {old_path}: {_describe(old_meta)}")
+    print(f"  NEW {new_path}: {_describe(new_meta)}")
+    print(f"{'='*80}")
+    print(f"  {'':30s} {'n':>15s}   {'dir %':>20s}   {'tgt %':>20s}")
+    section, nan = None, (0, float('nan'), float('nan'), 0)
+    for key in list(old) + [k for k in new if k not in old]:
+        if key[0] != section:
+            section = key[0]
+            print(f"  [{section}]")
+        (no, do, to, _), (nn, dn, tn, _) = old.get(key, nan), new.get(key, nan)
+        print(f"    {key[1]:28s} {no:>6} → {nn:<6}   {_change(do, dn)}   {_change(to, tn)}")
+
+
+def _change(a: float, b: float) -> str:
+    if np.isnan(a) and np.isnan(b):
+        return ''
+    fmt = lambda v: '    —' if np.isnan(v) else f"{v:5.1f}"
+    delta = '' if np.isnan(a) or np.isnan(b) else f" ({b - a:+5.1f})"
+    return f"{fmt(a)} → {fmt(b)}{delta}"
+
+
+def _skip_rows(frames: Iterator[pd.DataFrame], n: int) -> Iterator[pd.DataFrame]:
+    """Drop the first n rows of a frame stream (sources without open times)."""
+    for frame in frames:
+        if n >= len(frame):
+            n -= len(frame)
+            continue
+        yield frame.iloc[n:]
+        n = 0
 
 
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
-parser = argparse.ArgumentParser()
-parser.add_argument('--file',     help='Path to CSV or glob: "BTCUSDT-1h-*.csv"')
-parser.add_argument('--interval', default=None)
-parser.add_argument('--symbol',   default='BTC')
-parser.add_argument('--step',     type=int, default=1)
-args = parser.parse_args()
-
-tf_map = {'1m':'supershort','15m':'short','1h':'mid','4h':'long','1d':'ulong'}
-
-interval = args.interval
-if interval is None and args.file:
-    import re, glob as _glob
-    sample_file = sorted(_glob.glob(args.file))[0] if '*' in args.file else args.file
-    m = re.search(r'[-_](1m|3m|5m|15m|30m|1h|2h|4h|6h|8h|12h|1d|3d|1w)[-_.]',
-                  os.path.basename(sample_file), re.IGNORECASE)
-    interval = m.group(1).lower() if m else '1h'
-    print(f"  Auto-detected interval: {interval}")
-elif interval is None:
-    interval = '1h'
-
-tf = tf_map.get(interval, 'mid')
-fast_p, slow_p, mpu, la, _, limit = TIMEFRAME_CONFIG[tf]
-
-print("=" * 65)
-print(f"REAL DATA BACKTEST — {args.symbol} @ {interval} ({tf})")
-print(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-print("=" * 65)
-
-if args.file:
-    df = load_csv(args.file)
-else:
-    print(f"\nFetching {args.symbol}USDT {interval} ({limit} candles) from Binance…")
-    df = fetch_binance(args.symbol, interval, limit)
-
-print(f"\nRunning rolling-window backtest (step={args.step}, ATR-adaptive lookahead)…")
-t0 = time.time()
-orig, v1, v2 = backtest(df, fast_p, slow_p, mpu, la, interval, step=args.step)
-print(f"Completed in {time.time()-t0:.1f}s")
-
-report(orig, v1, v2, f"{args.symbol} {interval} — {len(orig):,} windows")
-
-print(f"\n✅ Done. Tested {len(orig):,} windows across all three algorithms.")
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--file',     help='Path to CSV or glob: "BTCUSDT-1h-*.csv"')
+    parser.add_argument('--db',       metavar='FILE',
+                        help='KlineStore filled by download_klines.py (uses --symbol/--interval)')
+    parser.add_argument('--interval', default=None)
+    parser.add_argument('--symbol',   default='BTC')
+    parser.add_argument('--step',     type=int, default=1)
+    parser.add_argument('--chunk',    type=int, default=0, metavar='ROWS',
+                        help='Stream the data in blocks of ROWS candles — flat memory, same results')
+    parser.add_argument('--ob',       metavar='FILE',
+                        help='Order-book snapshots from record_orderbook.py — score with real ob values')
+    parser.add_argument('--cache',    metavar='DIR',
+                        help='Reuse indicator columns across runs (memory-mapped from DIR)')
+    parser.add_argument('--save',     metavar='FILE',
+                        help='Save the run (.npz: tally, per-window columns, settings) for --diff')
+    parser.add_argument('--diff',     nargs=2, metavar=('OLD', 'NEW'),
+                        help='Compare two saved runs line by line instead of running a backtest')
+    parser.add_argument('--horizons', type=int, nargs='?', const=0, metavar='H',
+                        help='Also grade every signal 1..H candles after entry '
+                             '(default and maximum: 2 × the timeframe lookahead - 1)')
+    parser.add_argument('--bootstrap', type=int, default=0, metavar='N',
+                        help='95%% block-bootstrap intervals for dir/tgt from N resamples (e.g. 2000)')
+    parser.add_argument('--block',    type=int, default=0, metavar='WINDOWS',
+                        help='Bootstrap block length (default: max(2 × lookahead / step, n^(1/3)))')
+    parser.add_argument('--workers',  type=int, default=None,
+                        help='Processes for the bootstrap (default: all cores)')
+    parser.add_argument('--update',   metavar='RUN',
+                        help='Extend a saved run with the candles added to its source since '
+                             '(same settings; --file/--db point at the grown data, --save elsewhere)')
+    parser.add_argument('--profile',  action='store_true',
+                        help='Per-stage wall time / memory / rows-per-sec breakdown')
+    parser.add_argument('--profile-out', metavar='FILE',
+                        help='Also dump cProfile stats (open with snakeviz or flameprof)')
+    args = parser.parse_args()
+
+    if args.diff:
+        diff_runs(*args.diff)
+        return
+
+    run = load_run(args.update) if args.update else None
+    if run is not None:
+        if run.state is None:
+            parser.error(f"{args.update} has no resume state — save the full run again first")
+        m = run.meta
+        args.symbol, args.interval, args.step = m['symbol'], m['interval'], m['step']
+        args.ob    = args.ob or m['ob']
+        args.chunk = args.chunk or m['chunk'] or 50_000
+        if args.horizons is not None and run.horizons is None:
+            parser.error(f"{args.update} was saved without --horizons")
+        if run.horizons is not None:
+            args.horizons = len(run.horizons)
+        if args.bootstrap and run.res is None:
+            parser.error(f"--bootstrap needs per-window results; {args.update} was streamed")
+        args.save  = args.save or args.update
+        if not (args.file or args.db) and m['kind'] != 'binance':
+            setattr(args, 'db' if m['kind'] == 'db' else 'file', m['source'])
+
+    if args.profile:
+        PROFILER.enable()
+    cprof = cProfile.Profile() if args.profile_out else None
+    if cprof:
+        cprof.enable()
+
+    tf_map = {'1m':'supershort','15m':'short','1h':'mid','4h':'long','1d':'ulong'}
+
+    interval = args.interval
+    if interval is None and args.file:
+        import re, glob as _glob
+        sample_file = sorted(_glob.glob(args.file))[0] if '*' in args.file else args.file
+        m = re.search(r'[-_](1m|3m|5m|15m|30m|1h|2h|4h|6h|8h|12h|1d|3d|1w)[-_.]',
+                      os.path.basename(sample_file), re.IGNORECASE)
+        interval = m.group(1).lower() if m else '1h'
+        print(f"  Auto-detected interval: {interval}")
+    elif interval is None:
+        interval = '1h'
+
+    tf = tf_map.get(interval, 'mid')
+    fast_p, slow_p, mpu, la, _, limit = TIMEFRAME_CONFIG[tf]
+
+    print("=" * 65)
+    print(f"REAL DATA BACKTEST — {args.symbol} @ {interval} ({tf})")
+    print(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 65)
+
+    horizons = 0 if args.horizons is None else args.horizons or la * 2 - 1
+    if horizons > la * 2 - 1:
+        parser.error(f"--horizons: at most {la * 2 - 1} candles at {interval}")
+
+    cache = IndicatorCache(args.cache) if args.cache else None
+    keep  = stream_keep(fast_p, slow_p, interval)
+    if args.chunk:
+        after = run.state.last_open_time if run else None
+        if args.file:
+            frames = iter_csv(args.file, args.chunk, after)
+        elif args.db:
+            frames = iter_store(args.db, args.symbol, interval, args.chunk,
+                                0 if after is None else after + 1)
+        else:
+            print(f"\nFetching {args.symbol}USDT {interval} ({limit} candles) from Binance…")
+            df = fetch_binance(args.symbol, interval, limit)
+            frames = iter([df if after is None else df[df['open_time'] > after]])
+        if run is not None and after is None:             # CSV without open times: append-only
+            frames = _skip_rows(frames, run.state.rows)
+        ob_symbol, ob_records = None, None
+        if args.ob:
+            from orderbook import load_snapshots
+            ob_symbol, ob_records = load_snapshots(args.ob)
+
+        if run is not None:
+            print(f"\nUpdating {args.update} ({run.state.rows:,} rows, {run.state.windows:,} windows) "
+                  f"in blocks of {args.chunk:,} rows…")
+        else:
+            print(f"\nStreaming rolling-window backtest (blocks of {args.chunk:,} rows, "
+                  f"step={args.step}, ATR-adaptive lookahead)…")
+        t0 = time.time()
+        try:
+            stats, state, res, hz = backtest_stream(
+                frames, fast_p, slow_p, mpu, la, interval, step=args.step, ob_records=ob_records,
+                cache=cache, stats=run.stats if run else None, state=run.state if run else None,
+                keep_results=bool(args.bootstrap) or (run is not None and run.res is not None),
+                horizons=horizons, hz=run.horizons if run else None)
+        except ValueError as e:
+            print(f"\n❌ Cannot update {args.update}: {e}" if run is not None else f"\n❌ {e}")
+            if run is not None and run.meta['kind'] == 'binance':
+                print(f"   Only the latest {limit} candles are fetched; fill a KlineStore with "
+                      f"download_klines.py and pass --db instead.")
+            return
+        n_rows, n_windows, covered = state.rows, state.windows, state.covered
+        print(f"Completed in {time.time()-t0:.1f}s — {n_rows:,} rows")
+        if run is not None:
+            print(f"  +{n_rows - run.state.rows:,} rows, +{n_windows - run.state.windows:,} windows")
+            if run.res is not None:
+                res = run.res if res is None else pd.concat([run.res, res], ignore_index=True)
+        if ob_records is not None:
+            print(f"  Order book: {len(ob_records):,} {ob_symbol} snapshots cover {covered:,} "
+                  f"of {n_rows:,} candles ({covered / max(n_rows, 1) * 100:.1f}%)")
+    else:
+        with PROFILER.stage('csv_load') as st:
+            if args.file:
+                df = load_csv(args.file)
+            elif args.db:
+                df = load_store(args.db, args.symbol, interval)
+            else:
+                print(f"\nFetching {args.symbol}USDT {interval} ({limit} candles) from Binance…")
+                df = fetch_binance(args.symbol, interval, limit)
+            if PROFILER.enabled:
+                st.rows = len(df)
+
+        ob, covered = load_ob(args.ob, df, interval) if args.ob else (None, 0)
+
+        print(f"\nRunning rolling-window backtest (step={args.step}, ATR-adaptive lookahead)…")
+        t0 = time.time()
+        res = backtest(df, fast_p, slow_p, mpu, la, interval, step=args.step, ob=ob, cache=cache)
+        print(f"Completed in {time.time()-t0:.1f}s")
+        stats, n_rows, n_windows = tally(res), len(df), len(res)
+        state = StreamState.of(df, keep, range(60, len(df) - la * 2, args.step), n_windows, covered)
+        hz = None
+        if horizons:
+            with PROFILER.stage('horizons', rows=n_windows):
+                hz = horizon_tally(res, df, mpu, horizons)
+
+    if stats is None or stats.empty:
+        print("\nNot enough candles for a single window.")
+        return
+    with PROFILER.stage('report', rows=n_windows):
+        report(stats, f"{args.symbol} {interval} — {n_windows:,} windows", with_ob=bool(args.ob))
+        if hz is not None:
+            report_horizons(hz)
+    if args.bootstrap:
+        block = args.block or max(-(-la * 2 // args.step), round(n_windows ** (1 / 3)))
+        with PROFILER.stage('bootstrap', rows=n_windows * args.bootstrap):
+            ci = bootstrap_ci(res, args.bootstrap, block, args.workers)
+        report_ci(stats, ci, args.bootstrap, block)
+
+    print(f"\n✅ Done. Tested {n_windows:,} windows across all three algorithms.")
+
+    if args.save:
+        now  = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        meta = dict(run.meta, updated=now) if run is not None else {
+            'symbol': args.symbol, 'interval': interval, 'tf': tf, 'ob': args.ob,
+            'step': args.step, 'chunk': args.chunk,
+            'params': {'fast_p': fast_p, 'slow_p': slow_p, 'mpu': mpu, 'lookahead': la},
+            'created': now,
+        }
+        meta.update(source=args.file or args.db or 'binance',
+                    kind='csv' if args.file else 'db' if args.db else 'binance',
+                    rows=n_rows, windows=n_windows)
+        save_run(args.save, meta, stats, res, state, hz)
+        print(f"  Run saved to {args.save}" + ("" if res is not None else " (tally only — streamed)"))
+
+    if cprof:
+        cprof.disable()
+        cprof.dump_stats(args.profile_out)
+        print(f"  cProfile stats written to {args.profile_out}")
+    if PROFILER.enabled:
+        PROFILER.report()
+
+
+if __name__ == '__main__':
+    main()
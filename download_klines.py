@@ -0,0 +1,178 @@
+"""
+download_klines.py — page long Binance kline histories into a KlineStore.
+
+/klines returns at most 1000 candles per call, so a history is walked
+forward by startTime, one page at a time. Every (symbol, interval) pair is
+an independent job and --workers jobs run at once; all of them draw from one
+WeightLimiter, so the run stays inside the per-minute request-weight budget
+whatever the concurrency. 429/418 answers pause every worker for the
+Retry-After time, and network errors and 5xx are retried with backoff.
+
+Each page is written together with the job's cursor in one transaction
+(see KlineStore.save), so an interrupted run resumes from the last saved
+page. Re-running the same command later only fetches the candles that have
+closed since. --base-url points the downloader at a local mock of the API.
+
+Usage:
+  python download_klines.py BTC ETH SOL --interval 1h 4h --start 2021-01-01
+  python download_klines.py BTC --interval 1m --start 2024-01-01 --workers 8 --db klines.db
+  python backtest_real.py --db klines.db --symbol BTC --interval 1h
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import requests
+
+from klines import INTERVAL_MS, Kline, KlineStore, WeightLimiter, klines_weight, parse_rows
+
+BINANCE_API = "https://api.binance.com/api/v3"
+PAGE        = 1000
+RETRIES     = 5
+
+
+def parse_time(value: str) -> int:
+    """'2021-01-01', '2021-01-01 12:00' (UTC) or epoch milliseconds → ms."""
+    if value.isdigit():
+        return int(value)
+    for fmt in ('%Y-%m-%d', '%Y-%m-%d %H:%M'):
+        try:
+            dt = datetime.strptime(value, fmt).replace(tzinfo=timezone.utc)
+            return int(dt.timestamp() * 1000)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"not a date: {value!r}")
+
+
+def _fmt(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M')
+
+
+class Downloader:
+    """Shared state for one run: store, weight budget, HTTP sessions, counters."""
+
+    def __init__(self, store: KlineStore, weights: WeightLimiter, base_url: str = BINANCE_API):
+        self.store    = store
+        self.weights  = weights
+        self.base_url = base_url.rstrip('/')
+        self.stop     = threading.Event()
+        self.requests = 0
+        self.candles  = 0
+        self.waited   = 0.0
+        self._local   = threading.local()
+        self._lock    = threading.Lock()
+
+    def _session(self) -> requests.Session:
+        s = getattr(self._local, 'session', None)
+        if s is None:
+            s = self._local.session = requests.Session()
+        return s
+
+    def _page(self, symbol: str, interval: str, start_ms: int, end_ms: int) -> List[Kline]:
+        """One /klines page of up to PAGE candles opening in [start_ms, end_ms]."""
+        params = {'symbol': f"{symbol}USDT", 'interval': interval,
+                  'startTime': start_ms, 'endTime': end_ms, 'limit': PAGE}
+        for attempt in range(RETRIES):
+            waited = self.weights.acquire(klines_weight(PAGE))
+            with self._lock:
+                self.requests += 1
+                self.waited   += waited
+            try:
+                r = self._session().get(f"{self.base_url}/klines", params=params, timeout=20)
+            except requests.RequestException as e:
+                err = e
+            else:
+                self.weights.update(r.headers)
+                if r.status_code in (418, 429):
+                    self.weights.backoff(float(r.headers.get('Retry-After', 60)))
+                    err = requests.HTTPError(f"{r.status_code} from /klines")
+                    continue                    # the limiter holds this worker until the pause ends
+                if r.status_code < 500:
+                    r.raise_for_status()        # 400 = unknown symbol: not worth retrying
+                    return parse_rows(r.json())
+                err = requests.HTTPError(f"{r.status_code} from /klines")
+            if self.stop.is_set():
+                break
+            time.sleep(min(2 ** attempt, 30))
+        raise RuntimeError(f"{symbol} {interval}: giving up after {RETRIES} attempts ({err})")
+
+    def download(self, symbol: str, interval: str, start_ms: int,
+                 end_ms: Optional[int] = None) -> int:
+        """
+        Store every closed candle opening in [start_ms, end_ms); returns the
+        number written by this call. Resumes from the job's saved cursor.
+        """
+        step  = INTERVAL_MS[interval]
+        start = -(-start_ms // step) * step
+        now   = int(time.time() * 1000) // step * step   # open of the forming candle
+        end   = now if end_ms is None else min(end_ms, now)
+        nxt   = self.store.cursor(symbol, interval, start) or start
+        written = 0
+        while nxt < end and not self.stop.is_set():
+            rows = [r for r in self._page(symbol, interval, nxt, end - 1) if r[0] < end]
+            # A short page means endTime was reached; an empty one that nothing
+            # is listed in the rest of the range
+            nxt = rows[-1][0] + step if len(rows) == PAGE else end
+            self.store.save(symbol, interval, rows, cursor=(start, nxt))
+            written += len(rows)
+            with self._lock:
+                self.candles += len(rows)
+        return written
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('symbols', nargs='+', help='Base assets, e.g. BTC ETH (quoted in USDT)')
+    parser.add_argument('--interval', nargs='+', default=['1h'], choices=sorted(INTERVAL_MS),
+                        metavar='INTERVAL', help='One or more of 1m 5m 15m 1h 4h 1d …')
+    parser.add_argument('--start',    type=parse_time, required=True, help='UTC date or epoch ms')
+    parser.add_argument('--end',      type=parse_time, default=None, help='Exclusive; default now')
+    parser.add_argument('--db',       default='klines.db', help='KlineStore file (same as KLINES_DB)')
+    parser.add_argument('--workers',  type=int, default=4)
+    parser.add_argument('--weight-limit', type=int, default=3000,
+                        help='Request weight per minute for this run (Binance allows 6000 per IP)')
+    parser.add_argument('--base-url', default=BINANCE_API, help='API root, e.g. a local mock')
+    args = parser.parse_args()
+
+    symbols = [s.upper() for s in args.symbols]
+    jobs    = [(s, i) for s in symbols for i in args.interval]
+    store   = KlineStore(args.db)
+    dl      = Downloader(store, WeightLimiter(args.weight_limit), args.base_url)
+    end_txt = _fmt(args.end) if args.end else 'now'
+    print(f"Downloading {len(jobs)} series from {_fmt(args.start)} to {end_txt} "
+          f"with {args.workers} workers → {args.db}")
+
+    t0, failed = time.time(), 0
+    pool = ThreadPoolExecutor(max_workers=args.workers)
+    futures = {pool.submit(dl.download, s, i, args.start, args.end): (s, i) for s, i in jobs}
+    try:
+        for fut in as_completed(futures):
+            s, i = futures[fut]
+            try:
+                n = fut.result()
+            except Exception as e:
+                failed += 1
+                print(f"  {s} {i}: failed — {e}")
+                continue
+            print(f"  {s} {i}: +{n:,} candles ({time.time() - t0:.1f}s)")
+    except KeyboardInterrupt:
+        print("Interrupted — finishing the pages in flight; rerun to resume.")
+        dl.stop.set()
+        for f in futures:
+            f.cancel()
+    finally:
+        pool.shutdown(wait=True)
+        store.close()
+
+    elapsed = time.time() - t0
+    print(f"Done: {dl.candles:,} candles in {dl.requests:,} requests, {elapsed:.1f}s "
+          f"({dl.candles / max(elapsed, 1e-9):,.0f} candles/s, {dl.waited:.1f}s held by the rate limiter)"
+          + (f", {failed} failed" if failed else ""))
+
+
+if __name__ == '__main__':
+    main()
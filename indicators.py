@@ -0,0 +1,507 @@
+"""
+indicators.py — NumPy indicator kernels shared by the bot and the backtester.
+
+compute_series() makes one fused pass over contiguous float64 arrays and
+returns every series the scorers need. Intermediates are shared: the true
+range feeds both ATR and ADX, and each EMA period is computed once. The
+formulas follow the `ta` library (RSIIndicator, MACD, EMAIndicator,
+BollingerBands, ADXIndicator, AverageTrueRange) down to its warm-up
+conventions: leading NaNs for the ewm/rolling indicators, leading zeros for
+ATR/ADX/DI.
+
+compute_series_batch() is the same maths over a (symbols, candles) matrix,
+for scanning a whole market in one pass.
+
+rsi_divergence() is the bot's divergence rule for every bar at once, so the
+backtester scores the same signal the bot sends.
+
+Run `python indicators.py` to compare against `ta` on random data.
+"""
+
+import math
+from typing import Dict
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _span_alpha(span: float) -> float:
+    # pandas ewm(span=…) → centre of mass → alpha, reproduced for bit-level parity
+    return 1.0 / (1.0 + (span - 1) / 2)
+
+
+def _direct_alpha(alpha: float) -> float:
+    return 1.0 / (1.0 + (1 - alpha) / alpha)
+
+
+def _rolling(x: np.ndarray, window: int, fn: str) -> np.ndarray:
+    """Trailing rolling mean/std(ddof=0)/min with NaN warm-up, like pandas rolling()."""
+    out = np.full(len(x), np.nan)
+    if len(x) >= window:
+        view = sliding_window_view(x, window)
+        out[window - 1:] = getattr(view, fn)(axis=1)
+    return out
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """max(high, prev close) − min(low, prev close); high − low on the first bar."""
+    tr = high - low
+    prev = close[:-1]
+    tr[1:] = np.maximum(high[1:], prev) - np.minimum(low[1:], prev)
+    return tr
+
+
+def compute_series(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                   volume: np.ndarray, fast_p: int, slow_p: int,
+                   window: int = 14) -> Dict[str, np.ndarray]:
+    """
+    All indicator series for one OHLCV run. Keys:
+      rsi, macd_diff, ema_fast, ema_slow,
+      bb_upper, bb_middle, bb_lower, bb_wband, bb_pband,
+      atr, adx, adx_pos, adx_neg, vol_ma20, vol_ma100
+    Requires len(close) >= 2 * window for ADX.
+    """
+    high   = np.ascontiguousarray(high,   dtype=np.float64)
+    low    = np.ascontiguousarray(low,    dtype=np.float64)
+    close  = np.ascontiguousarray(close,  dtype=np.float64)
+    volume = np.ascontiguousarray(volume, dtype=np.float64)
+    n = len(close)
+    w = window
+    if n < 2 * w:
+        raise ValueError(f"need at least {2 * w} candles, got {n}")
+
+    # ── Vectorised inputs to the recurrences ──────────────────────────
+    diff = np.zeros(n)
+    diff[1:] = close[1:] - close[:-1]
+    up   = np.where(diff > 0, diff, 0.0)
+    down = np.where(diff < 0, -diff, 0.0)
+
+    tr = true_range(high, low, close)
+    up_move   = np.zeros(n); up_move[1:]   = high[1:] - high[:-1]
+    down_move = np.zeros(n); down_move[1:] = low[:-1] - low[1:]
+    plus_dm  = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+    minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+
+    # ── Fused recurrence pass ─────────────────────────────────────────
+    periods = sorted({fast_p, slow_p, 12, 26})
+    alphas  = [_span_alpha(p) for p in periods]
+    a_rsi   = _direct_alpha(1.0 / w)
+    a_sig   = _span_alpha(9)
+    k_fast, k_slow = periods.index(fast_p), periods.index(slow_p)
+    k12, k26       = periods.index(12), periods.index(26)
+
+    cl, upl, dnl = close.tolist(), up.tolist(), down.tolist()
+    trl, pdl, mdl = tr.tolist(), plus_dm.tolist(), minus_dm.tolist()
+
+    ema     = [[0.0] * n for _ in periods]
+    e_state = [cl[0]] * len(periods)
+    e_coef  = [(1.0 - a, a, (1.0 - a) + a) for a in alphas]
+    ema_up, ema_dn = [0.0] * n, [0.0] * n
+    r_om, r_den = 1.0 - a_rsi, (1.0 - a_rsi) + a_rsi
+    gu, gd = upl[0], dnl[0]
+    atr = [0.0] * n
+    atr_v = float(np.mean(tr[:w]))
+    s_tr  = float(np.sum(tr[1:w + 1]))
+    s_pdm = float(np.sum(plus_dm[1:w + 1]))
+    s_mdm = float(np.sum(minus_dm[1:w + 1]))
+    str_, spdm, smdm = [0.0] * n, [0.0] * n, [0.0] * n
+    str_[w], spdm[w], smdm[w] = s_tr, s_pdm, s_mdm
+    atr[w - 1] = atr_v
+    ema_up[0], ema_dn[0] = gu, gd
+    for k in range(len(periods)):
+        ema[k][0] = cl[0]
+
+    for t in range(1, n):
+        x = cl[t]
+        for k in range(len(periods)):
+            y = e_state[k]
+            if y != x:
+                om, a, den = e_coef[k]
+                y = (om * y + a * x) / den
+                e_state[k] = y
+            ema[k][t] = y
+        u = upl[t]
+        if gu != u:
+            gu = (r_om * gu + a_rsi * u) / r_den
+        d = dnl[t]
+        if gd != d:
+            gd = (r_om * gd + a_rsi * d) / r_den
+        ema_up[t], ema_dn[t] = gu, gd
+        if t >= w:
+            atr_v = (atr_v * (w - 1) + trl[t]) / float(w)
+            atr[t] = atr_v
+            if t > w:
+                s_tr  = s_tr  - (s_tr  / float(w)) + trl[t]
+                s_pdm = s_pdm - (s_pdm / float(w)) + pdl[t]
+                s_mdm = s_mdm - (s_mdm / float(w)) + mdl[t]
+                str_[t], spdm[t], smdm[t] = s_tr, s_pdm, s_mdm
+
+    ema_arr = [np.array(e) for e in ema]
+    for k, p in enumerate(periods):
+        ema_arr[k][:p - 1] = np.nan            # min_periods = span
+
+    # ── MACD (12/26/9) ────────────────────────────────────────────────
+    macd = ema_arr[k12] - ema_arr[k26]
+    signal = np.full(n, np.nan)
+    first = 25                                 # first valid MACD value
+    if n > first:
+        ml = macd.tolist()
+        s = ml[first]
+        sig = [s]
+        for x in ml[first + 1:]:
+            if s != x:
+                s = ((1.0 - a_sig) * s + a_sig * x) / ((1.0 - a_sig) + a_sig)
+            sig.append(s)
+        signal[first:] = sig
+        signal[first:first + 8] = np.nan
+    macd_diff = macd - signal
+
+    # ── RSI (Wilder, ewm alpha = 1/w) ─────────────────────────────────
+    eu, ed = np.array(ema_up), np.array(ema_dn)
+    eu[:w - 1] = np.nan
+    ed[:w - 1] = np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.where(ed == 0, 100.0, 100 - (100 / (1 + eu / ed)))
+
+    # ── ADX / DI from the shared true range ───────────────────────────
+    s_tr_a, s_p_a, s_m_a = np.array(str_), np.array(spdm), np.array(smdm)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        di_pos = np.where(s_tr_a != 0, 100 * (s_p_a / s_tr_a), 0.0)
+        di_neg = np.where(s_tr_a != 0, 100 * (s_m_a / s_tr_a), 0.0)
+        di_sum = di_pos + di_neg
+        dx = np.where(di_sum != 0, 100 * np.abs((di_pos - di_neg) / di_sum), 0.0)
+    dx[:w] = 0.0
+    adx = [0.0] * n
+    if n > 2 * w - 1:
+        a_v = float(dx[w:2 * w].mean())
+        adx[2 * w - 1] = a_v
+        dxl = dx.tolist()
+        for t in range(2 * w, n):
+            a_v = ((a_v * (w - 1)) + dxl[t]) / float(w)
+            adx[t] = a_v
+    adx_pos = di_pos.copy(); adx_pos[:w + 1] = 0.0
+    adx_neg = di_neg.copy(); adx_neg[:w + 1] = 0.0
+
+    # ── Bollinger (20, 2σ) and volume MAs ─────────────────────────────
+    mavg = _rolling(close, 20, 'mean')
+    mstd = _rolling(close, 20, 'std')
+    hband = mavg + 2 * mstd
+    lband = mavg - 2 * mstd
+    with np.errstate(divide='ignore', invalid='ignore'):
+        wband = ((hband - lband) / mavg) * 100
+        rng   = hband - lband
+        pband = (close - lband) / np.where(hband != lband, rng, np.nan)
+
+    return {
+        'rsi':       rsi,
+        'macd_diff': macd_diff,
+        'ema_fast':  ema_arr[k_fast],
+        'ema_slow':  ema_arr[k_slow],
+        'bb_upper':  hband,
+        'bb_middle': mavg,
+        'bb_lower':  lband,
+        'bb_wband':  wband,
+        'bb_pband':  pband,
+        'atr':       np.array(atr),
+        'adx':       np.array(adx),
+        'adx_pos':   adx_pos,
+        'adx_neg':   adx_neg,
+        'vol_ma20':  _rolling(volume, 20, 'mean'),
+        'vol_ma100': _rolling(volume, 100, 'mean'),
+    }
+
+
+def compute_series_batch(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                         volume: np.ndarray, fast_p: int, slow_p: int,
+                         window: int = 14) -> Dict[str, np.ndarray]:
+    """
+    compute_series() for many symbols at once: inputs are (symbols, candles)
+    arrays of equal length, outputs the same keys as (symbols, candles)
+    arrays. The recurrences step through time once with every symbol in a
+    vector, so the per-candle Python cost is shared by the whole batch. Each
+    row is bit-identical to compute_series() on that row.
+    """
+    high   = np.ascontiguousarray(high,   dtype=np.float64)
+    low    = np.ascontiguousarray(low,    dtype=np.float64)
+    close  = np.ascontiguousarray(close,  dtype=np.float64)
+    volume = np.ascontiguousarray(volume, dtype=np.float64)
+    s, n = close.shape
+    w = window
+    if n < 2 * w:
+        raise ValueError(f"need at least {2 * w} candles, got {n}")
+
+    diff = np.zeros((s, n))
+    diff[:, 1:] = close[:, 1:] - close[:, :-1]
+    up   = np.where(diff > 0, diff, 0.0)
+    down = np.where(diff < 0, -diff, 0.0)
+
+    tr = high - low
+    tr[:, 1:] = np.maximum(high[:, 1:], close[:, :-1]) - np.minimum(low[:, 1:], close[:, :-1])
+    up_move   = np.zeros((s, n)); up_move[:, 1:]   = high[:, 1:] - high[:, :-1]
+    down_move = np.zeros((s, n)); down_move[:, 1:] = low[:, :-1] - low[:, 1:]
+    plus_dm  = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+    minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+
+    def ewm(x: np.ndarray, a: float, start: int = 0) -> np.ndarray:
+        # adjust=False recurrence; an unchanged input keeps the state, as in compute_series
+        out = np.empty_like(x)
+        y = out[:, start] = x[:, start]
+        om, den = 1.0 - a, (1.0 - a) + a
+        for t in range(start + 1, x.shape[1]):
+            xt = x[:, t]
+            y = out[:, t] = np.where(y != xt, (om * y + a * xt) / den, y)
+        return out
+
+    def wilder_sum(x: np.ndarray) -> np.ndarray:
+        out = np.zeros((s, n))
+        v = out[:, w] = x[:, 1:w + 1].sum(axis=1)
+        for t in range(w + 1, n):
+            v = out[:, t] = v - (v / float(w)) + x[:, t]
+        return out
+
+    ema = {p: ewm(close, _span_alpha(p)) for p in {fast_p, slow_p, 12, 26}}
+    for p, e in ema.items():
+        e[:, :p - 1] = np.nan
+
+    # ── MACD (12/26/9) ────────────────────────────────────────────────
+    macd   = ema[12] - ema[26]
+    signal = np.full((s, n), np.nan)
+    first  = 25
+    if n > first:
+        signal[:, first:] = ewm(macd[:, first:], _span_alpha(9))
+        signal[:, first:first + 8] = np.nan
+    macd_diff = macd - signal
+
+    # ── RSI ───────────────────────────────────────────────────────────
+    a_rsi = _direct_alpha(1.0 / w)
+    eu, ed = ewm(up, a_rsi), ewm(down, a_rsi)
+    eu[:, :w - 1] = np.nan
+    ed[:, :w - 1] = np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.where(ed == 0, 100.0, 100 - (100 / (1 + eu / ed)))
+
+    # ── ATR ───────────────────────────────────────────────────────────
+    atr = np.zeros((s, n))
+    v = atr[:, w - 1] = tr[:, :w].mean(axis=1)
+    for t in range(w, n):
+        v = atr[:, t] = (v * (w - 1) + tr[:, t]) / float(w)
+
+    # ── ADX / DI ──────────────────────────────────────────────────────
+    s_tr, s_p, s_m = wilder_sum(tr), wilder_sum(plus_dm), wilder_sum(minus_dm)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        di_pos = np.where(s_tr != 0, 100 * (s_p / s_tr), 0.0)
+        di_neg = np.where(s_tr != 0, 100 * (s_m / s_tr), 0.0)
+        di_sum = di_pos + di_neg
+        dx = np.where(di_sum != 0, 100 * np.abs((di_pos - di_neg) / di_sum), 0.0)
+    dx[:, :w] = 0.0
+    adx = np.zeros((s, n))
+    if n > 2 * w - 1:
+        v = adx[:, 2 * w - 1] = dx[:, w:2 * w].mean(axis=1)
+        for t in range(2 * w, n):
+            v = adx[:, t] = ((v * (w - 1)) + dx[:, t]) / float(w)
+    di_pos[:, :w + 1] = 0.0
+    di_neg[:, :w + 1] = 0.0
+
+    # ── Bollinger (20, 2σ) and volume MAs ─────────────────────────────
+    def rolling(x: np.ndarray, win: int, fn: str) -> np.ndarray:
+        out = np.full((s, n), np.nan)
+        if n >= win:
+            out[:, win - 1:] = getattr(sliding_window_view(x, win, axis=1), fn)(axis=-1)
+        return out
+
+    mavg  = rolling(close, 20, 'mean')
+    mstd  = rolling(close, 20, 'std')
+    hband = mavg + 2 * mstd
+    lband = mavg - 2 * mstd
+    with np.errstate(divide='ignore', invalid='ignore'):
+        wband = ((hband - lband) / mavg) * 100
+        pband = (close - lband) / np.where(hband != lband, hband - lband, np.nan)
+
+    return {
+        'rsi':       rsi,
+        'macd_diff': macd_diff,
+        'ema_fast':  ema[fast_p],
+        'ema_slow':  ema[slow_p],
+        'bb_upper':  hband,
+        'bb_middle': mavg,
+        'bb_lower':  lband,
+        'bb_wband':  wband,
+        'bb_pband':  pband,
+        'atr':       atr,
+        'adx':       adx,
+        'adx_pos':   di_pos,
+        'adx_neg':   di_neg,
+        'vol_ma20':  rolling(volume, 20, 'mean'),
+        'vol_ma100': rolling(volume, 100, 'mean'),
+    }
+
+
+def warmup_bars(fast_p: int, slow_p: int, window: int = 14) -> int:
+    """
+    History compute_series needs before a bar for that bar to come out
+    bit-identical whether the run started at the first candle or mid-stream.
+    The start-up error of each recurrence decays by (1 - alpha) per bar, so
+    after log(2^-53)/log(1 - alpha) bars it is below float64 resolution and
+    the two runs round to the same values from then on. Chained recurrences
+    (MACD signal after EMA26, ADX after the smoothed DI sums) add up.
+    """
+    def decay(alpha: float) -> int:
+        return math.ceil(-53 * math.log(2) / math.log1p(-alpha))
+    ema   = max(decay(_span_alpha(p)) for p in {fast_p, slow_p, 12, 26}) + decay(_span_alpha(9))
+    wilds = 2 * decay(1.0 / window) + 2 * window
+    return max(ema, wilds, 100)
+
+
+def rolling_min(x: np.ndarray, window: int) -> np.ndarray:
+    return _rolling(np.asarray(x, dtype=np.float64), window, 'min')
+
+
+def rsi_divergence(close: np.ndarray, rsi: np.ndarray, window: int = 10,
+                   gap: float = 10.0, min_valid: int = 5) -> np.ndarray:
+    """
+    Per-bar RSI divergence (int8), each bar scored exactly as the live
+    detector scores the last bar of its window: +1 when price is within 1%
+    of its `window`-bar low and RSI is more than `gap` above the RSI at that
+    low, else -1 for the mirror case at the high, else 0. Fewer than
+    `min_valid` non-NaN RSI values in the window also give 0.
+
+    The bar of the low/high is a rolling argmin/argmax, first occurrence on
+    ties like ndarray.argmin(). The leading bars are padded with ±inf, so
+    they see the shorter window the live code sees on a short series.
+    """
+    c = np.asarray(close, dtype=np.float64)     # live compares Python floats
+    r = np.asarray(rsi, dtype=np.float64)
+    n = len(c)
+    out = np.zeros(n, dtype=np.int8)
+    if n == 0:
+        return out
+    pad  = window - 1
+    base = np.arange(n) - pad                   # original index of each window's first slot
+    at_min = base + sliding_window_view(np.concatenate((np.full(pad,  np.inf), c)), window).argmin(axis=1)
+    at_max = base + sliding_window_view(np.concatenate((np.full(pad, -np.inf), c)), window).argmax(axis=1)
+
+    seen  = np.concatenate(([0], np.cumsum(~np.isnan(r))))
+    valid = seen[1:] - seen[np.maximum(np.arange(1, n + 1) - window, 0)] >= min_valid
+
+    with np.errstate(invalid='ignore'):
+        bull = (c <= c[at_min] * 1.01) & (r > r[at_min] + gap)
+        bear = (c >= c[at_max] * 0.99) & (r < r[at_max] - gap)
+    out[bear & valid] = -1
+    out[bull & valid] = 1                       # bullish is checked first
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Validation against `ta`
+# ---------------------------------------------------------------------------
+def _validate(n: int = 3000, seed: int = 7, tol: float = 1e-8) -> bool:
+    import pandas as pd
+    from ta.momentum import RSIIndicator
+    from ta.trend import MACD, EMAIndicator, ADXIndicator
+    from ta.volatility import BollingerBands, AverageTrueRange
+
+    rng = np.random.default_rng(seed)
+    ok = True
+    for fast_p, slow_p in [(5, 12), (9, 21), (20, 50), (50, 200)]:
+        c = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+        c[100:110] = c[99]                                  # flat stretch
+        h = c * (1 + np.abs(rng.normal(0, 0.004, n)))
+        l = c * (1 - np.abs(rng.normal(0, 0.004, n)))
+        v = rng.uniform(10, 1000, n)
+        got = compute_series(h, l, c, v, fast_p, slow_p)
+        batch = compute_series_batch(h[None], l[None], c[None], v[None], fast_p, slow_p)
+        same = all(np.array_equal(got[k], batch[k][0], equal_nan=True) for k in got)
+        ok &= same
+        print(f"  EMA({fast_p:>2}/{slow_p:<3}) batch row == single: {'ok' if same else 'MISMATCH'}")
+
+        cs, hs, ls, vs = pd.Series(c), pd.Series(h), pd.Series(l), pd.Series(v)
+        bb  = BollingerBands(close=cs, window=20, window_dev=2)
+        adx = ADXIndicator(high=hs, low=ls, close=cs, window=14)
+        ref = {
+            'rsi':       RSIIndicator(close=cs, window=14).rsi(),
+            'macd_diff': MACD(close=cs).macd_diff(),
+            'ema_fast':  EMAIndicator(close=cs, window=fast_p).ema_indicator(),
+            'ema_slow':  EMAIndicator(close=cs, window=slow_p).ema_indicator(),
+            'bb_upper':  bb.bollinger_hband(),
+            'bb_middle': bb.bollinger_mavg(),
+            'bb_lower':  bb.bollinger_lband(),
+            'bb_wband':  bb.bollinger_wband(),
+            'bb_pband':  bb.bollinger_pband(),
+            'atr':       AverageTrueRange(high=hs, low=ls, close=cs, window=14).average_true_range(),
+            'adx':       adx.adx(),
+            'adx_pos':   adx.adx_pos(),
+            'adx_neg':   adx.adx_neg(),
+            'vol_ma20':  vs.rolling(20).mean(),
+            'vol_ma100': vs.rolling(100).mean(),
+        }
+        for key, r in ref.items():
+            r, g = r.to_numpy(dtype=float), got[key]
+            same_nan = np.array_equal(np.isnan(r), np.isnan(g))
+            err = np.nanmax(np.abs(r - g) / np.maximum(1.0, np.abs(r)))
+            status = 'ok' if same_nan and err <= tol else 'MISMATCH'
+            ok &= status == 'ok'
+            print(f"  EMA({fast_p:>2}/{slow_p:<3}) {key:10s} max rel err {err:.2e}  {status}")
+
+        warm = warmup_bars(fast_p, slow_p)
+        m    = 3 * warm
+        c2   = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, m)))
+        h2, l2, v2 = c2 * 1.003, c2 * 0.997, rng.uniform(10, 1000, m)
+        full = compute_series(h2, l2, c2, v2, fast_p, slow_p)
+        part = compute_series(h2[warm:], l2[warm:], c2[warm:], v2[warm:], fast_p, slow_p)
+        same = all(np.array_equal(full[k][2 * warm:], part[k][warm:]) for k in full)
+        ok &= same
+        print(f"  EMA({fast_p:>2}/{slow_p:<3}) started {warm:,} bars early == full run: "
+              f"{'ok' if same else 'MISMATCH'}")
+
+    ok &= _validate_divergence(rng)
+    return ok
+
+
+def _divergence_at(closes, rsi_series, n: int = 10) -> int:
+    """Reference: the live CryptoAnalyzer rule as it was written, one bar at a time."""
+    price_w = closes[-n:]
+    rsi_w   = rsi_series[-n:]
+    if np.count_nonzero(~np.isnan(rsi_w)) < 5:
+        return 0
+    current_price = float(closes[-1])
+    current_rsi   = float(rsi_series[-1])
+    price_min   = float(price_w.min())
+    rsi_at_pmin = float(rsi_w[int(price_w.argmin())])
+    if current_price <= price_min * 1.01 and current_rsi > rsi_at_pmin + 10:
+        return 1
+    price_max   = float(price_w.max())
+    rsi_at_pmax = float(rsi_w[int(price_w.argmax())])
+    if current_price >= price_max * 0.99 and current_rsi < rsi_at_pmax - 10:
+        return -1
+    return 0
+
+
+def _validate_divergence(rng, trials: int = 40, big: int = 500_000) -> bool:
+    import time
+    ok, bars, hits = True, 0, 0
+    for t in range(trials):
+        n = int(rng.integers(30, 400))
+        c = 100 * np.exp(np.cumsum(rng.normal(0, 0.006, n)))
+        if t % 3 == 0:
+            c = np.round(c, 0)                              # lots of tied lows/highs
+        if t % 4 == 1:
+            c = c.astype(np.float32)                        # KLINES_FLOAT32 candles
+        rsi = compute_series(c, c, c, np.ones(n), 5, 12)['rsi']
+        got = rsi_divergence(c, rsi)
+        ref = np.array([_divergence_at(c[:i + 1], rsi[:i + 1]) for i in range(n)])
+        ok &= np.array_equal(got, ref)
+        bars += n
+        hits += np.count_nonzero(ref)
+    print(f"  rsi_divergence == live rule on {bars:,} bars ({hits:,} signals): {'ok' if ok else 'MISMATCH'}")
+
+    c   = 100 * np.exp(np.cumsum(rng.normal(0, 0.006, big)))
+    rsi = compute_series(c, c, c, np.ones(big), 5, 12)['rsi']
+    t0  = time.perf_counter()
+    rsi_divergence(c, rsi)
+    print(f"  rsi_divergence on {big:,} bars: {(time.perf_counter() - t0) * 1000:.0f} ms")
+    return ok
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(0 if _validate() else 1)
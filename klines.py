@@ -0,0 +1,281 @@
+"""
+klines.py — on-disk store of closed Binance candles, shared by the bot and tools.
+
+Rows are (open_time_ms, open, high, low, close, volume). Only closed candles
+are ever written, so a stored row never changes and a restart only needs to
+top up the candles that closed since the last write.
+
+to_array() packs rows into a structured NumPy array (48 bytes per candle, 28
+with float32) that the indicator kernels read column by column. numpy is
+imported inside it so that importing this module stays cheap.
+
+KlineCache is the short-lived counterpart: decoded arrays, forming candle
+included, shared between processes for the length of the in-memory TTL.
+
+WeightLimiter keeps REST traffic inside Binance's per-minute request-weight
+budget when many symbols are fetched at once.
+
+download_klines.py fills a KlineStore with long histories; its progress is
+kept next to the candles (download_cursor) so an interrupted run resumes.
+"""
+
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+INTERVAL_MS = {
+    '1m': 60_000, '3m': 180_000, '5m': 300_000, '15m': 900_000, '30m': 1_800_000,
+    '1h': 3_600_000, '2h': 7_200_000, '4h': 14_400_000, '6h': 21_600_000,
+    '8h': 28_800_000, '12h': 43_200_000, '1d': 86_400_000, '3d': 259_200_000,
+    '1w': 604_800_000,
+}
+
+Kline = Tuple[int, float, float, float, float, float]
+KLINE_FIELDS = ('open_time', 'open', 'high', 'low', 'close', 'volume')
+
+
+def parse_rows(payload: Sequence[Sequence]) -> List[Kline]:
+    """Binance /klines JSON (list of 12-field lists) → compact OHLCV tuples."""
+    return [(int(k[0]), float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5]))
+            for k in payload]
+
+
+def kline_dtype(float32: bool = False):
+    """Structured dtype for one candle: int64 open time + five price/volume floats."""
+    import numpy as np
+    f = '<f4' if float32 else '<f8'
+    return np.dtype([('open_time', '<i8')] + [(name, f) for name in KLINE_FIELDS[1:]])
+
+
+def to_array(rows: Sequence[Kline], float32: bool = False):
+    """OHLCV tuples (from parse_rows or KlineStore.load) → structured array, oldest first."""
+    import numpy as np
+    return np.array(rows, dtype=kline_dtype(float32))
+
+
+def decode_klines(payload: Sequence[Sequence], float32: bool = False):
+    """Binance /klines JSON straight to a structured array; the 6 unused fields are dropped."""
+    return to_array(parse_rows(payload), float32)
+
+
+def closed_only(rows: List[Kline], interval: str, now_ms: Optional[int] = None) -> List[Kline]:
+    step = INTERVAL_MS[interval]
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    return [r for r in rows if r[0] + step <= now_ms]
+
+
+class KlineStore:
+    """SQLite-backed closed-candle store keyed by (symbol, interval, open_time)."""
+
+    def __init__(self, path: str):
+        self.path  = path
+        self._lock = threading.Lock()
+        self._db   = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS klines ("
+            " symbol TEXT, interval TEXT, open_time INTEGER,"
+            " open REAL, high REAL, low REAL, close REAL, volume REAL,"
+            " PRIMARY KEY (symbol, interval, open_time)) WITHOUT ROWID")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS download_cursor ("
+            " symbol TEXT, interval TEXT, start INTEGER, next INTEGER,"
+            " PRIMARY KEY (symbol, interval, start)) WITHOUT ROWID")
+        self._db.commit()
+
+    def load(self, symbol: str, interval: str, limit: int) -> List[Kline]:
+        """Latest `limit` stored candles, oldest first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT open_time, open, high, low, close, volume FROM klines"
+                " WHERE symbol = ? AND interval = ? ORDER BY open_time DESC LIMIT ?",
+                (symbol, interval, limit)).fetchall()
+        rows.reverse()
+        return rows
+
+    def load_range(self, symbol: str, interval: str, start_ms: int = 0,
+                   end_ms: Optional[int] = None, limit: Optional[int] = None) -> List[Kline]:
+        """Stored candles with start_ms <= open_time < end_ms (first `limit` of them), oldest first."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT open_time, open, high, low, close, volume FROM klines"
+                " WHERE symbol = ? AND interval = ? AND open_time >= ? AND open_time < ?"
+                " ORDER BY open_time LIMIT ?",
+                (symbol, interval, start_ms, 2 ** 63 - 1 if end_ms is None else end_ms,
+                 -1 if limit is None else limit)).fetchall()
+
+    def save(self, symbol: str, interval: str, rows: List[Kline],
+             cursor: Optional[Tuple[int, int]] = None):
+        """
+        Insert closed candles. `cursor` = (start, next) records download
+        progress for the run that began at `start` in the same transaction,
+        so a crash never leaves the cursor ahead of the data.
+        """
+        if not rows and cursor is None:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO klines VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(symbol, interval) + tuple(r) for r in rows])
+            if cursor is not None:
+                self._db.execute("INSERT OR REPLACE INTO download_cursor VALUES (?, ?, ?, ?)",
+                                 (symbol, interval) + tuple(cursor))
+            self._db.commit()
+
+    def cursor(self, symbol: str, interval: str, start: int) -> Optional[int]:
+        """Where the download that began at `start` left off, or None if never started."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT next FROM download_cursor WHERE symbol = ? AND interval = ? AND start = ?",
+                (symbol, interval, start)).fetchone()
+        return row[0] if row else None
+
+    def last_open_time(self, symbol: str, interval: str) -> Optional[int]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MAX(open_time) FROM klines WHERE symbol = ? AND interval = ?",
+                (symbol, interval)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def missing_candles(stored: List[Kline], interval: str, limit: int,
+                    now_ms: Optional[int] = None) -> Optional[int]:
+    """
+    How many candles (including the one still forming) must be fetched to
+    extend `stored` up to now, or None when a full `limit` fetch is needed:
+    too little history, a gap inside the stored run, or a gap to now that is
+    at least `limit` candles long.
+    """
+    if len(stored) < limit:
+        return None
+    step = INTERVAL_MS[interval]
+    if stored[-1][0] - stored[0][0] != (len(stored) - 1) * step:
+        return None
+    now_ms  = int(time.time() * 1000) if now_ms is None else now_ms
+    current = now_ms // step * step
+    missing = (current - stored[-1][0]) // step
+    return missing if 0 < missing < limit else None
+
+
+class KlineCache:
+    """
+    Cross-process TTL cache of decoded kline arrays (SQLite, WAL). Webhook
+    workers share one file so a symbol/interval is fetched once per TTL for
+    all of them instead of once per process. Unlike KlineStore it also holds
+    the candle that is still forming, so entries expire.
+    """
+
+    def __init__(self, path: str):
+        self.path  = path
+        self._lock = threading.Lock()
+        self._db   = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS kline_cache ("
+            " symbol TEXT, interval TEXT, lim INTEGER, float32 INTEGER,"
+            " ts REAL, data BLOB,"
+            " PRIMARY KEY (symbol, interval, lim, float32)) WITHOUT ROWID")
+        self._db.commit()
+
+    def get(self, symbol: str, interval: str, limit: int, ttl: float,
+            float32: bool = False):
+        """(array, stored_at) if an entry younger than `ttl` seconds exists, else None."""
+        import numpy as np
+        with self._lock:
+            row = self._db.execute(
+                "SELECT ts, data FROM kline_cache"
+                " WHERE symbol = ? AND interval = ? AND lim = ? AND float32 = ?",
+                (symbol, interval, limit, int(float32))).fetchone()
+        if row is None or time.time() - row[0] >= ttl:
+            return None
+        return np.frombuffer(row[1], dtype=kline_dtype(float32)), row[0]
+
+    def put(self, symbol: str, interval: str, limit: int, arr, stored_at: Optional[float] = None):
+        float32 = arr.dtype['close'].itemsize == 4
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO kline_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (symbol, interval, limit, int(float32),
+                 time.time() if stored_at is None else stored_at, arr.tobytes()))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def klines_weight(limit: int) -> int:
+    """Binance request weight of one /klines call for `limit` candles."""
+    return 1 if limit < 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+
+
+def depth_weight(limit: int) -> int:
+    """Binance request weight of one /depth call for `limit` levels per side."""
+    return 5 if limit <= 100 else 25 if limit <= 500 else 50
+
+
+class WeightLimiter:
+    """
+    Client-side budget for Binance's per-IP request weight, counted in fixed
+    one-minute windows like the server does. `limit` caps the whole IP;
+    `share` (default: all of it) caps what this process reserves itself, so
+    processes on one IP cannot starve each other. acquire() blocks until the
+    weight fits both; update() adopts the server's X-MBX-USED-WEIGHT-1M count
+    when it is higher — that count is IP-wide, so it only weighs against
+    `limit` — and backoff() pauses all callers after a 429/418.
+    """
+
+    def __init__(self, limit: int = 5000, window: float = 60.0, share: Optional[int] = None):
+        self.limit   = limit
+        self.share   = limit if share is None else min(share, limit)
+        self.window  = window
+        self._lock   = threading.Lock()
+        self._win    = -1
+        self._used   = 0                 # whole IP, as far as we know
+        self._own    = 0                 # reserved by this process
+        self._paused = 0.0
+
+    def _roll(self, now: float):
+        win = int(now // self.window)
+        if win != self._win:
+            self._win, self._used, self._own = win, 0, 0
+
+    def acquire(self, weight: int, timeout: float = 120.0) -> float:
+        """Reserve `weight`; returns seconds spent waiting. TimeoutError past `timeout`."""
+        t0 = time.time()
+        while True:
+            with self._lock:
+                now = time.time()
+                self._roll(now)
+                if (now >= self._paused and self._own + weight <= self.share
+                        and self._used + weight <= self.limit):
+                    self._own  += weight
+                    self._used += weight
+                    return now - t0
+                wait = (self._paused if now < self._paused
+                        else (self._win + 1) * self.window) - now
+            if weight > self.share or now - t0 + wait > timeout:
+                raise TimeoutError(f"request weight {weight} not available within {timeout:g}s")
+            time.sleep(wait)
+
+    def update(self, headers) -> None:
+        used = headers.get('X-MBX-USED-WEIGHT-1M') if headers else None
+        if used is None:
+            return
+        with self._lock:
+            self._roll(time.time())
+            self._used = max(self._used, int(used))
+
+    def backoff(self, seconds: float) -> None:
+        with self._lock:
+            self._paused = max(self._paused, time.time() + seconds)
+
+    def used(self) -> int:
+        with self._lock:
+            self._roll(time.time())
+            return self._used
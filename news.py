@@ -1,8 +1,27 @@
+import time
+_IMPORT_T0 = time.perf_counter()
+
 import os
+import sys
 import logging
+import math
 import re
+import heapq
+import signal
+import json
+import sqlite3
+import tracemalloc
 import asyncio
-import time
+import threading
+import importlib.util
+import multiprocessing
+from multiprocessing import shared_memory
+from collections import deque, OrderedDict
+from contextlib import contextmanager, asynccontextmanager
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import (
@@ -10,20 +29,53 @@ from telegram.ext import (
     CallbackQueryHandler, filters, ContextTypes
 )
 from telegram.request import HTTPXRequest
+from telegram.error import BadRequest, Forbidden, RetryAfter
 import requests
 from typing import Dict, List, Optional, Tuple
 
+from klines import (KlineStore, KlineCache, parse_rows, closed_only, missing_candles,
+                    to_array, kline_dtype, klines_weight, depth_weight, WeightLimiter,
+                    INTERVAL_MS)
+
 # --- Optional heavy dependencies (graceful fallback if missing) ---
-try:
-    import pandas as pd
-    import numpy as np
-    from ta.momentum import RSIIndicator
-    from ta.trend import MACD, EMAIndicator, ADXIndicator
-    from ta.volatility import BollingerBands, AverageTrueRange
-    TA_AVAILABLE = True
-except ImportError:
-    TA_AVAILABLE = False
-    print("⚠️  ta/pandas/numpy not installed — real TA disabled. Run: pip install ta pandas numpy")
+# numpy takes most of the import time, so it is only located here and
+# imported by load_ta() — on first use, or by preload_ta() in the background.
+TA_AVAILABLE = importlib.util.find_spec('numpy') is not None
+if not TA_AVAILABLE:
+    print("⚠️  numpy not installed — real TA disabled. Run: pip install numpy")
+np = None
+compute_series = compute_series_batch = rsi_divergence = None
+_TA_LOADED = False
+_TA_LOCK   = threading.Lock()
+
+
+def load_ta() -> bool:
+    """Import the TA stack once (thread-safe); returns TA_AVAILABLE."""
+    global np, compute_series, compute_series_batch, rsi_divergence, TA_AVAILABLE, _TA_LOADED
+    if _TA_LOADED or not TA_AVAILABLE:
+        return TA_AVAILABLE
+    with _TA_LOCK:
+        if _TA_LOADED:
+            return TA_AVAILABLE
+        try:
+            import numpy as np
+            from indicators import compute_series, compute_series_batch, rsi_divergence
+        except ImportError as e:
+            TA_AVAILABLE = False
+            print(f"⚠️  TA import failed ({e}) — real TA disabled.")
+        _TA_LOADED = True
+    return TA_AVAILABLE
+
+
+def preload_ta() -> threading.Thread:
+    """Import the TA stack on a daemon thread so startup does not wait for it."""
+    def _run():
+        t0 = time.perf_counter()
+        load_ta()
+        logger.info(f"TA engine loaded in {time.perf_counter() - t0:.2f}s")
+    th = threading.Thread(target=_run, name='ta-preload', daemon=True)
+    th.start()
+    return th
 
 # Load .env
 try:
@@ -42,6 +94,395 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# ===========================================================================
+# Latency statistics
+# ===========================================================================
+class LatencyStats:
+    """Rolling window of recent latency samples (seconds). Thread-safe."""
+
+    def __init__(self, maxlen: int = 200):
+        self._samples: deque = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Nearest-rank percentile (q in 0–100) of the window, or None if empty."""
+        with self._lock:
+            data = sorted(self._samples)
+        if not data:
+            return None
+        rank = math.ceil(q / 100 * len(data))
+        return data[min(len(data) - 1, max(0, rank - 1))]
+
+
+# ===========================================================================
+# Metrics — per-stage latency histograms + counters (/perf, Prometheus)
+# ===========================================================================
+class Metrics:
+    """
+    Timing spans are recorded per (stage, labels) into a cumulative histogram
+    (for Prometheus) and a rolling sample window (for p50/p95/p99 in /perf).
+    Counters track cache hits/misses and HTTP errors; gauges hold current
+    levels such as the admission queue depth. Thread-safe.
+    """
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (stage, labels) -> [bucket_counts, sum, count, LatencyStats]
+        self._hist: Dict[Tuple, list] = {}
+        # (name, labels) -> value
+        self._counters: Dict[Tuple, float] = {}
+        self._gauges:   Dict[Tuple, float] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict) -> Tuple:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, stage: str, seconds: float, **labels):
+        key = self._key(stage, labels)
+        with self._lock:
+            h = self._hist.get(key)
+            if h is None:
+                h = self._hist[key] = [[0] * len(self.BUCKETS), 0.0, 0, LatencyStats(1024)]
+            for i, le in enumerate(self.BUCKETS):
+                if seconds <= le:
+                    h[0][i] += 1
+            h[1] += seconds
+            h[2] += 1
+        h[3].add(seconds)
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0, **labels)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def summary(self) -> List[Tuple[str, Dict, int, Optional[float], Optional[float], Optional[float]]]:
+        """(stage, labels, count, p50, p95, p99) sorted by p95 descending."""
+        with self._lock:
+            items = list(self._hist.items())
+        rows = [(stage, dict(labels), h[2],
+                 h[3].percentile(50), h[3].percentile(95), h[3].percentile(99))
+                for (stage, labels), h in items]
+        return sorted(rows, key=lambda r: -(r[4] or 0))
+
+    def counters(self) -> List[Tuple[str, Dict, float]]:
+        with self._lock:
+            return [(name, dict(labels), v) for (name, labels), v in sorted(self._counters.items())]
+
+    def gauges(self) -> List[Tuple[str, Dict, float]]:
+        with self._lock:
+            return [(name, dict(labels), v) for (name, labels), v in sorted(self._gauges.items())]
+
+    @staticmethod
+    def _fmt_labels(labels) -> str:
+        parts = [f'{k}="{v}"' for k, v in labels]
+        return '{' + ','.join(parts) + '}' if parts else ''
+
+    def prometheus(self) -> str:
+        """Render all series in the Prometheus text exposition format."""
+        with self._lock:
+            hist     = [(k, [list(h[0]), h[1], h[2]]) for k, h in self._hist.items()]
+            counters = list(self._counters.items())
+            gauges   = list(self._gauges.items())
+        out = ["# HELP bot_stage_seconds Time spent per processing stage.",
+               "# TYPE bot_stage_seconds histogram"]
+        for (stage, labels), (buckets, total, count) in sorted(hist):
+            lbl = (('stage', stage),) + labels
+            for le, n in zip(self.BUCKETS, buckets):
+                out.append(f"bot_stage_seconds_bucket{self._fmt_labels(lbl + (('le', le),))} {n}")
+            out.append(f"bot_stage_seconds_bucket{self._fmt_labels(lbl + (('le', '+Inf'),))} {count}")
+            out.append(f"bot_stage_seconds_sum{self._fmt_labels(lbl)} {total:.6f}")
+            out.append(f"bot_stage_seconds_count{self._fmt_labels(lbl)} {count}")
+        seen = set()
+        for (name, labels), v in sorted(counters):
+            if name not in seen:
+                out.append(f"# TYPE bot_{name}_total counter")
+                seen.add(name)
+            out.append(f"bot_{name}_total{self._fmt_labels(labels)} {v:g}")
+        for (name, labels), v in sorted(gauges):
+            if name not in seen:
+                out.append(f"# TYPE bot_{name} gauge")
+                seen.add(name)
+            out.append(f"bot_{name}{self._fmt_labels(labels)} {v:g}")
+        return "\n".join(out) + "\n"
+
+
+METRICS = Metrics()
+
+
+def start_metrics_server(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Serve METRICS at http://host:port/metrics from a daemon thread."""
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = METRICS.prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):   # keep the bot log clean
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"Metrics endpoint: http://{host}:{port}/metrics")
+    return server
+
+
+# ===========================================================================
+# Memory introspection (/mem + periodic log line)
+# ===========================================================================
+def _rss_bytes() -> int:
+    """Current resident set size; peak RSS where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def deep_sizeof(obj, _seen: Optional[set] = None) -> int:
+    """Approximate retained size of a container tree, counting shared objects once."""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if _TA_LOADED and isinstance(obj, np.ndarray):
+        return obj.nbytes + sys.getsizeof(obj) if obj.base is None else sys.getsizeof(obj)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_sizeof(x, seen) for x in obj)
+    elif hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj), seen)
+    elif hasattr(obj, '__slots__'):
+        size += sum(deep_sizeof(getattr(obj, a), seen)
+                    for a in obj.__slots__ if hasattr(obj, a))
+    return size
+
+
+class MemoryMonitor:
+    """
+    RSS + per-structure sizes, and — when tracemalloc is tracing (MEM_TRACE) —
+    the top allocation sites by growth since the previous sample.
+    """
+
+    def __init__(self, top_n: int = 8):
+        self.top_n = top_n
+        self._prev_snapshot = None
+
+    @staticmethod
+    def start_tracing(frames: int = 1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def sample(self, structures: Dict[str, object]) -> Dict:
+        result = {
+            'rss':   _rss_bytes(),
+            'sizes': {name: (len(obj) if hasattr(obj, '__len__') else None, deep_sizeof(obj))
+                      for name, obj in structures.items()},
+            'growth': [],
+        }
+        if tracemalloc.is_tracing():
+            snap = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ])
+            if self._prev_snapshot is not None:
+                stats = snap.compare_to(self._prev_snapshot, 'lineno')
+                result['growth'] = [
+                    (f"{st.traceback[0].filename.rsplit(os.sep, 1)[-1]}:{st.traceback[0].lineno}",
+                     st.size_diff, st.count_diff)
+                    for st in stats[:self.top_n] if st.size_diff > 0
+                ]
+            self._prev_snapshot = snap
+            result['traced'] = tracemalloc.get_traced_memory()[0]
+        return result
+
+    @staticmethod
+    def log_line(sample: Dict) -> str:
+        parts = [f"rss={sample['rss'] / 2**20:.1f}MB"]
+        for name, (count, size) in sample['sizes'].items():
+            parts.append(f"{name}={size / 2**10:.0f}KB" + (f"/{count}" if count is not None else ""))
+        if sample['growth']:
+            site, diff, _ = sample['growth'][0]
+            parts.append(f"top_growth={site} +{diff / 2**10:.0f}KB")
+        return "Memory: " + " ".join(parts)
+
+
+# ===========================================================================
+# Last-analysis store (/conf)
+# ===========================================================================
+@dataclass(slots=True)
+class AnalysisSummary:
+    """The subset of a forecast that /conf renders — nothing else is retained."""
+    symbol:          str
+    timeframe:       str
+    recommendation:  str
+    probability:     int
+    current_price:   float
+    target_price:    float
+    signal_score:    int
+    market_regime:   str
+    adx:             float
+    adx_pos:         float
+    adx_neg:         float
+    rsi:             float
+    macd_signal:     str
+    ema_trend:       str
+    ema_periods:     str
+    volume_trend:    str
+    volume_ratio:    float
+    vol_ratio_100:   float
+    bb_upper:        float
+    bb_middle:       float
+    bb_lower:        float
+    bb_width:        float
+    bb_signal:       str
+    bb_squeeze:      bool
+    atr:             float
+    atr_pct:         float
+    stop_loss_long:  float
+    stop_loss_short: float
+    rsi_divergence:  int
+    high_24h:        float
+    low_24h:         float
+    change_24h:      float
+    near_support:      Optional[float] = None
+    near_resistance:   Optional[float] = None
+    pct_to_support:    Optional[float] = None
+    pct_to_resistance: Optional[float] = None
+    order_book_bias:   Optional[str]   = None
+    fng_value:         Optional[int]   = None
+    fng_class:         Optional[str]   = None
+    fng_emoji:         Optional[str]   = None
+
+    @classmethod
+    def from_forecast(cls, fc: Dict) -> 'AnalysisSummary':
+        ind, pdd = fc['indicators'], fc['price_data']
+        fng = ind.get('fear_greed') or {}
+        return cls(
+            symbol=fc['symbol'], timeframe=fc['timeframe'],
+            recommendation=fc['recommendation'], probability=fc['probability'],
+            current_price=fc['current_price'], target_price=fc['target_price'],
+            signal_score=ind.get('signal_score', 0),
+            market_regime=ind.get('market_regime', 'transitioning'),
+            adx=ind.get('adx', 0), adx_pos=ind.get('adx_pos', 0), adx_neg=ind.get('adx_neg', 0),
+            rsi=ind.get('rsi', 50), macd_signal=ind.get('macd_signal', 'neutral'),
+            ema_trend=ind.get('ema_trend', 'sideways'), ema_periods=ind.get('ema_periods', ''),
+            volume_trend=ind.get('volume_trend', 'stable'),
+            volume_ratio=ind.get('volume_ratio', 1.0), vol_ratio_100=ind.get('vol_ratio_100', 1.0),
+            bb_upper=ind.get('bb_upper', 0), bb_middle=ind.get('bb_middle', 0),
+            bb_lower=ind.get('bb_lower', 0), bb_width=ind.get('bb_width', 0),
+            bb_signal=ind.get('bb_signal', 'neutral'), bb_squeeze=bool(ind.get('bb_squeeze')),
+            atr=ind.get('atr', 0), atr_pct=ind.get('atr_pct', 0),
+            stop_loss_long=ind.get('stop_loss_long', 0), stop_loss_short=ind.get('stop_loss_short', 0),
+            rsi_divergence=ind.get('rsi_divergence', 0),
+            high_24h=pdd.get('high_24h', 0), low_24h=pdd.get('low_24h', 0),
+            change_24h=pdd.get('change_24h', 0),
+            near_support=ind.get('near_support'), near_resistance=ind.get('near_resistance'),
+            pct_to_support=ind.get('pct_to_support'), pct_to_resistance=ind.get('pct_to_resistance'),
+            order_book_bias=ind.get('order_book_bias'),
+            fng_value=fng.get('value'), fng_class=fng.get('classification'),
+            fng_emoji=fng.get('emoji'),
+        )
+
+
+class AnalysisStore:
+    """
+    user_id → AnalysisSummary with LRU eviction (max_entries) and TTL expiry.
+    With db_path, entries are also written through to SQLite: /conf survives
+    restarts and users evicted from RAM are reloaded on demand.
+    """
+
+    def __init__(self, max_entries: int = 5000, ttl: float = 86400,
+                 db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl         = ttl
+        self._mem: 'OrderedDict[int, Tuple[AnalysisSummary, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._db   = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS last_analysis "
+                             "(user_id INTEGER PRIMARY KEY, ts REAL, data TEXT)")
+            self._db.execute("DELETE FROM last_analysis WHERE ts < ?", (time.time() - ttl,))
+            self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._mem)
+
+    def __contains__(self, user_id) -> bool:
+        return self.get(user_id) is not None
+
+    def put(self, user_id: int, forecast: Dict) -> AnalysisSummary:
+        summary, now = AnalysisSummary.from_forecast(forecast), time.time()
+        with self._lock:
+            self._remember(user_id, summary, now)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO last_analysis VALUES (?, ?, ?)",
+                                 (user_id, now, json.dumps(asdict(summary))))
+                self._db.commit()
+        return summary
+
+    def get(self, user_id: int) -> Optional[AnalysisSummary]:
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(user_id)
+            if entry is not None:
+                if now - entry[1] < self.ttl:
+                    self._mem.move_to_end(user_id)
+                    return entry[0]
+                del self._mem[user_id]
+            if self._db is None:
+                return None
+            row = self._db.execute("SELECT ts, data FROM last_analysis WHERE user_id = ?",
+                                   (user_id,)).fetchone()
+            if row is None or now - row[0] >= self.ttl:
+                return None
+            summary = AnalysisSummary(**json.loads(row[1]))
+            self._remember(user_id, summary, row[0])
+            return summary
+
+    def snapshot(self) -> Dict[int, Tuple[AnalysisSummary, float]]:
+        """Copy of the in-memory entries, safe to walk from another thread."""
+        with self._lock:
+            return dict(self._mem)
+
+    def _remember(self, user_id: int, summary: AnalysisSummary, ts: float):
+        self._mem[user_id] = (summary, ts)
+        self._mem.move_to_end(user_id)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+
 # ===========================================================================
 # CryptoAnalyzer
 # ===========================================================================
@@ -68,18 +509,62 @@ class CryptoAnalyzer:
         '1m': 30, '15m': 120, '1h': 300, '4h': 600, '1d': 1800
     }
 
-    def __init__(self, binance_api_key=None, binance_secret_key=None):
-        self.last_analysis: Dict = {}
+    # Ticker answers are reused this long — a button tap and the forecast it
+    # triggers share one price, and so do users asking about the same symbol.
+    _PRICE_TTL = 5.0
+
+    # Hedged price fetch: CoinGecko is fired in parallel once Binance has been
+    # silent for the hedge delay. Without a fixed delay, Binance's own p95 is
+    # used (clamped), falling back to the default until enough samples exist.
+    _HEDGE_DEFAULT_DELAY = 1.5
+    _HEDGE_MIN_SAMPLES   = 20
+    _HEDGE_BOUNDS        = (0.25, 5.0)
+
+    def __init__(self, binance_api_key=None, binance_secret_key=None,
+                 hedge_delay: Optional[float] = None, price_budget: float = 20.0,
+                 last_analysis: Optional[AnalysisStore] = None,
+                 kline_store: Optional[KlineStore] = None,
+                 kline_float32: bool = False,
+                 pool: Optional['AnalysisPool'] = None,
+                 shared_cache: Optional[KlineCache] = None,
+                 weights: Optional[WeightLimiter] = None, scan_symbols: int = 200,
+                 order_books=None):
+        self.last_analysis = last_analysis if last_analysis is not None else AnalysisStore()
         self.binance_api   = "https://api.binance.com/api/v3"
         self.coingecko_api = "https://api.coingecko.com/api/v3"
         self.binance_api_key    = binance_api_key
         self.binance_secret_key = binance_secret_key
 
-        # Klines cache: (symbol, interval, limit) -> (DataFrame, timestamp)
+        # Klines cache: (symbol, interval, limit) -> (structured OHLCV array, timestamp)
         self._klines_cache: Dict[tuple, tuple] = {}
+        self.kline_float32 = kline_float32
+        # Optional cross-process tier between the in-memory cache and Binance
+        self.shared_cache  = shared_cache
+        # Optional process pool for the indicator math (None = in-process)
+        self.pool = pool
+        # Optional disk tier of closed candles — restarts only top up the tail
+        self.kline_store = kline_store
 
         # Fear & Greed cache: (result_dict, timestamp)
         self._fng_cache: Tuple = (None, 0.0)
+        # Price cache: symbol -> (price_data, timestamp)
+        self._price_cache: Dict[str, tuple] = {}
+
+        # Price sources race each other within `price_budget` seconds in total
+        self.hedge_delay   = hedge_delay
+        self.price_budget  = price_budget
+        self.price_latency: Dict[str, LatencyStats] = {
+            'Binance': LatencyStats(), 'CoinGecko': LatencyStats(),
+        }
+        self._price_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='price')
+
+        # Binance request-weight budget for kline and market-wide fetches
+        self.weights      = weights if weights is not None else WeightLimiter()
+        # /scan: the `scan_symbols` most traded USDT pairs; (pairs, timestamp)
+        self.scan_symbols = scan_symbols
+        self._universe_cache: Tuple = (None, 0.0)
+        # Optional orderbook.OrderBookFeed — supershort reads its imbalance instead of REST
+        self.order_books = order_books
 
     # ------------------------------------------------------------------
     # Price data
@@ -93,11 +578,14 @@ class CryptoAnalyzer:
             h['X-MBX-APIKEY'] = self.binance_api_key
         return h
 
-    def _get_binance_data(self, symbol: str) -> Optional[Dict]:
+    def _get_binance_data(self, symbol: str,
+                          cancel: Optional[threading.Event] = None) -> Optional[Dict]:
         try:
             hdrs = self._get_binance_headers()
             pr = requests.get(f"{self.binance_api}/ticker/price?symbol={symbol}USDT",
                               timeout=15, headers=hdrs)
+            if cancel is not None and cancel.is_set():
+                return None
             sr = requests.get(f"{self.binance_api}/ticker/24hr?symbol={symbol}USDT",
                               timeout=15, headers=hdrs)
             if pr.status_code == 200 and sr.status_code == 200:
@@ -111,15 +599,20 @@ class CryptoAnalyzer:
                     'quote_volume': float(s.get('quoteVolume', 0)),
                     'source':       'Binance',
                 }
+            METRICS.inc('http_errors', source='binance_ticker')
         except Exception as e:
+            METRICS.inc('http_errors', source='binance_ticker')
             logger.debug(f"Binance ticker failed: {e}")
         return None
 
-    def _get_coingecko_data(self, symbol: str) -> Optional[Dict]:
+    def _get_coingecko_data(self, symbol: str,
+                            cancel: Optional[threading.Event] = None) -> Optional[Dict]:
         try:
             sr = requests.get(f"{self.coingecko_api}/search?query={symbol}", timeout=15)
             if sr.status_code != 200:
                 return None
+            if cancel is not None and cancel.is_set():
+                return None
             coin = next(
                 (c for c in sr.json().get('coins', [])
                  if c.get('symbol', '').upper() == symbol.upper()), None
@@ -148,11 +641,99 @@ class CryptoAnalyzer:
                 'source':     'CoinGecko',
             }
         except Exception as e:
+            METRICS.inc('http_errors', source='coingecko')
             logger.debug(f"CoinGecko failed: {e}")
         return None
 
+    def _record_latency(self, source: str, elapsed: float):
+        self.price_latency[source].add(elapsed)
+        METRICS.observe('price_source', elapsed, source=source)
+
+    def _timed_fetch(self, source: str, fetch, symbol: str,
+                     cancel: threading.Event, submitted: float) -> Optional[Dict]:
+        """
+        Timed from submission, so time spent queued for a _price_pool thread
+        counts. A fetch that lost the race and was cut short still records
+        its time so far: a lower bound, but leaving it out would hide exactly
+        the slow answers that the hedge delay (Binance p95) should track.
+        """
+        result = fetch(symbol, cancel)
+        if result or cancel.is_set():
+            self._record_latency(source, time.perf_counter() - submitted)
+        return result
+
+    def _current_hedge_delay(self) -> float:
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        stats = self.price_latency['Binance']
+        if len(stats) < self._HEDGE_MIN_SAMPLES:
+            return self._HEDGE_DEFAULT_DELAY
+        lo, hi = self._HEDGE_BOUNDS
+        return max(lo, min(hi, stats.percentile(95)))
+
     def get_price_data(self, symbol: str) -> Optional[Dict]:
-        return self._get_binance_data(symbol) or self._get_coingecko_data(symbol)
+        """Latest price/24h stats, reused for _PRICE_TTL seconds across requests."""
+        hit = self._price_cache.get(symbol)
+        if hit and time.time() - hit[1] < self._PRICE_TTL:
+            METRICS.inc('cache_hits', cache='price')
+            return hit[0]
+        METRICS.inc('cache_misses', cache='price')
+        data = self._fetch_price_data(symbol)
+        if data:
+            self._price_cache[symbol] = (data, time.time())
+        return data
+
+    def cached_price(self, symbol: str, since: float = 0.0) -> Optional[Dict]:
+        """The last price/24h stats fetched at or after `since` (epoch s); never fetches."""
+        hit = self._price_cache.get(symbol)
+        return hit[0] if hit and hit[1] >= since else None
+
+    def _fetch_price_data(self, symbol: str) -> Optional[Dict]:
+        """
+        Binance first; if it has not answered within the hedge delay (or has
+        already failed), CoinGecko is fired in parallel. The first valid answer
+        wins and the loser is cancelled: dropped if not yet started, otherwise
+        told to stop before its next HTTP call.
+        """
+        cancel   = threading.Event()
+        deadline = time.monotonic() + self.price_budget
+        started  = {}                                # future -> (source, submission time)
+
+        def submit(source, fetch):
+            t0  = time.perf_counter()
+            fut = self._price_pool.submit(self._timed_fetch, source, fetch, symbol, cancel, t0)
+            started[fut] = (source, t0)
+            return fut
+
+        primary = submit('Binance', self._get_binance_data)
+        wait([primary], timeout=self._current_hedge_delay())
+
+        pending = [primary]
+        if primary.done() and primary.result():
+            return primary.result()
+        if not primary.done():
+            logger.debug(f"Binance slow for {symbol} — hedging with CoinGecko")
+        pending.append(submit('CoinGecko', self._get_coingecko_data))
+
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"Price fetch for {symbol} exceeded {self.price_budget:.0f}s budget")
+                    return None
+                done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                # Keep source order so Binance wins a tie
+                for fut in [f for f in pending if f in done]:
+                    pending.remove(fut)
+                    if fut.result():
+                        return fut.result()
+            return None
+        finally:
+            cancel.set()
+            for fut in pending:
+                if fut.cancel():                     # never left the queue: waited this long at least
+                    source, t0 = started[fut]
+                    self._record_latency(source, time.perf_counter() - t0)
 
     # ------------------------------------------------------------------
     # Fear & Greed Index
@@ -161,7 +742,9 @@ class CryptoAnalyzer:
         """Fetch F&G from alternative.me. Cached 1 hour."""
         cached, ts = self._fng_cache
         if cached and (time.time() - ts) < 3600:
+            METRICS.inc('cache_hits', cache='fng')
             return cached
+        METRICS.inc('cache_misses', cache='fng')
         try:
             r = requests.get('https://api.alternative.me/fng/?limit=1', timeout=10)
             r.raise_for_status()
@@ -175,6 +758,7 @@ class CryptoAnalyzer:
             self._fng_cache = (result, time.time())
             return result
         except Exception as e:
+            METRICS.inc('http_errors', source='fng')
             logger.debug(f"Fear & Greed fetch failed: {e}")
             return None
 
@@ -190,47 +774,105 @@ class CryptoAnalyzer:
     # Klines — with TTL cache
     # ------------------------------------------------------------------
     def _get_klines(self, symbol: str, interval: str, limit: int = 100):
-        """Return a cached or freshly fetched OHLCV DataFrame, or None."""
-        if not TA_AVAILABLE:
+        """Return a cached or freshly fetched structured OHLCV array (see klines.to_array), or None."""
+        if not load_ta():
             return None
 
         key = (symbol, interval, limit)
-        ttl = self._CACHE_TTL.get(interval, 120)
+        # Never serve an entry from before the latest candle close, so the
+        # candle that just closed is always included
+        step = INTERVAL_MS.get(interval)
+        ttl  = self._CACHE_TTL.get(interval, 120)
+        if step:
+            now_ms = time.time() * 1000
+            ttl = min(ttl, (now_ms % step) / 1000)
 
         if key in self._klines_cache:
-            df_cached, ts = self._klines_cache[key]
+            arr_cached, ts = self._klines_cache[key]
             if time.time() - ts < ttl:
-                return df_cached
+                METRICS.inc('cache_hits', cache='klines')
+                return arr_cached
+        METRICS.inc('cache_misses', cache='klines')
+
+        if self.shared_cache:
+            try:
+                hit = self.shared_cache.get(symbol, interval, limit, ttl, self.kline_float32)
+            except sqlite3.Error as e:
+                logger.debug(f"Shared kline cache read failed: {e}")
+                hit = None
+            if hit is not None:
+                METRICS.inc('cache_hits', cache='shared_klines')
+                self._klines_cache[key] = (hit[0], hit[1])
+                return hit[0]
+            METRICS.inc('cache_misses', cache='shared_klines')
 
         try:
-            url    = f"{self.binance_api}/klines"
-            params = {'symbol': f"{symbol}USDT", 'interval': interval, 'limit': limit}
-            r = requests.get(url, params=params, headers=self._get_binance_headers(), timeout=15)
-            r.raise_for_status()
-            df = pd.DataFrame(r.json(), columns=[
-                'open_time', 'open', 'high', 'low', 'close', 'volume',
-                'close_time', 'quote_volume', 'trades',
-                'taker_buy_base', 'taker_buy_quote', 'ignore'
-            ])
-            for col in ['open', 'high', 'low', 'close', 'volume']:
-                df[col] = pd.to_numeric(df[col])
-            self._klines_cache[key] = (df, time.time())
-            return df
+            rows = self._fetch_kline_rows(symbol, interval, limit)
+            arr  = to_array(rows, self.kline_float32)
+            now  = time.time()
+            self._klines_cache[key] = (arr, now)
+            if self.shared_cache:
+                try:
+                    self.shared_cache.put(symbol, interval, limit, arr, now)
+                except sqlite3.Error as e:
+                    logger.debug(f"Shared kline cache write failed: {e}")
+            return arr
         except Exception as e:
+            METRICS.inc('http_errors', source='binance_klines')
             logger.error(f"Klines fetch failed ({symbol} {interval}): {e}")
             return None
 
+    def _binance_get(self, path: str, params: Dict, weight: int):
+        """GET a Binance REST endpoint within the request-weight budget; returns the JSON body."""
+        waited = self.weights.acquire(weight)
+        if waited:
+            METRICS.observe('binance_weight_wait', waited)
+        r = requests.get(f"{self.binance_api}{path}", params=params,
+                         headers=self._get_binance_headers(), timeout=15)
+        self.weights.update(r.headers)
+        if r.status_code in (418, 429):
+            self.weights.backoff(float(r.headers.get('Retry-After', 60)))
+            METRICS.inc('http_errors', source='binance_rate_limited')
+        r.raise_for_status()
+        return r.json()
+
+    def _fetch_kline_rows(self, symbol: str, interval: str, limit: int) -> List[tuple]:
+        """
+        Latest `limit` candles as OHLCV tuples. With a kline store, stored
+        closed candles are reused and only the missing tail is requested.
+        """
+        stored  = self.kline_store.load(symbol, interval, limit) if self.kline_store else []
+        missing = missing_candles(stored, interval, limit) if stored else None
+        params  = {'symbol': f"{symbol}USDT", 'interval': interval}
+        if missing is None:
+            params['limit'] = limit
+        else:
+            params['startTime'] = stored[-1][0] + 1
+            params['limit']     = missing + 1
+        fresh = parse_rows(self._binance_get('/klines', params, klines_weight(params['limit'])))
+        if missing is None:
+            rows = fresh
+        else:
+            METRICS.inc('cache_hits', cache='kline_store')
+            first_new = fresh[0][0] if fresh else None
+            rows = [k for k in stored if first_new is None or k[0] < first_new] + fresh
+            rows = rows[-limit:]
+        if self.kline_store:
+            self.kline_store.save(symbol, interval, closed_only(fresh, interval))
+        return rows
+
     # ------------------------------------------------------------------
     # Support & Resistance
     # ------------------------------------------------------------------
-    def _compute_support_resistance(self, highs, lows, closes) -> Dict:
+    @staticmethod
+    def _compute_support_resistance(highs, lows, closes) -> Dict:
         result = {}
         try:
-            current = float(closes.iloc[-1])
-            result['resistance']      = round(float(highs.iloc[-20:].max()), 8)
-            result['support']         = round(float(lows.iloc[-20:].min()), 8)
-            result['near_resistance'] = round(float(highs.iloc[-5:].max()), 8)
-            result['near_support']    = round(float(lows.iloc[-5:].min()), 8)
+            current = float(closes[-1])
+            result['resistance']      = round(float(highs[-20:].max()), 8)
+            result['support']         = round(float(lows[-20:].min()), 8)
+            result['near_resistance'] = round(float(highs[-5:].max()), 8)
+            result['near_support']    = round(float(lows[-5:].min()), 8)
             if current > 0:
                 result['pct_to_resistance'] = round(
                     (result['near_resistance'] - current) / current * 100, 2)
@@ -243,27 +885,22 @@ class CryptoAnalyzer:
     # ------------------------------------------------------------------
     # Bollinger Bands
     # ------------------------------------------------------------------
-    def _compute_bollinger(self, closes) -> Dict:
+    @staticmethod
+    def _compute_bollinger(series: Dict) -> Dict:
         """Bollinger Bands (20, 2σ) with squeeze detection."""
         result = {}
         try:
-            bb = BollingerBands(close=closes, window=20, window_dev=2)
-            upper  = bb.bollinger_hband()
-            lower  = bb.bollinger_lband()
-            middle = bb.bollinger_mavg()
-            width  = bb.bollinger_wband()   # (upper-lower)/middle × 100
-            pband  = bb.bollinger_pband()   # (price-lower)/(upper-lower)
-
-            result['bb_upper']  = round(float(upper.iloc[-1]),  8)
-            result['bb_lower']  = round(float(lower.iloc[-1]),  8)
-            result['bb_middle'] = round(float(middle.iloc[-1]), 8)
-            result['bb_width']  = round(float(width.iloc[-1]),  4)
-            result['bb_pband']  = round(float(pband.iloc[-1]),  4)
+            width = series['bb_wband']      # (upper-lower)/middle × 100
+            result['bb_upper']  = round(float(series['bb_upper'][-1]),  8)
+            result['bb_lower']  = round(float(series['bb_lower'][-1]),  8)
+            result['bb_middle'] = round(float(series['bb_middle'][-1]), 8)
+            result['bb_width']  = round(float(width[-1]),  4)
+            result['bb_pband']  = round(float(series['bb_pband'][-1]),  4)   # (price-lower)/(upper-lower)
 
             # Squeeze: bandwidth is at or near its lowest in the lookback
             lookback  = min(50, len(width))
-            min_width = float(width.iloc[-lookback:].min())
-            result['bb_squeeze'] = float(width.iloc[-1]) <= min_width * 1.05
+            min_width = float(np.nanmin(width[-lookback:]))
+            result['bb_squeeze'] = float(width[-1]) <= min_width * 1.05
 
             # Positional signal
             pb = result['bb_pband']
@@ -283,13 +920,13 @@ class CryptoAnalyzer:
     # ------------------------------------------------------------------
     # ATR — stop-loss suggestion
     # ------------------------------------------------------------------
-    def _compute_atr(self, highs, lows, closes) -> Dict:
+    @staticmethod
+    def _compute_atr(series: Dict, closes) -> Dict:
         """14-period ATR with 2×ATR stop-loss levels."""
         result = {}
         try:
-            atr_ind = AverageTrueRange(high=highs, low=lows, close=closes, window=14)
-            atr_val = float(atr_ind.average_true_range().iloc[-1])
-            current = float(closes.iloc[-1])
+            atr_val = float(series['atr'][-1])
+            current = float(closes[-1])
             result['atr']              = round(atr_val, 8)
             result['atr_pct']          = round(atr_val / current * 100, 3)
             result['stop_loss_long']   = round(current - 2 * atr_val, 8)
@@ -301,40 +938,19 @@ class CryptoAnalyzer:
     # ------------------------------------------------------------------
     # RSI Divergence
     # ------------------------------------------------------------------
-    def _detect_rsi_divergence(self, closes, rsi_series) -> int:
+    @staticmethod
+    def _detect_rsi_divergence(closes, rsi_series) -> int:
         """
         Bullish divergence: price near recent low but RSI higher than it was → +1
         Bearish divergence: price near recent high but RSI lower than it was → -1
-        Returns 0 if no clear divergence.
+        Returns 0 if no clear divergence. The rule lives in
+        indicators.rsi_divergence so the backtester scores the same signal.
         """
         try:
             # Tighter parameters: shorter lookback + larger RSI gap required
             # reduces false positives from the original (n=20, threshold=5)
             n = 10
-            price_w = closes.iloc[-n:]
-            rsi_w   = rsi_series.iloc[-n:].dropna()
-            if len(rsi_w) < 5:
-                return 0
-
-            current_price = float(closes.iloc[-1])
-            current_rsi   = float(rsi_series.iloc[-1])
-
-            # Bullish: price at/near its recent low, RSI notably above its value then
-            price_min_idx = price_w.idxmin()
-            price_min     = float(price_w.min())
-            rsi_at_pmin   = float(rsi_series.loc[price_min_idx]) if price_min_idx in rsi_series.index else current_rsi
-
-            if current_price <= price_min * 1.01 and current_rsi > rsi_at_pmin + 10:
-                return 1  # bullish divergence
-
-            # Bearish: price at/near its recent high, RSI notably below its value then
-            price_max_idx = price_w.idxmax()
-            price_max     = float(price_w.max())
-            rsi_at_pmax   = float(rsi_series.loc[price_max_idx]) if price_max_idx in rsi_series.index else current_rsi
-
-            if current_price >= price_max * 0.99 and current_rsi < rsi_at_pmax - 10:
-                return -1  # bearish divergence
-
+            return int(rsi_divergence(closes[-n:], rsi_series[-n:], window=n, gap=10)[-1])
         except Exception as e:
             logger.debug(f"Divergence detection error: {e}")
         return 0
@@ -342,27 +958,35 @@ class CryptoAnalyzer:
     # ------------------------------------------------------------------
     # Order book
     # ------------------------------------------------------------------
+    @staticmethod
+    def _ob_score(ratio: float) -> int:
+        if ratio > 0.60: return  1
+        if ratio < 0.40: return -1
+        return 0
+
+    def _depth_snapshot(self, symbol: str, limit: int = 1000) -> Dict:
+        """REST /depth, within the weight budget (also seeds local order books)."""
+        return self._binance_get('/depth', {'symbol': f"{symbol}USDT", 'limit': limit},
+                                 depth_weight(limit))
+
     def _get_order_book_score(self, symbol: str) -> int:
         """+1 buy pressure, -1 sell pressure, 0 balanced (top-20 book)."""
+        if self.order_books is not None:
+            ratio = self.order_books.imbalance(symbol, 20)
+            if ratio is not None:
+                METRICS.inc('cache_hits', cache='order_book')
+                return self._ob_score(ratio)
+            METRICS.inc('cache_misses', cache='order_book')
         try:
-            r = requests.get(
-                f"{self.binance_api}/depth",
-                params={'symbol': f"{symbol}USDT", 'limit': 20},
-                headers=self._get_binance_headers(),
-                timeout=10
-            )
-            r.raise_for_status()
-            data = r.json()
+            data = self._depth_snapshot(symbol, 20)
             bid_vol = sum(float(q) for _, q in data.get('bids', []))
             ask_vol = sum(float(q) for _, q in data.get('asks', []))
             total   = bid_vol + ask_vol
             if total == 0:
                 return 0
-            ratio = bid_vol / total
-            if ratio > 0.60: return  1
-            if ratio < 0.40: return -1
-            return 0
+            return self._ob_score(bid_vol / total)
         except Exception as e:
+            METRICS.inc('http_errors', source='binance_depth')
             logger.debug(f"Order book failed: {e}")
             return 0
 
@@ -382,122 +1006,134 @@ class CryptoAnalyzer:
         return base
 
     # ------------------------------------------------------------------
-    # Core indicator computation
+    # Pure indicator math (runs in-process or in an AnalysisPool worker)
     # ------------------------------------------------------------------
-    def compute_indicators(self, symbol: str, timeframe: str) -> Dict:
-        cfg = self.TIMEFRAME_CONFIG.get(timeframe, self.TIMEFRAME_CONFIG['mid'])
-        interval, limit, fast_p, slow_p, _ = cfg
-
-        indicators: Dict = {
-            'timeframes':  {'supershort':'1m/5m/15m','short':'15m/1h/4h',
-                            'mid':'4h/1d','long':'1d/1w','ulong':'1d/1w'}.get(timeframe, interval),
-            'ema_periods': f'EMA({fast_p}/{slow_p})',
-        }
+    @staticmethod
+    def analyze_klines(klines, fast_p: int, slow_p: int) -> Dict:
+        """Structured OHLCV array → indicator snapshot for the last candle."""
+        closes  = klines['close'].astype(np.float64)
+        highs   = klines['high'].astype(np.float64)
+        lows    = klines['low'].astype(np.float64)
+        volumes = klines['volume'].astype(np.float64)
 
-        if not TA_AVAILABLE:
-            return self._fallback_indicators(indicators)
+        # --- One fused pass over the candles for every indicator series ---
+        series = compute_series(highs, lows, closes, volumes, fast_p, slow_p)
+        return CryptoAnalyzer._snapshot(series, highs, lows, closes, volumes)
 
-        df = self._get_klines(symbol, interval, limit)
-        if df is None or len(df) < 30:
-            logger.warning(f"Insufficient klines for {symbol} — fallback indicators")
-            return self._fallback_indicators(indicators)
+    @staticmethod
+    def analyze_batch(klines_list: List, fast_p: int, slow_p: int) -> List[Dict]:
+        """analyze_klines() for equal-length arrays, with one batched kernel pass for all of them."""
+        cols = {f: np.stack([k[f].astype(np.float64) for k in klines_list])
+                for f in ('high', 'low', 'close', 'volume')}
+        series = compute_series_batch(cols['high'], cols['low'], cols['close'], cols['volume'],
+                                      fast_p, slow_p)
+        return [CryptoAnalyzer._snapshot({k: v[i] for k, v in series.items()}, cols['high'][i],
+                                         cols['low'][i], cols['close'][i], cols['volume'][i])
+                for i in range(len(klines_list))]
 
-        closes  = df['close']
-        highs   = df['high']
-        lows    = df['low']
-        volumes = df['volume']
+    @staticmethod
+    def _snapshot(series: Dict, highs, lows, closes, volumes) -> Dict:
+        """Indicator series (compute_series layout) → the last-candle snapshot the scorer reads."""
+        indicators: Dict = {}
 
         # --- RSI ---
-        try:
-            rsi_series = RSIIndicator(close=closes, window=14).rsi()
-            indicators['rsi'] = round(float(rsi_series.iloc[-1]), 2)
-        except Exception:
-            rsi_series = None
-            indicators['rsi'] = 50.0
+        rsi_series = series['rsi']
+        indicators['rsi'] = round(float(rsi_series[-1]), 2)
 
         # --- MACD ---
-        try:
-            macd_obj  = MACD(close=closes)
-            macd_diff = macd_obj.macd_diff()
-            now, prev = float(macd_diff.iloc[-1]), float(macd_diff.iloc[-2]) if len(macd_diff) > 1 else 0.0
-            if   now > 0 and prev <= 0: indicators['macd_signal'] = 'bullish_cross'
-            elif now < 0 and prev >= 0: indicators['macd_signal'] = 'bearish_cross'
-            elif now > 0:               indicators['macd_signal'] = 'bullish'
-            elif now < 0:               indicators['macd_signal'] = 'bearish'
-            else:                       indicators['macd_signal'] = 'neutral'
-            indicators['macd_diff'] = round(now, 10)
-        except Exception:
-            indicators['macd_signal'] = 'neutral'
+        macd_diff = series['macd_diff']
+        now, prev = float(macd_diff[-1]), float(macd_diff[-2])
+        if   now > 0 and prev <= 0: indicators['macd_signal'] = 'bullish_cross'
+        elif now < 0 and prev >= 0: indicators['macd_signal'] = 'bearish_cross'
+        elif now > 0:               indicators['macd_signal'] = 'bullish'
+        elif now < 0:               indicators['macd_signal'] = 'bearish'
+        else:                       indicators['macd_signal'] = 'neutral'
+        indicators['macd_diff'] = round(now, 10)
 
         # --- EMA trend ---
-        try:
-            fp = min(fast_p, len(closes) - 1)
-            sp = min(slow_p, len(closes) - 1)
-            ef = float(EMAIndicator(close=closes, window=fp).ema_indicator().iloc[-1])
-            es = float(EMAIndicator(close=closes, window=sp).ema_indicator().iloc[-1])
-            px = float(closes.iloc[-1])
-            indicators.update({'ema_fast': round(ef, 8), 'ema_slow': round(es, 8)})
-            if   px > ef > es: indicators['ema_trend'] = 'upward'
-            elif px < ef < es: indicators['ema_trend'] = 'downward'
-            elif ef > es:      indicators['ema_trend'] = 'upward'
-            elif ef < es:      indicators['ema_trend'] = 'downward'
-            else:              indicators['ema_trend'] = 'sideways'
-        except Exception:
-            indicators['ema_trend'] = 'sideways'
+        ef = float(series['ema_fast'][-1])
+        es = float(series['ema_slow'][-1])
+        px = float(closes[-1])
+        indicators.update({'ema_fast': round(ef, 8), 'ema_slow': round(es, 8)})
+        if   px > ef > es: indicators['ema_trend'] = 'upward'
+        elif px < ef < es: indicators['ema_trend'] = 'downward'
+        elif ef > es:      indicators['ema_trend'] = 'upward'
+        elif ef < es:      indicators['ema_trend'] = 'downward'
+        else:              indicators['ema_trend'] = 'sideways'
 
         # --- Volume (20-period for short-term trend + 100-period for conviction) ---
-        try:
-            vol_mean_20  = float(volumes.iloc[-20:].mean())
-            vol_mean_100 = float(volumes.iloc[-min(100, len(volumes)):].mean())
-            vol_now      = float(volumes.iloc[-1])
-            ratio_20     = vol_now / vol_mean_20  if vol_mean_20  > 0 else 1.0
-            ratio_100    = vol_now / vol_mean_100 if vol_mean_100 > 0 else 1.0
-            indicators['volume_ratio']  = round(ratio_20,  2)
-            indicators['vol_ratio_100'] = round(ratio_100, 2)
-            if   ratio_20 > 1.2: indicators['volume_trend'] = 'increasing'
-            elif ratio_20 < 0.8: indicators['volume_trend'] = 'decreasing'
-            else:                indicators['volume_trend'] = 'stable'
-        except Exception:
-            indicators.update({'volume_trend': 'stable', 'volume_ratio': 1.0,
-                               'vol_ratio_100': 1.0})
+        vol_mean_20  = float(volumes[-20:].mean())
+        vol_mean_100 = float(volumes[-min(100, len(volumes)):].mean())
+        vol_now      = float(volumes[-1])
+        ratio_20     = vol_now / vol_mean_20  if vol_mean_20  > 0 else 1.0
+        ratio_100    = vol_now / vol_mean_100 if vol_mean_100 > 0 else 1.0
+        indicators['volume_ratio']  = round(ratio_20,  2)
+        indicators['vol_ratio_100'] = round(ratio_100, 2)
+        if   ratio_20 > 1.2: indicators['volume_trend'] = 'increasing'
+        elif ratio_20 < 0.8: indicators['volume_trend'] = 'decreasing'
+        else:                indicators['volume_trend'] = 'stable'
 
         # --- Bollinger Bands ---
-        indicators.update(self._compute_bollinger(closes))
+        indicators.update(CryptoAnalyzer._compute_bollinger(series))
 
         # --- ATR + stop-loss ---
-        indicators.update(self._compute_atr(highs, lows, closes))
+        indicators.update(CryptoAnalyzer._compute_atr(series, closes))
 
         # --- RSI divergence ---
-        if rsi_series is not None:
-            indicators['rsi_divergence'] = self._detect_rsi_divergence(closes, rsi_series)
-        else:
-            indicators['rsi_divergence'] = 0
+        indicators['rsi_divergence'] = CryptoAnalyzer._detect_rsi_divergence(closes, rsi_series)
 
         # --- Support & Resistance ---
-        indicators.update(self._compute_support_resistance(highs, lows, closes))
+        indicators.update(CryptoAnalyzer._compute_support_resistance(highs, lows, closes))
 
         # --- ADX (market regime detection) ---
-        try:
-            adx_obj  = ADXIndicator(high=highs, low=lows, close=closes, window=14)
-            adx_val  = float(adx_obj.adx().iloc[-1])
-            adx_pos  = float(adx_obj.adx_pos().iloc[-1])   # +DI  (buying pressure)
-            adx_neg  = float(adx_obj.adx_neg().iloc[-1])   # -DI  (selling pressure)
-            indicators['adx']     = round(adx_val, 2)
-            indicators['adx_pos'] = round(adx_pos, 2)
-            indicators['adx_neg'] = round(adx_neg, 2)
-            # Regime: strong trend (>25), ranging (<15), or transitioning
-            if adx_val >= 25:
-                indicators['market_regime'] = 'trending'
-            elif adx_val <= 15:
-                indicators['market_regime'] = 'ranging'
-            else:
-                indicators['market_regime'] = 'transitioning'
-        except Exception:
-            indicators['adx']           = 20.0
-            indicators['adx_pos']       = 25.0
-            indicators['adx_neg']       = 25.0
+        adx_val = float(series['adx'][-1])
+        indicators['adx']     = round(adx_val, 2)
+        indicators['adx_pos'] = round(float(series['adx_pos'][-1]), 2)   # +DI  (buying pressure)
+        indicators['adx_neg'] = round(float(series['adx_neg'][-1]), 2)   # -DI  (selling pressure)
+        # Regime: strong trend (>25), ranging (<15), or transitioning
+        if adx_val >= 25:
+            indicators['market_regime'] = 'trending'
+        elif adx_val <= 15:
+            indicators['market_regime'] = 'ranging'
+        else:
             indicators['market_regime'] = 'transitioning'
 
+        return indicators
+
+    # ------------------------------------------------------------------
+    # Core indicator computation
+    # ------------------------------------------------------------------
+    def compute_indicators(self, symbol: str, timeframe: str) -> Dict:
+        cfg = self.TIMEFRAME_CONFIG.get(timeframe, self.TIMEFRAME_CONFIG['mid'])
+        interval, limit, fast_p, slow_p, _ = cfg
+
+        indicators: Dict = {
+            'timeframes':  {'supershort':'1m/5m/15m','short':'15m/1h/4h',
+                            'mid':'4h/1d','long':'1d/1w','ulong':'1d/1w'}.get(timeframe, interval),
+            'ema_periods': f'EMA({fast_p}/{slow_p})',
+        }
+
+        if not load_ta():
+            return self._fallback_indicators(indicators)
+
+        with METRICS.span('klines', tf=timeframe):
+            klines = self._get_klines(symbol, interval, limit)
+        if klines is None or len(klines) < 30:
+            logger.warning(f"Insufficient klines for {symbol} — fallback indicators")
+            return self._fallback_indicators(indicators)
+
+        with METRICS.span('kernel', tf=timeframe):
+            fp = min(fast_p, len(klines) - 1)
+            sp = min(slow_p, len(klines) - 1)
+            try:
+                if self.pool is not None:
+                    indicators.update(self.pool.analyze(klines, fp, sp))
+                else:
+                    indicators.update(self.analyze_klines(klines, fp, sp))
+            except Exception as e:
+                logger.error(f"Indicator kernel failed ({symbol} {timeframe}): {e}")
+                return self._fallback_indicators(indicators)
+
         indicators['data_source'] = 'live'
         return indicators
 
@@ -620,12 +1256,28 @@ class CryptoAnalyzer:
 
         return score
 
+    @staticmethod
+    def _recommendation(score: int, timeframe: str) -> str:
+        # Raised thresholds to reduce signal noise:
+        # supershort: |score| ≥ 2 for any signal (was 1), ≥ 4 for STRONG (was 3)
+        # all others: |score| ≥ 3 (was 2) — reduces the previous 75-91% signal rate
+        if timeframe == 'supershort':
+            if   score >= 4:  return 'STRONG BUY'
+            elif score >= 2:  return 'BUY'
+            elif score <= -4: return 'STRONG SELL'
+            elif score <= -2: return 'SELL'
+            return 'HOLD/WAIT'
+        if   score >= 3:  return 'BUY'
+        elif score <= -3: return 'SELL'
+        return 'HOLD'
+
     # ------------------------------------------------------------------
     # Forecast (main public API)
     # ------------------------------------------------------------------
     def generate_forecast(self, symbol: str, timeframe: str = 'supershort') -> Optional[Dict]:
         try:
-            price_data = self.get_price_data(symbol)
+            with METRICS.span('ticker', tf=timeframe):
+                price_data = self.get_price_data(symbol)
             if not price_data or price_data['price'] <= 0:
                 return None
 
@@ -637,7 +1289,8 @@ class CryptoAnalyzer:
             # Order book for supershort only
             ob_score = 0
             if timeframe == 'supershort':
-                ob_score = self._get_order_book_score(symbol)
+                with METRICS.span('order_book', tf=timeframe):
+                    ob_score = self._get_order_book_score(symbol)
                 indicators['order_book_score'] = ob_score
                 indicators['order_book_bias'] = (
                     'buy pressure' if ob_score > 0 else
@@ -645,11 +1298,13 @@ class CryptoAnalyzer:
                 )
 
             # Fear & Greed
-            fng = self.get_fear_greed()
+            with METRICS.span('fng', tf=timeframe):
+                fng = self.get_fear_greed()
             if fng:
                 indicators['fear_greed'] = fng
 
-            score = self._compute_score(indicators, change_24h, ob_score)
+            with METRICS.span('scoring', tf=timeframe):
+                score = self._compute_score(indicators, change_24h, ob_score)
             indicators['signal_score'] = score
 
             cfg = self.TIMEFRAME_CONFIG.get(timeframe, self.TIMEFRAME_CONFIG['mid'])
@@ -675,19 +1330,7 @@ class CryptoAnalyzer:
             div_bonus    = 3 if indicators.get('rsi_divergence', 0) != 0 else 0
             probability  = min(50 + regime_bonus + score_bonus + div_bonus, 70)
 
-            # --- Recommendation (raised thresholds to reduce signal noise) ---
-            # supershort: |score| ≥ 2 for any signal (was 1), ≥ 4 for STRONG (was 3)
-            # all others: |score| ≥ 3 (was 2) — reduces the previous 75-91% signal rate
-            if timeframe == 'supershort':
-                if   score >= 4:  recommendation = 'STRONG BUY'
-                elif score >= 2:  recommendation = 'BUY'
-                elif score <= -4: recommendation = 'STRONG SELL'
-                elif score <= -2: recommendation = 'SELL'
-                else:             recommendation = 'HOLD/WAIT'
-            else:
-                if   score >= 3:  recommendation = 'BUY'
-                elif score <= -3: recommendation = 'SELL'
-                else:             recommendation = 'HOLD'
+            recommendation = self._recommendation(score, timeframe)
 
             return {
                 'symbol':         symbol,
@@ -705,15 +1348,518 @@ class CryptoAnalyzer:
             logger.error(f"Forecast error: {e}")
             return None
 
+    # ------------------------------------------------------------------
+    # Market scan — the whole USDT universe in one batch
+    # ------------------------------------------------------------------
+    _UNIVERSE_TTL  = 60.0
+    _SCAN_FETCHERS = 16
+    # Stablecoins and Binance's (since delisted) leveraged tokens never make
+    # meaningful signals. Listed by name: a suffix rule would also drop real
+    # coins such as JUP.
+    _SCAN_EXCLUDE  = frozenset(
+        ['USDC', 'FDUSD', 'TUSD', 'BUSD', 'DAI', 'USDP', 'EUR', 'AEUR']
+        + [base + kind
+           for base in ('BTC', 'ETH', 'BNB', 'XRP', 'ADA', 'LINK', 'DOT', 'TRX', 'XTZ', 'EOS',
+                        'LTC', 'UNI', 'FIL', 'SXP', 'YFI', 'BCH', 'AAVE', 'SUSHI', 'XLM', '1INCH')
+           for kind in ('UP', 'DOWN', 'BULL', 'BEAR')])
+
+    def get_usdt_universe(self) -> List[Dict]:
+        """
+        The `scan_symbols` most traded USDT pairs (one /ticker/24hr call,
+        cached _UNIVERSE_TTL seconds). Their ticker data also warms the price
+        cache, so tapping into a scanned symbol costs no extra price fetch.
+        """
+        pairs, ts = self._universe_cache
+        if pairs is not None and time.time() - ts < self._UNIVERSE_TTL:
+            METRICS.inc('cache_hits', cache='universe')
+            return pairs
+        METRICS.inc('cache_misses', cache='universe')
+        now   = time.time()
+        pairs = []
+        for t in self._binance_get('/ticker/24hr', {}, 80):
+            sym = t.get('symbol', '')
+            if not sym.endswith('USDT') or float(t.get('quoteVolume', 0)) <= 0:
+                continue
+            base = sym[:-4]
+            if not base or base in self._SCAN_EXCLUDE:
+                continue
+            data = {
+                'price':        float(t['lastPrice']),
+                'change_24h':   float(t['priceChangePercent']),
+                'volume':       float(t['volume']),
+                'high_24h':     float(t['highPrice']),
+                'low_24h':      float(t['lowPrice']),
+                'quote_volume': float(t['quoteVolume']),
+                'source':       'Binance',
+            }
+            if data['price'] > 0:
+                pairs.append((base, data))
+        pairs.sort(key=lambda p: p[1]['quote_volume'], reverse=True)
+        pairs = [{'symbol': s, **d} for s, d in pairs[:self.scan_symbols]]
+        for p in pairs:
+            self._price_cache[p['symbol']] = ({k: v for k, v in p.items() if k != 'symbol'}, now)
+        self._universe_cache = (pairs, now)
+        return pairs
+
+    def scan(self, timeframe: str = 'mid') -> Dict:
+        """
+        Score every pair of the USDT universe on `timeframe`. Klines are
+        fetched concurrently through the klines cache and the weight budget;
+        the indicator kernel then runs once over all equal-length histories.
+        The order book is skipped (one depth call per pair), so scores are
+        those of generate_forecast() without the supershort book term.
+        Returns {'timeframe', 'scanned', 'failed', 'results'}, results sorted
+        by |score| and then by 24h quote volume.
+        """
+        if not load_ta():
+            return {'timeframe': timeframe, 'scanned': 0, 'failed': 0, 'results': []}
+        interval, limit, fast_p, slow_p, _ = self.TIMEFRAME_CONFIG[timeframe]
+        universe = self.get_usdt_universe()
+
+        with METRICS.span('scan_klines', tf=timeframe):
+            with ThreadPoolExecutor(max_workers=self._SCAN_FETCHERS,
+                                    thread_name_prefix='scan') as ex:
+                arrays = list(ex.map(lambda p: self._get_klines(p['symbol'], interval, limit),
+                                     universe))
+
+        # New listings have shorter histories — one batch per length
+        groups: Dict[int, List[int]] = {}
+        for i, arr in enumerate(arrays):
+            if arr is not None and len(arr) >= 30:
+                groups.setdefault(len(arr), []).append(i)
+
+        results = []
+        with METRICS.span('scan_kernel', tf=timeframe):
+            for n, idx in groups.items():
+                snapshots = self.analyze_batch([arrays[i] for i in idx],
+                                               min(fast_p, n - 1), min(slow_p, n - 1))
+                for i, ind in zip(idx, snapshots):
+                    pair  = universe[i]
+                    score = self._compute_score(ind, pair['change_24h'], 0)
+                    results.append({
+                        'symbol':         pair['symbol'],
+                        'score':          score,
+                        'recommendation': self._recommendation(score, timeframe),
+                        'price':          pair['price'],
+                        'change_24h':     pair['change_24h'],
+                        'quote_volume':   pair['quote_volume'],
+                        'rsi':            ind.get('rsi'),
+                        'market_regime':  ind.get('market_regime'),
+                    })
+        results.sort(key=lambda r: (-abs(r['score']), -r['quote_volume']))
+        scanned = sum(len(idx) for idx in groups.values())
+        return {'timeframe': timeframe, 'scanned': scanned,
+                'failed': len(universe) - scanned, 'results': results}
+
+
+# ===========================================================================
+# AnalysisPool — indicator math on worker processes
+# ===========================================================================
+def _pool_analyze(shm_name: str, length: int, float32: bool, fast_p: int, slow_p: int) -> Dict:
+    """Worker side: map the candles from shared memory and run the pure indicator math."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        klines = np.ndarray((length,), dtype=kline_dtype(float32), buffer=shm.buf)
+        try:
+            return CryptoAnalyzer.analyze_klines(klines, fast_p, slow_p)
+        finally:
+            del klines                      # release the buffer export before close()
+    finally:
+        shm.close()
+
+
+class AnalysisPool:
+    """
+    Runs CryptoAnalyzer.analyze_klines on `workers` processes. The candle
+    array is copied once into a shared-memory block and only its name crosses
+    the process boundary. If the pool cannot start or breaks, analysis falls
+    back to the calling thread for the rest of the process lifetime.
+    """
+
+    def __init__(self, workers: int):
+        self.workers  = workers
+        self.fallback = False
+        ctx = multiprocessing.get_context('spawn' if sys.platform == 'win32' else 'forkserver')
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                             initializer=load_ta)
+
+    def analyze(self, klines, fast_p: int, slow_p: int) -> Dict:
+        if self.fallback:
+            return CryptoAnalyzer.analyze_klines(klines, fast_p, slow_p)
+        shm = None
+        try:
+            shm  = shared_memory.SharedMemory(create=True, size=max(klines.nbytes, 1))
+            view = np.ndarray(klines.shape, dtype=klines.dtype, buffer=shm.buf)
+            view[:] = klines
+            del view
+            float32 = klines.dtype['close'] == np.float32
+            fut = self._executor.submit(_pool_analyze, shm.name, len(klines), float32,
+                                        fast_p, slow_p)
+            return fut.result()
+        except (BrokenProcessPool, OSError) as e:
+            logger.error(f"Analysis pool unavailable ({e}) — running indicators in-process")
+            self.fallback = True
+            METRICS.inc('pool_fallbacks')
+            return CryptoAnalyzer.analyze_klines(klines, fast_p, slow_p)
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ===========================================================================
+# Admission control — per-user rate limits, global concurrency, priorities
+# ===========================================================================
+class TokenBucket:
+    """Classic token bucket: `rate` tokens/s refill up to `burst`."""
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, rate: float, burst: float):
+        self.rate   = rate
+        self.burst  = burst
+        self.tokens = burst
+        self.stamp  = time.monotonic()
+
+    def take(self, cost: float = 1.0) -> float:
+        """Spend `cost` tokens; returns 0 on success, else seconds until affordable."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp  = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def refund(self, cost: float = 1.0):
+        """Give back tokens spent on a request that was never served."""
+        self.tokens = min(self.burst, self.tokens + cost)
+
+
+class AdmissionController:
+    """
+    Gate in front of every analysis. Each user has a token bucket (a `full`
+    run costs one token per timeframe), at most `max_inflight` analyses run
+    at once, and the rest wait in a priority queue — single-timeframe
+    requests ahead of `full`, FIFO within a priority. Requests are shed when
+    the queue holds `max_queue` entries or after waiting `max_wait` seconds.
+
+        async with admission.admit(user_id, cost=5, priority=PRIORITY_FULL) as verdict:
+            if verdict is not ADMITTED: ...   # RateLimited(retry_after) or BUSY
+
+    Runs on the bot's event loop only, so no locking is needed.
+    """
+    PRIORITY_SINGLE = 0
+    PRIORITY_FULL   = 1
+    ADMITTED = 'admitted'
+    BUSY     = 'busy'
+
+    class RateLimited(float):
+        """Verdict for an empty bucket; the value is the retry-after in seconds."""
+
+    def __init__(self, max_inflight: int = 8, max_queue: int = 50, max_wait: float = 30.0,
+                 user_rate: float = 0.5, user_burst: float = 5.0, max_users: int = 10000):
+        if user_rate <= 0 or user_burst < 1:
+            raise ValueError(f"user_rate must be > 0 and user_burst >= 1 (got {user_rate}, {user_burst})")
+        self.max_inflight = max_inflight
+        self.max_queue    = max_queue
+        self.max_wait     = max_wait
+        self.user_rate    = user_rate
+        self.user_burst   = user_burst
+        self.max_users    = max_users
+        self.inflight     = 0
+        self._buckets: 'OrderedDict[int, TokenBucket]' = OrderedDict()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []   # heap of (priority, seq, future)
+        self._seq = 0
+
+    def _bucket(self, user_id: int) -> TokenBucket:
+        b = self._buckets.get(user_id)
+        if b is None:
+            b = self._buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+        return b
+
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, f in self._waiters if not f.done())
+
+    def _publish(self):
+        METRICS.set('admission_inflight', self.inflight)
+        METRICS.set('admission_queue_depth', self.queue_depth())
+
+    async def _acquire(self, user_id: int, cost: float, priority: int):
+        kind = 'full' if priority == self.PRIORITY_FULL else 'single'
+        # A run dearer than the whole bucket (full with USER_BURST < 5) takes a full bucket.
+        # Tokens go back if the request is then shed or cancelled: only served runs count.
+        bucket = self._bucket(user_id)
+        cost   = min(cost, self.user_burst)
+        retry  = bucket.take(cost)
+        if retry:
+            METRICS.inc('admission', kind=kind, result='rate_limited')
+            return self.RateLimited(retry)
+        if self.inflight < self.max_inflight and not self.queue_depth():
+            self.inflight += 1
+            METRICS.inc('admission', kind=kind, result='admitted')
+            METRICS.observe('admission_wait', 0.0, kind=kind)
+            self._publish()
+            return self.ADMITTED
+        if self.queue_depth() >= self.max_queue:
+            bucket.refund(cost)
+            METRICS.inc('admission', kind=kind, result='shed')
+            return self.BUSY
+
+        fut = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._waiters, (priority, self._seq, fut))
+        self._publish()
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.max_wait)
+        except asyncio.TimeoutError:
+            if not fut.done():
+                fut.cancel()                 # _release skips it; the slot stays free
+                bucket.refund(cost)
+                METRICS.inc('admission', kind=kind, result='timed_out')
+                self._publish()
+                return self.BUSY
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release()              # handed a slot just as we were cancelled
+            else:
+                fut.cancel()
+            bucket.refund(cost)
+            raise
+        # fut was resolved by _release, which already counted us in-flight
+        METRICS.inc('admission', kind=kind, result='admitted')
+        METRICS.observe('admission_wait', time.perf_counter() - t0, kind=kind)
+        return self.ADMITTED
+
+    def _release(self):
+        self.inflight -= 1
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                self.inflight += 1
+                fut.set_result(True)
+                break
+        self._publish()
+
+    @asynccontextmanager
+    async def admit(self, user_id: int, cost: float = 1.0, priority: int = PRIORITY_SINGLE):
+        verdict = await self._acquire(user_id, cost, priority)
+        try:
+            yield verdict
+        finally:
+            if verdict is self.ADMITTED:
+                self._release()
+
+
+# ===========================================================================
+# Subscriptions — candle-close broadcasts
+# ===========================================================================
+class SubscriptionStore:
+    """
+    chat_id → {(symbol, timeframe)}. In memory; with db_path also written
+    through to SQLite and reloaded at start.
+    """
+
+    MAX_PER_CHAT = 10
+
+    def __init__(self, db_path: Optional[str] = None):
+        self._subs: Dict[int, set] = {}
+        self._lock = threading.Lock()
+        self._db   = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS subscriptions "
+                             "(chat_id INTEGER, symbol TEXT, timeframe TEXT,"
+                             " PRIMARY KEY (chat_id, symbol, timeframe))")
+            self._db.commit()
+            self.reload()
+
+    def reload(self):
+        """Re-read the database — picks up rows written by other processes."""
+        if self._db is None:
+            return
+        subs: Dict[int, set] = {}
+        with self._lock:
+            for chat_id, symbol, tf in self._db.execute("SELECT * FROM subscriptions"):
+                subs.setdefault(chat_id, set()).add((symbol, tf))
+            self._subs = subs
+
+    def __len__(self) -> int:
+        return sum(len(s) for s in self._subs.values())
+
+    def for_chat(self, chat_id: int) -> List[Tuple[str, str]]:
+        return sorted(self._subs.get(chat_id, ()))
+
+    def add(self, chat_id: int, symbol: str, timeframe: str) -> bool:
+        with self._lock:
+            subs = self._subs.setdefault(chat_id, set())
+            if (symbol, timeframe) in subs:
+                return False
+            subs.add((symbol, timeframe))
+            if self._db is not None:
+                self._db.execute("INSERT OR IGNORE INTO subscriptions VALUES (?, ?, ?)",
+                                 (chat_id, symbol, timeframe))
+                self._db.commit()
+        return True
+
+    def remove(self, chat_id: int, symbol: Optional[str] = None,
+               timeframe: Optional[str] = None) -> int:
+        """Drop matching subscriptions (None matches anything); returns how many."""
+        with self._lock:
+            subs  = self._subs.get(chat_id, set())
+            drop  = {(s, tf) for s, tf in subs
+                     if symbol in (None, s) and timeframe in (None, tf)}
+            subs -= drop
+            if not subs:
+                self._subs.pop(chat_id, None)
+            if self._db is not None and drop:
+                self._db.executemany("DELETE FROM subscriptions WHERE chat_id = ? AND symbol = ?"
+                                     " AND timeframe = ?", [(chat_id, s, tf) for s, tf in drop])
+                self._db.commit()
+        return len(drop)
+
+    def snapshot(self) -> Dict[int, set]:
+        """Copy of every chat's subscriptions, safe to walk from another thread."""
+        with self._lock:
+            return {c: set(s) for c, s in self._subs.items()}
+
+    def distinct(self, owns=None) -> Dict[Tuple[str, str], List[int]]:
+        """(symbol, timeframe) → subscribed chat ids, limited to chats `owns(chat_id)` accepts."""
+        with self._lock:
+            items = [(c, set(s)) for c, s in self._subs.items()]
+        out: Dict[Tuple[str, str], List[int]] = {}
+        for chat_id, subs in items:
+            if owns is not None and not owns(chat_id):
+                continue
+            for key in subs:
+                out.setdefault(key, []).append(chat_id)
+        return out
+
+
+class BroadcastSender:
+    """
+    Outgoing message queue drained within Telegram's limits: `global_rate`
+    messages/s overall and one message per `chat_interval` seconds per chat
+    (`group_interval` for groups, whose ids are negative). A RetryAfter
+    reply reschedules the message; a chat that blocked or removed the bot is
+    reported to `on_gone` and dropped.
+    """
+
+    def __init__(self, bot, global_rate: float = 25.0, chat_interval: float = 1.0,
+                 group_interval: float = 3.0, max_concurrent: int = 8, on_gone=None):
+        self.bot            = bot
+        self.chat_interval  = chat_interval
+        self.group_interval = group_interval
+        self.on_gone        = on_gone
+        self._bucket    = TokenBucket(global_rate, global_rate)
+        self._heap: List[Tuple[float, int, int, str, Dict]] = []
+        self._chat_next: Dict[int, float] = {}
+        self._seq       = 0
+        self._wake      = asyncio.Event()
+        self._sem       = asyncio.Semaphore(max_concurrent)
+
+    def submit(self, chat_id: int, text: str, **kwargs):
+        now   = time.monotonic()
+        ready = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = ready + (self.group_interval if chat_id < 0 else self.chat_interval)
+        self._seq += 1
+        heapq.heappush(self._heap, (ready, self._seq, chat_id, text, kwargs))
+        METRICS.set('broadcast_queue_depth', len(self._heap))
+        self._wake.set()
+
+    async def run(self):
+        while True:
+            if not self._heap:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            delay = self._heap[0][0] - time.monotonic()
+            if delay > 0:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            wait_s = self._bucket.take()
+            if wait_s:
+                await asyncio.sleep(wait_s)
+                continue
+            _, _, chat_id, text, kwargs = heapq.heappop(self._heap)
+            METRICS.set('broadcast_queue_depth', len(self._heap))
+            await self._sem.acquire()
+            asyncio.create_task(self._send(chat_id, text, kwargs))
+
+    async def _send(self, chat_id: int, text: str, kwargs: Dict):
+        try:
+            with METRICS.span('telegram_send', method='broadcast'):
+                await self.bot.send_message(chat_id, text, **kwargs)
+            METRICS.inc('broadcast_sent')
+        except RetryAfter as e:
+            METRICS.inc('broadcast_retry_after')
+            retry = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+            self._seq += 1
+            heapq.heappush(self._heap, (time.monotonic() + float(retry), self._seq, chat_id, text, kwargs))
+            self._wake.set()
+        except (Forbidden, BadRequest) as e:
+            if isinstance(e, BadRequest) and 'chat not found' not in str(e).lower():
+                logger.error(f"Broadcast to {chat_id} rejected: {e}")
+                return
+            METRICS.inc('broadcast_gone')
+            if self.on_gone:
+                self.on_gone(chat_id)
+        except Exception as e:
+            METRICS.inc('broadcast_errors')
+            logger.error(f"Broadcast to {chat_id} failed: {e}")
+        finally:
+            self._sem.release()
+
 
 # ===========================================================================
 # TelegramBot
 # ===========================================================================
 class TelegramBot:
+    _RENDER_CACHE_SIZE = 512
+    _SHOWN_SIZE        = 4096
+    _PRICE_BUCKET      = 0.001     # render cache price granularity (0.1%)
+    _BROADCAST_GRACE   = 3.0       # seconds after a candle close before broadcasting
+    _BROADCAST_WORKERS = 4         # forecasts computed at once per broadcast tick
+    _BROADCAST_RETRY   = 60.0      # longest wait after a failed tick (and between reloads in webhook mode)
+
     def __init__(self, token: str, binance_api_key=None, binance_secret_key=None,
-                 proxy_url: str = None):
-        self.token    = token
-        self.analyzer = CryptoAnalyzer(binance_api_key, binance_secret_key)
+                 proxy_url: str = None, analyzer: Optional[CryptoAnalyzer] = None,
+                 admin_ids: Optional[List[int]] = None, mem_log_interval: float = 3600,
+                 base_url: Optional[str] = None, concurrent_updates: int = 1,
+                 admission: Optional[AdmissionController] = None,
+                 subscriptions: Optional[SubscriptionStore] = None,
+                 broadcast_rate: float = 25.0, owns=None):
+        self.token     = token
+        self.analyzer  = analyzer or CryptoAnalyzer(binance_api_key, binance_secret_key)
+        self.admin_ids = set(admin_ids or [])
+        self.memory    = MemoryMonitor()
+        self.admission = admission if admission is not None else AdmissionController()
+        # (symbol, timeframe, candle, price bucket) -> (forecast, text); see _render_key
+        self._render_cache: 'OrderedDict[tuple, tuple]' = OrderedDict()
+        # (chat_id, message_id) -> fingerprint of the text + keyboard last sent there
+        self._shown: 'OrderedDict[tuple, int]' = OrderedDict()
+        self.mem_log_interval = mem_log_interval
+
+        # Candle-close broadcasts. `owns(chat_id)` limits them to this
+        # process's chats when several webhook workers share one database.
+        self.subscriptions   = subscriptions if subscriptions is not None else SubscriptionStore()
+        self.broadcast_rate  = broadcast_rate
+        self._owns           = owns
+        self._sender: Optional[BroadcastSender] = None
+        self._subs_changed   = asyncio.Event()
+        # (symbol, timeframe) -> index of the candle that was forming at the last broadcast
+        self._broadcast_candle: Dict[Tuple[str, str], int] = {}
 
         # Use generous timeouts — the default httpx connect timeout (5 s) is
         # too short on some macOS / network setups, causing spurious TimedOut errors.
@@ -728,7 +1874,11 @@ class TelegramBot:
         # Set TELEGRAM_PROXY_URL in your .env file, e.g.:
         #   TELEGRAM_PROXY_URL=http://127.0.0.1:7890      (HTTP proxy / Clash)
         #   TELEGRAM_PROXY_URL=socks5://127.0.0.1:1080    (SOCKS5 / shadowsocks)
-        builder = Application.builder().token(token).request(request)
+        builder = Application.builder().token(token).request(request).post_init(self._post_init)
+        if base_url:     # e.g. a local Bot API server, or a stub for webhook tests
+            builder = builder.base_url(base_url)
+        if concurrent_updates > 1:
+            builder = builder.concurrent_updates(concurrent_updates)
         if proxy_url:
             builder = builder.proxy_url(proxy_url)
             logger.info(f"Using proxy: {proxy_url}")
@@ -736,13 +1886,70 @@ class TelegramBot:
         self._setup_handlers()
 
     def _setup_handlers(self):
-        self.app.add_handler(CommandHandler("start",  self.cmd_start))
-        self.app.add_handler(CommandHandler("help",   self.cmd_help))
-        self.app.add_handler(CommandHandler("conf",   self.cmd_detailed))
-        self.app.add_handler(CommandHandler("status", self.cmd_status))
-        self.app.add_handler(CommandHandler("fng",    self.cmd_fng))
-        self.app.add_handler(CallbackQueryHandler(self.on_timeframe_button, pattern=r'^tf:'))
-        self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.on_message))
+        t = self._timed
+        self.app.add_handler(CommandHandler("start",  t(self.cmd_start)))
+        self.app.add_handler(CommandHandler("help",   t(self.cmd_help)))
+        self.app.add_handler(CommandHandler("conf",   t(self.cmd_detailed)))
+        self.app.add_handler(CommandHandler("status", t(self.cmd_status)))
+        self.app.add_handler(CommandHandler("fng",    t(self.cmd_fng)))
+        self.app.add_handler(CommandHandler("perf",   t(self.cmd_perf)))
+        self.app.add_handler(CommandHandler("mem",    t(self.cmd_mem)))
+        self.app.add_handler(CommandHandler("subscribe",   t(self.cmd_subscribe)))
+        self.app.add_handler(CommandHandler("unsubscribe", t(self.cmd_unsubscribe)))
+        self.app.add_handler(CommandHandler("subs",        t(self.cmd_subs)))
+        self.app.add_handler(CommandHandler("scan",        t(self.cmd_scan)))
+        self.app.add_handler(CallbackQueryHandler(t(self.on_timeframe_button), pattern=r'^tf:'))
+        self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, t(self.on_message)))
+
+    @staticmethod
+    def _timed(handler):
+        """Wrap an update handler in a per-handler latency span."""
+        name = handler.__name__
+
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            with METRICS.span('handler', handler=name):
+                await handler(update, context)
+        return wrapper
+
+    def _is_admin(self, update: Update) -> bool:
+        return bool(update.effective_user) and update.effective_user.id in self.admin_ids
+
+    async def _post_init(self, app: Application):
+        if self.mem_log_interval > 0:
+            app.create_task(self._memory_log_loop())
+        self._sender = BroadcastSender(app.bot, global_rate=self.broadcast_rate,
+                                       on_gone=self._drop_chat)
+        app.create_task(self._sender.run())
+        app.create_task(self._broadcast_loop())
+
+    # ------------------------------------------------------------------
+    # Memory introspection
+    # ------------------------------------------------------------------
+    def _memory_structures(self) -> Dict[str, object]:
+        """
+        Shallow copies of the measured structures, taken on the event loop:
+        deep_sizeof walks them in a worker thread while the loop and the
+        forecast threads keep mutating the originals. dict() of a plain dict
+        is one C-level copy under the GIL; the stores copy under their locks.
+        """
+        a = self.analyzer
+        return {
+            'klines_cache':  dict(a._klines_cache),
+            'fng_cache':     a._fng_cache,
+            'price_cache':   dict(a._price_cache),
+            'render_cache':  dict(self._render_cache),
+            'subscriptions': self.subscriptions.snapshot(),
+            'last_analysis': a.last_analysis.snapshot(),
+        }
+
+    async def _memory_log_loop(self):
+        while True:
+            await asyncio.sleep(self.mem_log_interval)
+            try:
+                sample = await asyncio.to_thread(self.memory.sample, self._memory_structures())
+                logger.info(MemoryMonitor.log_line(sample))
+            except Exception as e:
+                logger.error(f"Memory sample failed: {e}")
 
     # ------------------------------------------------------------------
     # Keyboard builder
@@ -767,6 +1974,10 @@ class TelegramBot:
     # Shared analysis formatter
     # ------------------------------------------------------------------
     def _format_analysis(self, forecast: Dict, timeframe: str) -> str:
+        with METRICS.span('format', tf=timeframe):
+            return self._render_analysis(forecast, timeframe)
+
+    def _render_analysis(self, forecast: Dict, timeframe: str) -> str:
         ind       = forecast['indicators']
         pd_data   = forecast['price_data']
         score     = ind.get('signal_score', 0)
@@ -827,7 +2038,7 @@ class TelegramBot:
     # /start
     # ------------------------------------------------------------------
     async def cmd_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        ta = "✅ Real TA (ta + pandas)" if TA_AVAILABLE else "⚠️ Simplified fallback"
+        ta = "✅ Real TA (NumPy kernels)" if TA_AVAILABLE else "⚠️ Simplified fallback"
         msg = f"""🤖 *Crypto Analysis Bot*
 
 📊 *How to analyse a coin:*
@@ -842,6 +2053,9 @@ Fear & Greed Index · Order Book (supershort)
 *Commands:*
 • /conf — full indicator breakdown of last analysis
 • /fng  — current Fear & Greed Index
+• /scan mid — strongest signals across the market
+• /subscribe BTC mid — update at every candle close
+• /subs — your subscriptions (/unsubscribe to stop)
 • /status — bot info
 • /help — usage guide
 
@@ -883,6 +2097,10 @@ Or type directly: `BTC supershort`, `ETH full`
 *Commands:*
 • /conf — last analysis detail
 • /fng  — Fear & Greed Index
+• /scan `[timeframe]` — top signals across all USDT pairs
+• /subscribe `SYMBOL [timeframe]` — analysis after every candle close
+• /unsubscribe `SYMBOL [timeframe]` or `all`
+• /subs — list subscriptions
 • /status — bot status
 
 ⚠️ _Educational only. Not financial advice._"""
@@ -912,104 +2130,169 @@ Or type directly: `BTC supershort`, `ETH full`
         fng_str = (f"{fng['emoji']} {fng['classification']} ({fng['value']})"
                    if fng else "unavailable")
         cache_entries = len(self.analyzer._klines_cache)
+        pool = self.analyzer.pool
+        adm  = self.admission
+        workers = ("in-process" if pool is None else
+                   f"{pool.workers} processes" + (" (fell back to in-process)" if pool.fallback else ""))
+        p95 = {src: st.percentile(95) for src, st in self.analyzer.price_latency.items()}
+        lat_str = "  ".join(f"{src} {v:.2f}s" if v is not None else f"{src} n/a"
+                            for src, v in p95.items())
+        books = self.analyzer.order_books
+        books_line = (f"📖 Order books:   {books.synced()}/{len(books.symbols)} synced locally\n"
+                      if books is not None else "")
         msg = (f"📊 *Bot Status*\n\n"
                f"🔬 TA Engine:     {ta}\n"
                f"🗄️  Klines cache: {cache_entries} entries\n"
+               f"🧮 Analysis:      {workers}\n"
+               f"🚦 In flight:     {adm.inflight}/{adm.max_inflight}, {adm.queue_depth()} queued\n"
+               f"🔔 Subscriptions: {len(self.subscriptions)}\n"
+               f"{books_line}"
+               f"⏱️  Price p95:    {lat_str}\n"
                f"😱 Fear & Greed:  {fng_str}")
         await update.message.reply_text(msg, parse_mode='Markdown')
 
+    # ------------------------------------------------------------------
+    # /perf — latency percentiles per stage (admin only)
+    # ------------------------------------------------------------------
+    async def cmd_perf(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not self._is_admin(update):
+            await update.message.reply_text("⛔ Admin only.")
+            return
+        rows = METRICS.summary()
+        if not rows:
+            await update.message.reply_text("No timings recorded yet.")
+            return
+        ms = lambda v: f"{v * 1000:7.1f}" if v is not None else "      -"
+        lines = [f"{'stage':<26}{'n':>6}{'p50':>8}{'p95':>8}{'p99':>8}"]
+        for stage, labels, n, p50, p95, p99 in rows[:25]:
+            name = stage + ''.join(f" {v}" for v in labels.values())
+            lines.append(f"{name[:25]:<26}{n:>6}{ms(p50)}{ms(p95)}{ms(p99)}")
+        counters = METRICS.counters() + METRICS.gauges()
+        if counters:
+            lines.append("")
+            for name, labels, v in counters:
+                lines.append(f"{name} {' '.join(labels.values())}: {v:g}")
+        await update.message.reply_text(
+            "⏱️ *Stage latency (ms)*\n```\n" + "\n".join(lines) + "\n```",
+            parse_mode='Markdown')
+
+    # ------------------------------------------------------------------
+    # /mem — RSS, per-structure sizes, top allocation growth (admin only)
+    # ------------------------------------------------------------------
+    async def cmd_mem(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not self._is_admin(update):
+            await update.message.reply_text("⛔ Admin only.")
+            return
+        try:
+            sample = await asyncio.to_thread(self.memory.sample, self._memory_structures())
+        except Exception as e:
+            logger.error(f"Memory sample failed: {e}")
+            await update.message.reply_text(f"❌ Memory sample failed: {e}")
+            return
+        lines = [f"RSS: {sample['rss'] / 2**20:.1f} MB"]
+        if 'traced' in sample:
+            lines.append(f"Traced (tracemalloc): {sample['traced'] / 2**20:.1f} MB")
+        lines.append("")
+        for name, (count, size) in sample['sizes'].items():
+            lines.append(f"{name:<14} {size / 2**10:9.1f} KB"
+                         + (f"  ({count} entries)" if count is not None else ""))
+        if sample['growth']:
+            lines += ["", "Top growth since last sample:"]
+            for site, diff, cnt in sample['growth']:
+                lines.append(f"{diff / 2**10:+9.1f} KB {cnt:+6d}  {site}")
+        elif 'traced' not in sample:
+            lines += ["", "Allocation growth: set MEM_TRACE=1 to enable tracemalloc"]
+        await update.message.reply_text(
+            "🧠 *Memory*\n```\n" + "\n".join(lines) + "\n```", parse_mode='Markdown')
+
     # ------------------------------------------------------------------
     # /conf — detailed last analysis
     # ------------------------------------------------------------------
     async def cmd_detailed(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        user_id = update.effective_user.id
-        if user_id not in self.analyzer.last_analysis:
+        fc = self.analyzer.last_analysis.get(update.effective_user.id)
+        if fc is None:
             await update.message.reply_text(
                 "❌ No recent analysis. Type a ticker first, e.g. `BTC`",
                 parse_mode='Markdown'
             )
             return
 
-        fc  = self.analyzer.last_analysis[user_id]
-        ind = fc['indicators']
-        pd_data = fc['price_data']
-        score = ind.get('signal_score', 0)
+        score = fc.signal_score
 
-        rsi    = ind.get('rsi', 50)
+        rsi    = fc.rsi
         r_desc = "(overbought)" if rsi > 70 else "(oversold)" if rsi < 30 else "(neutral)"
 
-        div = ind.get('rsi_divergence', 0)
+        div = fc.rsi_divergence
         div_str = "📐 Bullish" if div == 1 else "📐 Bearish" if div == -1 else "None"
 
-        bb_sig = ind.get('bb_signal', 'neutral')
-        bb_squeeze = "⚠️ YES" if ind.get('bb_squeeze') else "No"
+        bb_sig = fc.bb_signal
+        bb_squeeze = "⚠️ YES" if fc.bb_squeeze else "No"
 
-        regime = ind.get('market_regime', 'transitioning')
+        regime = fc.market_regime
         regime_emoji_map = {'trending': '📈', 'ranging': '↔️', 'transitioning': '🔄'}
         reg_emoji = regime_emoji_map.get(regime, '🔄')
-        adx_pos = ind.get('adx_pos', 0)
-        adx_neg = ind.get('adx_neg', 0)
+        adx_pos = fc.adx_pos
+        adx_neg = fc.adx_neg
         di_bias = "⬆️ +DI dominant" if adx_pos > adx_neg + 5 else ("⬇️ -DI dominant" if adx_neg > adx_pos + 5 else "≈ balanced")
 
         lines = [
-            f"📈 *Detailed Analysis: {fc['symbol']}/USDT*",
-            f"Timeframe: {fc['timeframe']}",
+            f"📈 *Detailed Analysis: {fc.symbol}/USDT*",
+            f"Timeframe: {fc.timeframe}",
             "",
             "*🧭 Market Regime:*",
             f"• Regime: {reg_emoji} {regime}",
-            f"• ADX:    {ind.get('adx', 0):.1f}  (≥25 trending · ≤15 ranging)",
+            f"• ADX:    {fc.adx:.1f}  (≥25 trending · ≤15 ranging)",
             f"• DI:     +DI={adx_pos:.1f}  -DI={adx_neg:.1f}  → {di_bias}",
             "",
             "*📊 Indicators:*",
             f"• RSI:        {rsi:.1f} {r_desc}",
-            f"• MACD:       {ind.get('macd_signal','neutral')}",
-            f"• EMA Trend:  {ind.get('ema_trend','sideways')} ({ind.get('ema_periods','')})",
-            f"• Volume:     {ind.get('volume_trend','stable')} ({ind.get('volume_ratio',1.0):.2f}× 20p  {ind.get('vol_ratio_100',1.0):.2f}× 100p)",
+            f"• MACD:       {fc.macd_signal}",
+            f"• EMA Trend:  {fc.ema_trend} ({fc.ema_periods})",
+            f"• Volume:     {fc.volume_trend} ({fc.volume_ratio:.2f}× 20p  {fc.vol_ratio_100:.2f}× 100p)",
             "",
             "*📉 Bollinger Bands:*",
-            f"• Upper: ${ind.get('bb_upper',0):.8f}",
-            f"• Middle: ${ind.get('bb_middle',0):.8f}",
-            f"• Lower: ${ind.get('bb_lower',0):.8f}",
-            f"• Width: {ind.get('bb_width',0):.2f}%   Signal: {bb_sig}",
+            f"• Upper: ${fc.bb_upper:.8f}",
+            f"• Middle: ${fc.bb_middle:.8f}",
+            f"• Lower: ${fc.bb_lower:.8f}",
+            f"• Width: {fc.bb_width:.2f}%   Signal: {bb_sig}",
             f"• Squeeze: {bb_squeeze}",
             "",
             "*🛑 ATR Stop-Loss (2×ATR):*",
-            f"• ATR: ${ind.get('atr',0):.8f} ({ind.get('atr_pct',0):.2f}%)",
-            f"• Long SL:  ${ind.get('stop_loss_long',0):.8f}",
-            f"• Short SL: ${ind.get('stop_loss_short',0):.8f}",
+            f"• ATR: ${fc.atr:.8f} ({fc.atr_pct:.2f}%)",
+            f"• Long SL:  ${fc.stop_loss_long:.8f}",
+            f"• Short SL: ${fc.stop_loss_short:.8f}",
             "",
             "*📐 Divergence:* " + div_str,
         ]
 
-        if 'near_support' in ind:
+        if fc.near_support is not None:
             lines += [
                 "",
                 "*📌 Support & Resistance:*",
-                f"• Near Support:    ${ind['near_support']:.8f}"
-                + (f" ({ind['pct_to_support']:.2f}% away)" if 'pct_to_support' in ind else ""),
-                f"• Near Resistance: ${ind['near_resistance']:.8f}"
-                + (f" ({ind['pct_to_resistance']:.2f}% away)" if 'pct_to_resistance' in ind else ""),
+                f"• Near Support:    ${fc.near_support:.8f}"
+                + (f" ({fc.pct_to_support:.2f}% away)" if fc.pct_to_support is not None else ""),
+                f"• Near Resistance: ${fc.near_resistance:.8f}"
+                + (f" ({fc.pct_to_resistance:.2f}% away)" if fc.pct_to_resistance is not None else ""),
             ]
 
-        if 'order_book_bias' in ind:
-            lines.append(f"\n*📖 Order Book:* {ind['order_book_bias']}")
+        if fc.order_book_bias is not None:
+            lines.append(f"\n*📖 Order Book:* {fc.order_book_bias}")
 
-        fng = ind.get('fear_greed')
-        if fng:
-            lines.append(f"\n*😱 Fear & Greed:* {fng['emoji']} {fng['classification']} ({fng['value']}/100)")
+        if fc.fng_value is not None:
+            lines.append(f"\n*😱 Fear & Greed:* {fc.fng_emoji} {fc.fng_class} ({fc.fng_value}/100)")
 
         lines += [
             "",
             f"*⚡ Signal Score: {score:+d}*",
-            f"*📋 Recommendation: {fc['recommendation']}*",
-            f"Probability: {fc['probability']}%",
+            f"*📋 Recommendation: {fc.recommendation}*",
+            f"Probability: {fc.probability}%",
             "",
             "*💰 Price:*",
-            f"• Current: ${fc['current_price']:.8f}",
-            f"• Target:  ${fc['target_price']:.8f}",
-            f"• 24h High: ${pd_data.get('high_24h',0):.8f}",
-            f"• 24h Low:  ${pd_data.get('low_24h',0):.8f}",
-            f"• 24h Change: {pd_data.get('change_24h',0):+.2f}%",
+            f"• Current: ${fc.current_price:.8f}",
+            f"• Target:  ${fc.target_price:.8f}",
+            f"• 24h High: ${fc.high_24h:.8f}",
+            f"• 24h Low:  ${fc.low_24h:.8f}",
+            f"• 24h Change: {fc.change_24h:+.2f}%",
             "",
             "⚠️ _Educational only. DYOR._",
         ]
@@ -1039,10 +2322,12 @@ Or type directly: `BTC supershort`, `ETH full`
             )
             return
 
+        uid = update.effective_user.id if update.effective_user else 0
         if timeframe == 'full':
-            await self._send_full_analysis(update.message, symbol)
+            await self._send_full_analysis(update.message, symbol, user_id=uid)
         else:
-            await self._send_analysis(update.message, symbol, timeframe, show_keyboard=True)
+            await self._send_analysis(update.message, symbol, timeframe, show_keyboard=True,
+                                      user_id=uid)
 
     # ------------------------------------------------------------------
     # Inline button callback
@@ -1053,57 +2338,159 @@ Or type directly: `BTC supershort`, `ETH full`
         _, symbol, timeframe = query.data.split(':')
 
         if timeframe == 'full':
-            await self._send_full_analysis(query.message, symbol)
+            await self._send_full_analysis(query.message, symbol,
+                                           user_id=query.from_user.id if query.from_user else 0)
         else:
             await self._edit_analysis(query, symbol, timeframe)
 
     # ------------------------------------------------------------------
     # Internal send/edit helpers
     # ------------------------------------------------------------------
+    @staticmethod
+    def _busy_text(verdict) -> str:
+        if isinstance(verdict, AdmissionController.RateLimited):
+            if math.isinf(verdict):
+                return "⏳ Easy there — you have used up your analyses for now."
+            return f"⏳ Easy there — you can run another analysis in {math.ceil(verdict)}s."
+        return "🚦 The bot is busy right now — please try again in a minute."
+
+    # ------------------------------------------------------------------
+    # Render cache — identical (symbol, timeframe, candle, price bucket)
+    # requests reuse one forecast and its rendered text
+    # ------------------------------------------------------------------
+    def _render_key(self, symbol: str, timeframe: str, fetch: bool = True) -> Optional[tuple]:
+        """
+        Blocking with `fetch` (may fetch the price); call via asyncio.to_thread.
+        Without it only a price already fetched during the current candle is
+        used, and None is returned if there is none.
+        """
+        cfg    = self.analyzer.TIMEFRAME_CONFIG.get(timeframe, self.analyzer.TIMEFRAME_CONFIG['mid'])
+        step   = INTERVAL_MS[cfg[0]]
+        candle = int(time.time() * 1000) // step
+        price  = (self.analyzer.get_price_data(symbol) if fetch
+                  else self.analyzer.cached_price(symbol, since=candle * step / 1000))
+        if not price or price['price'] <= 0:
+            return None
+        bucket = math.floor(math.log(price['price']) / math.log1p(self._PRICE_BUCKET))
+        return symbol, timeframe, candle, bucket
+
+    def _render_get(self, key: Optional[tuple]) -> Optional[tuple]:
+        hit = self._render_cache.get(key) if key else None
+        if hit is not None:
+            self._render_cache.move_to_end(key)
+        METRICS.inc('cache_hits' if hit else 'cache_misses', cache='render')
+        return hit
+
+    def _render_put(self, key: Optional[tuple], forecast: Dict, text: str):
+        if key is None:
+            return
+        self._render_cache[key] = (forecast, text)
+        if len(self._render_cache) > self._RENDER_CACHE_SIZE:
+            self._render_cache.popitem(last=False)
+
+    def _is_shown(self, message, fingerprint: int) -> bool:
+        """True if `message` already shows exactly this text and keyboard."""
+        return self._shown.get((message.chat_id, message.message_id)) == fingerprint
+
+    def _mark_shown(self, message, fingerprint: int):
+        """Record what `message` now shows — only once Telegram has confirmed it."""
+        key = (message.chat_id, message.message_id)
+        self._shown[key] = fingerprint
+        self._shown.move_to_end(key)
+        if len(self._shown) > self._SHOWN_SIZE:
+            self._shown.popitem(last=False)
+
+    async def _forecast_text(self, reply, symbol: str, timeframe: str,
+                             user_id: int) -> Optional[Tuple[Optional[Dict], str]]:
+        """
+        (forecast, text) from the render cache, or computed under admission
+        control. None if the request was turned away (`reply` already told
+        the user); (None, '') if no data could be fetched.
+
+        A render computed this candle from the last fetched price is reused
+        without a new price fetch, so repeat taps make no HTTP call. Cache
+        hits are not charged to the user's token bucket: admission control
+        guards the upstream work, and a hit costs none.
+        """
+        key = self._render_key(symbol, timeframe, fetch=False)
+        if key not in self._render_cache:
+            key = await asyncio.to_thread(self._render_key, symbol, timeframe)
+        hit = self._render_get(key)
+        if hit is not None:
+            return hit
+        async with self.admission.admit(user_id) as verdict:
+            if verdict is not AdmissionController.ADMITTED:
+                await reply(self._busy_text(verdict))
+                return None
+            forecast = await asyncio.to_thread(self.analyzer.generate_forecast, symbol, timeframe)
+        if not forecast:
+            return None, ''
+        text = self._format_analysis(forecast, timeframe)
+        self._render_put(key, forecast, text)
+        return forecast, text
+
     async def _send_analysis(self, message, symbol: str, timeframe: str,
-                              show_keyboard: bool = False):
+                              show_keyboard: bool = False, user_id: int = 0):
         try:
             await message.reply_chat_action('typing')
-            forecast = self.analyzer.generate_forecast(symbol, timeframe)
+            result = await self._forecast_text(message.reply_text, symbol, timeframe, user_id)
+            if result is None:
+                return
+            forecast, text = result
             if not forecast:
                 await message.reply_text(f"❌ Could not fetch data for {symbol}/USDT.")
                 return
 
             # Store for /conf
             if hasattr(message, 'from_user') and message.from_user:
-                self.analyzer.last_analysis[message.from_user.id] = forecast
+                self.analyzer.last_analysis.put(message.from_user.id, forecast)
 
-            text    = self._format_analysis(forecast, timeframe)
             kb      = self._timeframe_keyboard(symbol) if show_keyboard else None
-            await message.reply_text(text, parse_mode='Markdown', reply_markup=kb)
+            with METRICS.span('telegram_send', method='reply'):
+                sent = await message.reply_text(text, parse_mode='Markdown', reply_markup=kb)
+            if kb is not None:
+                self._mark_shown(sent, hash((text, kb.to_json())))
         except Exception as e:
             logger.error(f"Error in _send_analysis: {e}")
             await message.reply_text("❌ Error running analysis.")
 
     async def _edit_analysis(self, query, symbol: str, timeframe: str):
         try:
-            await query.message.reply_chat_action('typing')
-            forecast = self.analyzer.generate_forecast(symbol, timeframe)
+            uid    = query.from_user.id if query.from_user else 0
+            result = await self._forecast_text(query.message.reply_text, symbol, timeframe, uid)
+            if result is None:
+                return
+            forecast, text = result
             if not forecast:
                 await query.edit_message_text(f"❌ Could not fetch data for {symbol}/USDT.")
                 return
 
             # Store for /conf using the callback query user
             if query.from_user:
-                self.analyzer.last_analysis[query.from_user.id] = forecast
-
-            text = self._format_analysis(forecast, timeframe)
-            kb   = self._timeframe_keyboard(symbol)
-            await query.edit_message_text(text, parse_mode='Markdown', reply_markup=kb)
+                self.analyzer.last_analysis.put(query.from_user.id, forecast)
+
+            kb = self._timeframe_keyboard(symbol)
+            # Same text and keyboard as already shown → Telegram would answer
+            # "message is not modified"; skip the round trip.
+            fingerprint = hash((text, kb.to_json()))
+            if self._is_shown(query.message, fingerprint):
+                METRICS.inc('edits_skipped')
+                return
+            with METRICS.span('telegram_send', method='edit'):
+                try:
+                    await query.edit_message_text(text, parse_mode='Markdown', reply_markup=kb)
+                except BadRequest as e:
+                    if 'not modified' not in str(e).lower():
+                        raise
+                    METRICS.inc('edits_skipped')
+            # Only after success: a failed edit (timeout, network, flood wait)
+            # leaves the old view up, so the next tap must retry it
+            self._mark_shown(query.message, fingerprint)
         except Exception as e:
             logger.error(f"Error in _edit_analysis: {e}")
 
-    async def _send_full_analysis(self, message, symbol: str):
+    async def _send_full_analysis(self, message, symbol: str, user_id: int = 0):
         try:
-            await message.reply_chat_action('typing')
-            await message.reply_text(f"🔍 Running all timeframes for *{symbol}*…",
-                                     parse_mode='Markdown')
-
             timeframes = ['supershort', 'short', 'mid', 'long', 'ulong']
             tf_labels  = {
                 'supershort': '⚡ SS (1–15m)',
@@ -1115,9 +2502,23 @@ Or type directly: `BTC supershort`, `ETH full`
             lines = [f"🔥 *FULL ANALYSIS: {symbol}/USDT*",
                      f"⏰ {datetime.now().strftime('%H:%M:%S')}", ""]
 
+            # One admission slot, one token per timeframe, queued behind single
+            # requests. All timeframes run concurrently; with an AnalysisPool
+            # their math also lands on separate cores.
+            async with self.admission.admit(user_id, cost=len(timeframes),
+                                            priority=AdmissionController.PRIORITY_FULL) as verdict:
+                if verdict is not AdmissionController.ADMITTED:
+                    await message.reply_text(self._busy_text(verdict))
+                    return
+                await message.reply_chat_action('typing')
+                await message.reply_text(f"🔍 Running all timeframes for *{symbol}*…",
+                                         parse_mode='Markdown')
+                forecasts = await asyncio.gather(*(
+                    asyncio.to_thread(self.analyzer.generate_forecast, symbol, tf)
+                    for tf in timeframes))
+
             last_fc = None
-            for tf in timeframes:
-                fc = self.analyzer.generate_forecast(symbol, tf)
+            for tf, fc in zip(timeframes, forecasts):
                 if not fc:
                     lines.append(f"{tf_labels[tf]}: ❌ Error\n")
                     continue
@@ -1144,69 +2545,679 @@ Or type directly: `BTC supershort`, `ETH full`
                     lines.append(f"{fng['emoji']} Sentiment: {fng['classification']} ({fng['value']}/100)")
 
             lines.append("\n⚠️ _Educational only._")
-            await message.reply_text("\n".join(lines), parse_mode='Markdown')
+            with METRICS.span('telegram_send', method='reply'):
+                await message.reply_text("\n".join(lines), parse_mode='Markdown')
 
         except Exception as e:
             logger.error(f"Full analysis error: {e}")
             await message.reply_text("❌ Error generating full analysis.")
 
+    # ------------------------------------------------------------------
+    # /scan — strongest signals across the USDT market
+    # ------------------------------------------------------------------
+    _SCAN_TOP = 10
+
+    async def cmd_scan(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        args      = context.args or []
+        timeframe = args[0].lower() if args else 'mid'
+        cfg       = self.analyzer.TIMEFRAME_CONFIG
+        if timeframe not in cfg:
+            await update.message.reply_text("Usage: `/scan [supershort|short|mid|long|ulong]`",
+                                            parse_mode='Markdown')
+            return
+        uid = update.effective_user.id if update.effective_user else 0
+        async with self.admission.admit(uid, cost=5,
+                                        priority=AdmissionController.PRIORITY_FULL) as verdict:
+            if verdict is not AdmissionController.ADMITTED:
+                await update.message.reply_text(self._busy_text(verdict))
+                return
+            await update.message.reply_chat_action('typing')
+            t0 = time.perf_counter()
+            try:
+                scan = await asyncio.to_thread(self.analyzer.scan, timeframe)
+            except Exception as e:
+                logger.error(f"Scan failed ({timeframe}): {e}")
+                await update.message.reply_text("❌ Market scan failed — try again shortly.")
+                return
+            elapsed = time.perf_counter() - t0
+
+        threshold = 2 if timeframe == 'supershort' else 3
+        hits  = [r for r in scan['results'] if abs(r['score']) >= threshold][:self._SCAN_TOP]
+        lines = [f"🔎 *Scan: {timeframe} ({cfg[timeframe][0]})* — "
+                 f"{scan['scanned']} pairs in {elapsed:.1f}s", ""]
+        if not hits:
+            lines.append(f"No pairs with |score| ≥ {threshold} right now.")
+        for r in hits:
+            direction = "📈" if r['score'] > 0 else "📉"
+            lines.append(f"{direction} *{r['symbol']}* {r['recommendation']} | Score {r['score']:+d} | "
+                         f"RSI {r['rsi']:.0f} | {r['market_regime']} | "
+                         f"${r['price']:.8g} ({r['change_24h']:+.1f}%)")
+        if scan['failed']:
+            lines.append(f"\n_{scan['failed']} pairs skipped (no data)._")
+        lines.append("\nType a ticker for the full analysis. ⚠️ _Educational only._")
+        await update.message.reply_text("\n".join(lines), parse_mode='Markdown')
+
+    # ------------------------------------------------------------------
+    # /subscribe, /unsubscribe, /subs
+    # ------------------------------------------------------------------
+    _SUB_USAGE = ("Usage: `/subscribe BTC [supershort|short|mid|long|ulong]`\n"
+                  "An analysis is posted here every time that timeframe's candle closes.")
+
+    async def cmd_subscribe(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        args = context.args or []
+        symbol, timeframe = self._parse_request(" ".join(args[:2])) if args else (None, None)
+        if not symbol or timeframe == 'full':
+            await update.message.reply_text(self._SUB_USAGE, parse_mode='Markdown')
+            return
+        chat_id = update.effective_chat.id
+        if len(args) > 2:      # admins may subscribe a channel or group the bot posts in
+            if not self._is_admin(update):
+                await update.message.reply_text("⛔ Only admins can subscribe another chat.")
+                return
+            try:
+                chat_id = int(args[2])
+            except ValueError:
+                await update.message.reply_text("❌ Chat id must be numeric, e.g. `-1001234567890`.",
+                                                parse_mode='Markdown')
+                return
+        if len(self.subscriptions.for_chat(chat_id)) >= SubscriptionStore.MAX_PER_CHAT:
+            await update.message.reply_text(
+                f"❌ Limit reached ({SubscriptionStore.MAX_PER_CHAT} per chat) — /unsubscribe something first.")
+            return
+        if not await asyncio.to_thread(self.analyzer.get_price_data, symbol):
+            await update.message.reply_text(f"❌ Could not fetch data for {symbol}/USDT.")
+            return
+
+        added    = await asyncio.to_thread(self.subscriptions.add, chat_id, symbol, timeframe)
+        interval = self.analyzer.TIMEFRAME_CONFIG[timeframe][0]
+        self._subs_changed.set()
+        if added:
+            await update.message.reply_text(
+                f"🔔 Subscribed to *{symbol}* {timeframe} — an update follows every {interval} candle close.",
+                parse_mode='Markdown')
+        else:
+            await update.message.reply_text(f"Already subscribed to *{symbol}* {timeframe}.",
+                                            parse_mode='Markdown')
+
+    async def cmd_unsubscribe(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        args    = context.args or []
+        chat_id = update.effective_chat.id
+        if args and args[0].lower() == 'all':
+            symbol = timeframe = None
+        else:
+            symbol, timeframe = self._parse_request(" ".join(args[:2])) if args else (None, None)
+            if not symbol:
+                await update.message.reply_text("Usage: `/unsubscribe BTC [timeframe]` or `/unsubscribe all`",
+                                                parse_mode='Markdown')
+                return
+            if len(args) < 2:
+                timeframe = None           # bare symbol → every timeframe of it
+        removed = await asyncio.to_thread(self.subscriptions.remove, chat_id, symbol, timeframe)
+        self._subs_changed.set()
+        await update.message.reply_text(f"🔕 Removed {removed} subscription(s)." if removed
+                                        else "No matching subscriptions.")
+
+    async def cmd_subs(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        subs = self.subscriptions.for_chat(update.effective_chat.id)
+        if not subs:
+            await update.message.reply_text("No subscriptions. Try `/subscribe BTC mid`.",
+                                            parse_mode='Markdown')
+            return
+        cfg   = self.analyzer.TIMEFRAME_CONFIG
+        lines = ["🔔 *Subscriptions*", ""]
+        lines += [f"• *{s}* {tf} — every {cfg[tf][0]} close" for s, tf in subs]
+        await update.message.reply_text("\n".join(lines), parse_mode='Markdown')
+
+    # ------------------------------------------------------------------
+    # Candle-close broadcasts — each distinct (symbol, timeframe) is
+    # analysed once per close, however many chats follow it
+    # ------------------------------------------------------------------
+    def _drop_chat(self, chat_id: int):
+        removed = self.subscriptions.remove(chat_id)
+        logger.info(f"Chat {chat_id} is gone — dropped {removed} subscription(s)")
+
+    def _next_broadcast_delay(self, keys) -> Optional[float]:
+        """Seconds until the earliest upcoming candle close (plus grace) among `keys`."""
+        now_ms = time.time() * 1000
+        steps  = {INTERVAL_MS[self.analyzer.TIMEFRAME_CONFIG[tf][0]] for _, tf in keys}
+        if not steps:
+            return None
+        wait_ms = min(step - now_ms % step for step in steps)
+        return wait_ms / 1000 + self._BROADCAST_GRACE
+
+    async def _broadcast_loop(self):
+        keys = ()
+        while True:
+            failed = False
+            try:
+                keys = await self._broadcast_tick()
+            except Exception as e:
+                logger.error(f"Broadcast tick failed: {e}")
+                failed = True                # keep the last tick's keys and retry soon
+            delay = self._next_broadcast_delay(keys)
+            if failed or self._owns is not None:   # other workers may write subscriptions we own
+                delay = min(delay or self._BROADCAST_RETRY, self._BROADCAST_RETRY)
+            self._subs_changed.clear()
+            try:
+                await asyncio.wait_for(self._subs_changed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _broadcast_tick(self):
+        """Broadcast every (symbol, timeframe) whose candle closed since the last tick; returns all keys."""
+        if self._owns is not None:
+            await asyncio.to_thread(self.subscriptions.reload)
+        targets = self.subscriptions.distinct(self._owns)
+        now_ms  = int(time.time() * 1000)
+        due: Dict[Tuple[str, str], List[int]] = {}
+        for key, chats in targets.items():
+            candle = now_ms // INTERVAL_MS[self.analyzer.TIMEFRAME_CONFIG[key[1]][0]]
+            last   = self._broadcast_candle.setdefault(key, candle)   # new keys wait for the next close
+            if candle > last:
+                self._broadcast_candle[key] = candle
+                due[key] = chats
+        for key in set(self._broadcast_candle) - set(targets):
+            del self._broadcast_candle[key]
+        if not due:
+            return targets.keys()
+
+        sem = asyncio.Semaphore(self._BROADCAST_WORKERS)
+
+        async def compute(key):
+            async with sem:
+                return await self._broadcast_forecast(*key)
+
+        with METRICS.span('broadcast'):
+            results = await asyncio.gather(*(compute(k) for k in due), return_exceptions=True)
+        per_chat: Dict[int, List[tuple]] = {}
+        for (key, chats), res in zip(due.items(), results):
+            if isinstance(res, BaseException) or res is None:
+                METRICS.inc('broadcast_failed')
+                logger.error(f"Broadcast forecast failed for {key}: {res!r}")
+                continue
+            for chat_id in chats:
+                per_chat.setdefault(chat_id, []).append((key, res))
+        METRICS.inc('broadcast_computed', len(due))
+        for chat_id, items in per_chat.items():
+            self._sender.submit(chat_id, self._broadcast_text(items), parse_mode='Markdown')
+        logger.info(f"Broadcast: {len(due)} forecast(s) → {len(per_chat)} chat(s)")
+        return targets.keys()
+
+    async def _broadcast_forecast(self, symbol: str, timeframe: str) -> Optional[tuple]:
+        """(forecast, text) for a just-closed candle, shared with on-demand requests via the render cache."""
+        key = await asyncio.to_thread(self._render_key, symbol, timeframe)
+        hit = self._render_get(key)
+        if hit is not None:
+            return hit
+        forecast = await asyncio.to_thread(self.analyzer.generate_forecast, symbol, timeframe)
+        if not forecast:
+            return None
+        text = self._format_analysis(forecast, timeframe)
+        self._render_put(key, forecast, text)
+        return forecast, text
+
+    def _broadcast_text(self, items: List[tuple]) -> str:
+        """One message per chat: the full analysis for a single subscription, one line each otherwise."""
+        cfg = self.analyzer.TIMEFRAME_CONFIG
+        if len(items) == 1:
+            (symbol, tf), (_, text) = items[0]
+            return f"🔔 *{symbol}/USDT* — {cfg[tf][0]} candle closed\n\n{text}"
+        lines = ["🔔 *Candle close*", ""]
+        for (symbol, tf), (fc, _) in items:
+            direction = "📈" if fc['target_price'] >= fc['current_price'] else "📉"
+            score     = fc['indicators'].get('signal_score', 0)
+            lines.append(f"{direction} *{symbol}* {tf} ({cfg[tf][0]}): *{fc['recommendation']}* | "
+                         f"Score {score:+d} | {fc['probability']}% | ${fc['current_price']:.8g}")
+        lines.append("\n⚠️ _Educational only._")
+        return "\n".join(lines)
+
     def run(self):
         logger.info("Starting Crypto Analysis Bot…")
         self.app.run_polling(allowed_updates=Update.ALL_TYPES)
 
+    async def serve_queue(self, queue):
+        """
+        Webhook worker loop: feed raw update bodies from `queue` (a
+        multiprocessing queue filled by WebhookServer) into the Application
+        until a None sentinel arrives.
+        """
+        app = self.app
+        await app.initialize()
+        await self._post_init(app)
+        await app.start()
+        try:
+            while True:
+                body = await asyncio.to_thread(queue.get)
+                if body is None:
+                    break
+                try:
+                    update = Update.de_json(json.loads(body), app.bot)
+                except Exception as e:               # fields of the wrong type fail anywhere in de_json
+                    logger.error(f"Dropping malformed update: {e!r}")
+                    continue
+                await app.update_queue.put(update)
+        finally:
+            await app.stop()
+            await app.shutdown()
+
+
+# ===========================================================================
+# Webhook mode — front HTTP server fanning updates out to worker processes
+# ===========================================================================
+def _route_key(update: Dict) -> int:
+    """Chat (else sender) id of an update, so one chat always lands on one worker."""
+    for field, obj in update.items():
+        if not isinstance(obj, dict):
+            continue
+        msg  = obj.get('message')
+        chat = obj.get('chat') or (msg.get('chat') if isinstance(msg, dict) else None)
+        if isinstance(chat, dict) and 'id' in chat:
+            return int(chat['id'])
+        sender = obj.get('from')
+        if isinstance(sender, dict) and 'id' in sender:
+            return int(sender['id'])
+    return int(update.get('update_id', 0))
+
+
+def _webhook_worker(idx: int, queue, cfg: Dict):
+    """Worker process entry: its own analyzer + Application, fed from `queue`."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)     # the front process stops us via a sentinel
+    # Analysis, cache and Telegram metrics live here, not in the front
+    # process: each worker serves its own on METRICS_PORT + 1 + idx
+    if cfg['metrics_port']:
+        try:
+            start_metrics_server(int(cfg['metrics_port']) + 1 + idx)
+        except OSError as e:
+            logger.error(f"Worker {idx} metrics endpoint failed: {e}")
+    if cfg['mem_trace']:
+        MemoryMonitor.start_tracing(cfg['mem_trace'])
+    preload_ta()
+    bot, pool = _build_bot(dict(cfg, worker_index=idx))
+    logger.info(f"Webhook worker {idx} ready (pid {os.getpid()})")
+    try:
+        asyncio.run(bot.serve_queue(queue))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+class WebhookServer:
+    """
+    Receives Telegram webhook POSTs on host:port/path, checks the secret
+    token, and hands the raw body to one of `workers` processes chosen by
+    chat id. Replies go straight from the workers to the Bot API. A worker
+    that died is respawned on its next update. GET /healthz reports liveness.
+    """
+
+    def __init__(self, cfg: Dict, workers: int = 2, host: str = '127.0.0.1',
+                 port: int = 8443, path: str = '/telegram', secret: Optional[str] = None,
+                 order_books=None):
+        # order_books (a SharedImbalance) is handed to every worker in its cfg
+        self.cfg     = cfg if order_books is None else dict(cfg, order_books=order_books)
+        self.host    = host
+        self.port    = port
+        self.path    = path
+        self.secret  = secret
+        self._ctx    = multiprocessing.get_context('spawn' if sys.platform == 'win32' else 'forkserver')
+        self._queues = [self._ctx.Queue() for _ in range(workers)]
+        self._procs: List = [None] * workers
+        self._lock   = threading.Lock()
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    def _spawn(self, idx: int):
+        proc = self._ctx.Process(target=_webhook_worker, name=f'webhook-{idx}',
+                                 args=(idx, self._queues[idx], self.cfg))
+        proc.start()
+        self._procs[idx] = proc
+
+    def dispatch(self, body: bytes) -> int:
+        """Queue one update body; returns the worker index it went to. ValueError if malformed."""
+        update = json.loads(body)
+        if not isinstance(update, dict):
+            raise ValueError("update is not a JSON object")
+        idx = _route_key(update) % len(self._queues)
+        with self._lock:
+            if not self._procs[idx].is_alive():
+                logger.error(f"Webhook worker {idx} died (exit {self._procs[idx].exitcode}) — respawning")
+                METRICS.inc('webhook_respawns')
+                self._spawn(idx)
+        self._queues[idx].put(body)
+        METRICS.inc('webhook_updates', worker=str(idx))
+        return idx
+
+    def alive(self) -> int:
+        return sum(1 for p in self._procs if p is not None and p.is_alive())
+
+    def start(self) -> ThreadingHTTPServer:
+        for idx in range(len(self._queues)):
+            self._spawn(idx)
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path.split('?')[0] != server.path:
+                    self.send_error(404)
+                    return
+                if server.secret and self.headers.get('X-Telegram-Bot-Api-Secret-Token') != server.secret:
+                    self.send_error(403)
+                    return
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                try:
+                    server.dispatch(body)
+                except (ValueError, TypeError):
+                    self.send_error(400)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/healthz':
+                    self.send_error(404)
+                    return
+                body = json.dumps({'workers': len(server._procs), 'alive': server.alive()}).encode()
+                self.send_response(200 if server.alive() == len(server._procs) else 503)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _Handler)
+        logger.info(f"Webhook endpoint: http://{self.host}:{self.port}{self.path} "
+                    f"→ {len(self._queues)} workers")
+        return self._httpd
+
+    def serve_forever(self):
+        def _interrupt(signum, frame):
+            raise KeyboardInterrupt
+        signal.signal(signal.SIGTERM, _interrupt)    # systemd/docker stop → drain workers too
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self, timeout: float = 10.0):
+        if self._httpd is not None:
+            self._httpd.server_close()
+        for q in self._queues:
+            q.put(None)
+        for proc in self._procs:
+            if proc is not None:
+                proc.join(timeout)
+                if proc.is_alive():
+                    proc.terminate()
+
+
+def _set_webhook(token: str, url: str, secret: Optional[str], proxy_url: Optional[str],
+                 base_url: str) -> bool:
+    """Register `url` with Telegram (setWebhook) so updates are pushed to us."""
+    try:
+        resp = requests.post(
+            f"{base_url}{token}/setWebhook",
+            json={'url': url, 'secret_token': secret, 'allowed_updates': Update.ALL_TYPES}
+                 if secret else {'url': url, 'allowed_updates': Update.ALL_TYPES},
+            timeout=20,
+            proxies={'https': proxy_url} if proxy_url else None,
+        )
+        data = resp.json()
+        if data.get('ok'):
+            print(f"✅ Webhook registered: {url}")
+            return True
+        print(f"❌ setWebhook failed: {data.get('description')}")
+    except requests.exceptions.RequestException as e:
+        print(f"❌ setWebhook failed: {e}")
+    return False
+
 
 # ===========================================================================
 # Entry point
 # ===========================================================================
+def _read_config() -> Dict:
+    """All .env / environment settings, read once in the launching process."""
+    return {
+        'token':            os.getenv('TELEGRAM_BOT_TOKEN'),
+        'binance_api_key':  os.getenv('BINANCE_API_KEY'),
+        'binance_secret':   os.getenv('BINANCE_SECRET'),
+        'proxy_url':        os.getenv('TELEGRAM_PROXY_URL'),     # optional
+        'base_url':         os.getenv('TELEGRAM_API_BASE_URL'),  # optional, e.g. http://127.0.0.1:8081/bot
+        'hedge_delay':      os.getenv('PRICE_HEDGE_DELAY'),      # optional, seconds; unset = adaptive p95
+        'price_budget':     float(os.getenv('PRICE_BUDGET', '20')),
+        'admin_ids':        [int(x) for x in os.getenv('ADMIN_USER_IDS', '').split(',') if x.strip()],
+        'metrics_port':     os.getenv('METRICS_PORT'),           # optional, e.g. 9108
+        'mem_log_interval': float(os.getenv('MEM_LOG_INTERVAL', '3600')),   # 0 disables
+        'mem_trace':        int(os.getenv('MEM_TRACE', '0')),    # tracemalloc frames; 0 = off
+        'analysis_db':      os.getenv('ANALYSIS_DB'),            # optional SQLite path for /conf
+        'analysis_max':     int(os.getenv('ANALYSIS_MAX_USERS', '5000')),
+        'analysis_ttl':     float(os.getenv('ANALYSIS_TTL', '86400')),
+        'klines_db':        os.getenv('KLINES_DB'),              # optional SQLite path for warm restarts
+        'klines_float32':   os.getenv('KLINES_FLOAT32', '0') == '1',    # halve cached candle memory
+        'analysis_workers': int(os.getenv('ANALYSIS_WORKERS', '0')),    # 0 = indicator math in-process
+        'shared_cache_db':  os.getenv('SHARED_CACHE_DB'),        # cross-process kline cache
+        'webhook_port':     os.getenv('WEBHOOK_PORT'),           # set → webhook mode instead of polling
+        'webhook_host':     os.getenv('WEBHOOK_HOST', '127.0.0.1'),
+        'webhook_path':     os.getenv('WEBHOOK_PATH', '/telegram'),
+        'webhook_url':      os.getenv('WEBHOOK_URL'),            # public URL to register with Telegram
+        'webhook_secret':   os.getenv('WEBHOOK_SECRET'),
+        'webhook_workers':  int(os.getenv('WEBHOOK_WORKERS', '2')),
+        'concurrent_updates': int(os.getenv('CONCURRENT_UPDATES',      # handlers running at once
+                                            os.getenv('WEBHOOK_CONCURRENCY', '32'))),  # former name
+        'max_inflight':     int(os.getenv('MAX_INFLIGHT_ANALYSES', '8')),
+        'max_queue':        int(os.getenv('MAX_QUEUED_ANALYSES', '50')),
+        'max_queue_wait':   float(os.getenv('MAX_QUEUE_WAIT', '30')),
+        'user_rate':        float(os.getenv('USER_RATE', '0.5')),      # tokens/s; a timeframe costs 1
+        'user_burst':       float(os.getenv('USER_BURST', '5')),
+        'scan_symbols':     int(os.getenv('SCAN_SYMBOLS', '200')),   # /scan universe size
+        'binance_weight':   int(os.getenv('BINANCE_WEIGHT_LIMIT', '5000')),  # per minute; Binance allows 6000
+        'order_book_symbols': [s.strip().upper() for s in os.getenv('ORDER_BOOK_SYMBOLS', '').split(',')
+                               if s.strip()],               # local books from the depth stream
+        'subscriptions_db': os.getenv('SUBSCRIPTIONS_DB'),       # optional SQLite path for /subscribe
+        'broadcast_rate':   float(os.getenv('BROADCAST_RATE', '25')),  # messages/s across all chats
+    }
+
+
+def _weight_limiter(cfg: Dict) -> WeightLimiter:
+    """
+    BINANCE_WEIGHT_LIMIT caps the whole IP. In webhook mode each process may
+    reserve 1/N of it itself, but the server's IP-wide count is checked
+    against the full limit — not against that share.
+    """
+    n = cfg['webhook_workers'] if cfg['webhook_port'] else 1
+    return WeightLimiter(cfg['binance_weight'], share=cfg['binance_weight'] // n)
+
+
+def _build_bot(cfg: Dict) -> Tuple['TelegramBot', Optional[AnalysisPool]]:
+    """Analyzer + bot for one serving process (the polling process or a webhook worker)."""
+    pool = None
+    if cfg['analysis_workers'] > 0:
+        try:
+            pool = AnalysisPool(cfg['analysis_workers'])
+        except Exception as e:
+            print(f"⚠️  Analysis pool disabled ({e}) — indicators run in-process")
+    webhook = bool(cfg['webhook_port'])
+    shared  = cfg['shared_cache_db'] or ('kline_cache.db' if webhook else None)
+    subs_db = cfg['subscriptions_db'] or ('subscriptions.db' if webhook else None)
+    owns    = None
+    if webhook:      # each worker broadcasts to the chats routed to it
+        n, idx = cfg['webhook_workers'], cfg.get('worker_index', 0)
+        owns = lambda chat_id: chat_id % n == idx
+    analyzer = CryptoAnalyzer(
+        cfg['binance_api_key'], cfg['binance_secret'],
+        hedge_delay=float(cfg['hedge_delay']) if cfg['hedge_delay'] else None,
+        price_budget=cfg['price_budget'],
+        last_analysis=AnalysisStore(cfg['analysis_max'], cfg['analysis_ttl'], cfg['analysis_db']),
+        kline_store=KlineStore(cfg['klines_db']) if cfg['klines_db'] else None,
+        kline_float32=cfg['klines_float32'],
+        pool=pool,
+        shared_cache=KlineCache(shared) if shared else None,
+        weights=_weight_limiter(cfg),
+        scan_symbols=cfg['scan_symbols'],
+    )
+    if cfg.get('order_books') is not None:           # webhook worker: read the front process's feed
+        analyzer.order_books = cfg['order_books']
+    elif cfg['order_book_symbols'] and not webhook:
+        from orderbook import OrderBookFeed          # numpy-backed; only imported when enabled
+        feed = OrderBookFeed(cfg['order_book_symbols'], analyzer._depth_snapshot)
+        if feed.start():
+            analyzer.order_books = feed
+    bot = TelegramBot(cfg['token'], cfg['binance_api_key'], cfg['binance_secret'],
+                      proxy_url=cfg['proxy_url'], analyzer=analyzer, admin_ids=cfg['admin_ids'],
+                      mem_log_interval=cfg['mem_log_interval'], base_url=cfg['base_url'],
+                      concurrent_updates=cfg['concurrent_updates'],
+                      admission=AdmissionController(cfg['max_inflight'], cfg['max_queue'],
+                                                    cfg['max_queue_wait'], cfg['user_rate'],
+                                                    cfg['user_burst']),
+                      subscriptions=SubscriptionStore(subs_db),
+                      broadcast_rate=cfg['broadcast_rate'] / (cfg['webhook_workers'] if webhook else 1),
+                      owns=owns)
+    return bot, pool
+
+
+def _depth_fetcher(weights: WeightLimiter, api: str = "https://api.binance.com/api/v3"):
+    """depth(symbol, limit) for an OrderBookFeed outside a CryptoAnalyzer, within `weights`."""
+    def depth(symbol: str, limit: int) -> Dict:
+        weights.acquire(depth_weight(limit))
+        r = requests.get(f"{api}/depth", params={'symbol': f"{symbol}USDT", 'limit': limit},
+                         timeout=15)
+        weights.update(r.headers)
+        if r.status_code in (418, 429):
+            weights.backoff(float(r.headers.get('Retry-After', 60)))
+            METRICS.inc('http_errors', source='binance_rate_limited')
+        r.raise_for_status()
+        return r.json()
+    return depth
+
+
+def _front_order_books(cfg: Dict):
+    """
+    Webhook mode: one depth stream and one set of /depth snapshots in the
+    front process, its imbalances shared with every worker — instead of
+    each worker keeping identical books.
+    """
+    from orderbook import OrderBookFeed, SharedImbalance
+    shared = SharedImbalance(cfg['order_book_symbols'])
+    feed   = OrderBookFeed(cfg['order_book_symbols'], _depth_fetcher(_weight_limiter(cfg)),
+                           shared=shared)
+    return shared if feed.start() else None
+
+
 def main():
-    BOT_TOKEN       = os.getenv('TELEGRAM_BOT_TOKEN')
-    BINANCE_API_KEY = os.getenv('BINANCE_API_KEY')
-    BINANCE_SECRET  = os.getenv('BINANCE_SECRET')
-    PROXY_URL       = os.getenv('TELEGRAM_PROXY_URL')   # optional
+    cfg = _read_config()
 
-    if not BOT_TOKEN:
+    if not cfg['token']:
         print("❌ TELEGRAM_BOT_TOKEN not set.")
         print("Create a .env file: TELEGRAM_BOT_TOKEN=your_token")
         return
 
+    if cfg['user_rate'] <= 0 or cfg['user_burst'] < 1:
+        print("❌ USER_RATE must be above 0 and USER_BURST at least 1.")
+        return
+
     print("✅ Bot token loaded")
-    print(f"🔬 Real TA: {'enabled' if TA_AVAILABLE else 'DISABLED — run: pip install ta pandas numpy'}")
-    if PROXY_URL:
-        print(f"🌐 Proxy:   {PROXY_URL}")
+    print(f"🔬 Real TA: {'enabled' if TA_AVAILABLE else 'DISABLED — run: pip install numpy'}")
+    if cfg['proxy_url']:
+        print(f"🌐 Proxy:   {cfg['proxy_url']}")
     else:
         print("🌐 Proxy:   none (set TELEGRAM_PROXY_URL in .env if needed)")
+    webhook = bool(cfg['webhook_port'])
+    base_url = cfg['base_url'] or 'https://api.telegram.org/bot'
 
-    # Pre-flight: verify the token is reachable before handing off to PTB.
-    # Uses requests (separate from httpx) so we get a clear error early.
+    # TA imports run in the background; the first analysis waits for them if needed
+    preload_ta()
+
+    # Pre-flight getMe runs concurrently with building the analyzer, the
+    # Application and its handlers — startup costs max(preflight, build).
+    # In webhook mode the workers build their own bots; this process only routes.
     print("🔍 Verifying bot token…")
+    phases = {'imports': _STARTUP['imports']}
+    bot = pool = server = None
+    def preflight(t_pre: float) -> bool:
+        ok = _verify_token(cfg['token'], cfg['proxy_url'], base_url)
+        phases['preflight'] = time.perf_counter() - t_pre    # before result() can return
+        return ok
+
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        verified = ex.submit(preflight, time.perf_counter())
+
+        t0 = time.perf_counter()
+        if webhook:
+            server = WebhookServer(cfg, cfg['webhook_workers'], cfg['webhook_host'],
+                                   int(cfg['webhook_port']), cfg['webhook_path'],
+                                   cfg['webhook_secret'],
+                                   _front_order_books(cfg) if cfg['order_book_symbols'] else None)
+        else:
+            bot, pool = _build_bot(cfg)
+        phases['build'] = time.perf_counter() - t0
+        if not verified.result():
+            if pool is not None:
+                pool.shutdown()
+            return
+
+    if cfg['metrics_port']:
+        start_metrics_server(int(cfg['metrics_port']))
+    if cfg['mem_trace']:
+        MemoryMonitor.start_tracing(cfg['mem_trace'])
+
+    phases['total'] = time.perf_counter() - _IMPORT_T0
+    print("⏱️  Startup: " + "  ".join(f"{k} {phases[k]:.2f}s"
+                                      for k in ('imports', 'preflight', 'build', 'total'))
+          + f"  (TA engine {'ready' if _TA_LOADED else 'still loading in background'})")
+
+    if webhook:
+        server.start()
+        print(f"🪝 Webhook: http://{cfg['webhook_host']}:{cfg['webhook_port']}{cfg['webhook_path']}"
+              f" → {cfg['webhook_workers']} workers")
+        if cfg['webhook_url']:
+            _set_webhook(cfg['token'], cfg['webhook_url'], cfg['webhook_secret'],
+                         cfg['proxy_url'], base_url)
+        else:
+            print("   (WEBHOOK_URL not set — not registering with Telegram; POST updates locally)")
+        print("🚀 Starting…")
+        server.serve_forever()
+        return
+
+    print("🚀 Starting…")
+    try:
+        bot.run()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def _verify_token(token: str, proxy_url: Optional[str],
+                  base_url: str = 'https://api.telegram.org/bot') -> bool:
+    """
+    Pre-flight: verify the token is reachable before handing off to PTB.
+    Uses requests (separate from httpx) so we get a clear error early.
+    """
     try:
         resp = requests.get(
-            f"https://api.telegram.org/bot{BOT_TOKEN}/getMe",
+            f"{base_url}{token}/getMe",
             timeout=20,
-            proxies={'https': PROXY_URL} if PROXY_URL else None,
+            proxies={'https': proxy_url} if proxy_url else None,
         )
         data = resp.json()
         if data.get('ok'):
             username = data['result'].get('username', '?')
             print(f"✅ Bot verified: @{username}")
-        else:
-            print(f"❌ Token rejected by Telegram: {data.get('description')}")
-            print("   → Check TELEGRAM_BOT_TOKEN in your .env file.")
-            return
+            return True
+        print(f"❌ Token rejected by Telegram: {data.get('description')}")
+        print("   → Check TELEGRAM_BOT_TOKEN in your .env file.")
     except requests.exceptions.Timeout:
         print("❌ Timed out reaching api.telegram.org.")
         print("   → Your network may be filtering HTTPS to Telegram's API servers.")
         print("   → Try setting TELEGRAM_PROXY_URL in .env (e.g. http://127.0.0.1:7890).")
-        return
     except requests.exceptions.ConnectionError as e:
         print(f"❌ Connection error: {e}")
         print("   → Check your internet connection.")
-        return
-
-    print("🚀 Starting…")
+    return False
 
-    TelegramBot(BOT_TOKEN, BINANCE_API_KEY, BINANCE_SECRET, proxy_url=PROXY_URL).run()
 
+_STARTUP = {'imports': time.perf_counter() - _IMPORT_T0}
 
 if __name__ == '__main__':
     main()
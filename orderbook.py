@@ -0,0 +1,699 @@
+"""
+orderbook.py — locally maintained Binance order books from the diff-depth stream.
+
+An OrderBook starts from one REST /depth snapshot and then applies
+`<symbol>@depth@100ms` diff events, following Binance's procedure: events
+older than the snapshot are dropped, the first applied event must straddle
+the snapshot's lastUpdateId, and every later one must continue where the
+previous ended. A gap means the book is reloaded. Each side is a pair of
+NumPy arrays kept best-first. After every event the cumulative quantity at
+the tracked depths is refreshed, so imbalance() is a lookup.
+
+OrderBookFeed keeps books for a fixed set of symbols on a background event
+loop. `websockets` is optional: without it the feed does not start and
+callers keep using REST. ReplayExchange is a deterministic stand-in for the
+exchange (snapshots plus consecutive diff events, with gaps on demand). It
+drives `python orderbook.py`, which checks the local book against the
+exchange's true book.
+
+Snapshot files (.obs, written by record_orderbook.py) hold the top levels of
+a book at fixed intervals. They are append-only fixed-size records with
+prices stored as float32 offsets from the best bid/ask, so the backtest can
+memory-map a file and line it up with candle closes without a parse step.
+"""
+
+import asyncio
+import concurrent.futures
+import importlib.util
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WEBSOCKETS_AVAILABLE = importlib.util.find_spec('websockets') is not None
+BINANCE_WS = "wss://stream.binance.com:9443"
+
+DEPTHS = (5, 10, 20)
+
+
+class BookSide:
+    """
+    One side of the book as parallel arrays sorted best-first. Bids are
+    stored under negated prices so both sides sort ascending.
+    """
+
+    def __init__(self, bids: bool, max_levels: int = 5000):
+        self.sign       = -1.0 if bids else 1.0
+        self.max_levels = max_levels
+        self.keys = np.empty(0)
+        self.qty  = np.empty(0)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @staticmethod
+    def _levels(levels: Sequence) -> np.ndarray:
+        return np.array(levels, dtype=np.float64).reshape(-1, 2)
+
+    def load(self, levels: Sequence):
+        arr   = self._levels(levels)
+        arr   = arr[arr[:, 1] > 0]
+        keys  = self.sign * arr[:, 0]
+        order = np.argsort(keys, kind='stable')[:self.max_levels]
+        self.keys, self.qty = keys[order], arr[order, 1]
+
+    def apply(self, levels: Sequence):
+        """Absolute quantities per price level; 0 removes the level."""
+        if not len(levels):
+            return
+        arr   = self._levels(levels)
+        order = np.argsort(self.sign * arr[:, 0], kind='stable')
+        keys, qty = self.sign * arr[order, 0], arr[order, 1]
+        if len(keys) > 1:                          # a price repeated within one event: last entry wins
+            last = np.append(keys[1:] != keys[:-1], True)
+            keys, qty = keys[last], qty[last]
+
+        pos   = np.searchsorted(self.keys, keys)
+        found = pos < len(self.keys)
+        found[found] = self.keys[pos[found]] == keys[found]
+        live  = qty > 0
+        upd = found & live
+        self.qty[pos[upd]] = qty[upd]              # changed quantity: in place
+
+        gone = pos[found & ~live]
+        add  = ~found & live
+        k, q = self.keys, self.qty
+        if len(gone):
+            mask = np.ones(len(k), dtype=bool)
+            mask[gone] = False
+            k, q = k[mask], q[mask]
+        if add.any():
+            at = pos[add] - np.searchsorted(gone, pos[add])   # positions after the removals
+            k, q = np.insert(k, at, keys[add]), np.insert(q, at, qty[add])
+        self.keys, self.qty = k[:self.max_levels], q[:self.max_levels]
+
+    def prices(self) -> np.ndarray:
+        return self.sign * self.keys
+
+
+class OrderBook:
+    """Local book for one symbol; see the module docstring for the sync rules."""
+
+    def __init__(self, symbol: str, max_levels: int = 5000):
+        self.symbol = symbol
+        self.bids   = BookSide(True, max_levels)
+        self.asks   = BookSide(False, max_levels)
+        self.last_update_id: Optional[int] = None
+        self.updated_at = 0.0                      # time.monotonic() of the last change
+        self._imbalance: Dict[int, float] = {}
+
+    @property
+    def synced(self) -> bool:
+        return self.last_update_id is not None
+
+    def load_snapshot(self, snapshot: Dict):
+        """REST /depth answer: {'lastUpdateId', 'bids': [[p, q], …], 'asks': […]}."""
+        self.bids.load(snapshot['bids'])
+        self.asks.load(snapshot['asks'])
+        self.last_update_id = int(snapshot['lastUpdateId'])
+        self._refresh()
+
+    def reset(self):
+        self.last_update_id = None
+        self._imbalance = {}
+
+    def apply(self, event: Dict) -> bool:
+        """
+        Apply one diff event ({'U', 'u', 'b', 'a'}). Returns False on a
+        sequence gap or without a snapshot; the book is then unsynced until
+        the next load_snapshot().
+        """
+        if self.last_update_id is None:
+            return False
+        first, last = int(event['U']), int(event['u'])
+        if last <= self.last_update_id:
+            return True                            # already contained in the snapshot
+        if not first <= self.last_update_id + 1 <= last:
+            self.reset()
+            return False
+        self.bids.apply(event['b'])
+        self.asks.apply(event['a'])
+        self.last_update_id = last
+        self._refresh()
+        return True
+
+    def _refresh(self):
+        top = max(DEPTHS)
+        cb  = np.cumsum(self.bids.qty[:top])
+        ca  = np.cumsum(self.asks.qty[:top])
+        imbalance = {}
+        for d in DEPTHS:
+            b = float(cb[min(d, len(cb)) - 1]) if len(cb) else 0.0
+            a = float(ca[min(d, len(ca)) - 1]) if len(ca) else 0.0
+            imbalance[d] = b / (b + a) if b + a > 0 else 0.5
+        self._imbalance = imbalance                # swapped whole: readers on other threads see old or new
+        self.updated_at = time.monotonic()
+
+    def imbalance(self, depth: int = 20) -> Optional[float]:
+        """Bid share of the quantity in the top `depth` levels per side (one of DEPTHS)."""
+        return self._imbalance.get(depth)
+
+    def top(self, n: int = 20) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (bid prices, bid qty, ask prices, ask qty) of the best `n` levels.
+        Call it from the thread that applies events (OrderBookFeed.top from others).
+        """
+        return (self.bids.prices()[:n], self.bids.qty[:n].copy(),
+                self.asks.prices()[:n], self.asks.qty[:n].copy())
+
+
+# ---------------------------------------------------------------------------
+# Feed — books for a fixed symbol set, kept on a background event loop
+# ---------------------------------------------------------------------------
+async def binance_depth_stream(symbols: Sequence[str]) -> AsyncIterator[Tuple[str, Dict]]:
+    """(symbol, diff event) pairs from one combined Binance stream; symbols without 'USDT'."""
+    import websockets
+    streams = '/'.join(f"{s.lower()}usdt@depth@100ms" for s in symbols)
+    async with websockets.connect(f"{BINANCE_WS}/stream?streams={streams}",
+                                  ping_interval=20, max_size=2 ** 22) as ws:
+        async for raw in ws:
+            data = json.loads(raw).get('data') or {}
+            if data.get('e') == 'depthUpdate':
+                yield data['s'][:-4], data
+
+
+class OrderBookFeed:
+    """
+    Keeps an OrderBook per symbol in sync from `stream_fn(symbols)` (an
+    async iterator of (symbol, event)) and `snapshot_fn(symbol)` (a blocking
+    REST /depth call). Events arriving while a snapshot loads are buffered
+    and replayed onto it. A reconnect resyncs every book. imbalance()
+    returns None for books that are unsynced or quiet for `stale_after`
+    seconds, so callers can fall back to REST.
+    """
+
+    _BUFFER_MAX = 2000
+
+    def __init__(self, symbols: Sequence[str], snapshot_fn: Callable[[str], Dict],
+                 stream_fn: Optional[Callable] = None, stale_after: float = 10.0,
+                 reconnect_delay: float = 5.0, shared: Optional['SharedImbalance'] = None):
+        self.symbols     = [s.upper() for s in symbols]
+        self.snapshot_fn = snapshot_fn
+        self.stream_fn   = stream_fn
+        self.stale_after = stale_after
+        self.reconnect_delay = reconnect_delay
+        self.books: Dict[str, OrderBook] = {s: OrderBook(s) for s in self.symbols}
+        self.shared  = shared                       # imbalances published for other processes
+        self.resyncs = 0
+        self._pending: Dict[str, List[Dict]] = {}   # symbol -> events buffered during a snapshot
+        self._thread: Optional[threading.Thread] = None
+        self._loop:   Optional[asyncio.AbstractEventLoop] = None
+        self._stop   = threading.Event()
+
+    def start(self) -> bool:
+        """Run the feed on a daemon thread; False if no stream is available."""
+        if self.stream_fn is None:
+            if not WEBSOCKETS_AVAILABLE:
+                logger.warning("websockets not installed — local order books disabled. "
+                               "Run: pip install websockets")
+                return False
+            self.stream_fn = binance_depth_stream
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._run()),
+                                         name='orderbook-feed', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def synced(self) -> int:
+        return sum(1 for s in self.symbols if self.imbalance(s) is not None)
+
+    def imbalance(self, symbol: str, depth: int = 20) -> Optional[float]:
+        book = self.books.get(symbol)
+        if book is None or not book.synced or time.monotonic() - book.updated_at > self.stale_after:
+            return None
+        return book.imbalance(depth)
+
+    def top(self, symbol: str, n: int = 20, timeout: float = 2.0):
+        """
+        OrderBook.top() of a synced, fresh book, or None. Books are only
+        changed on the feed's loop, so the copy is taken there, between two
+        events: both sides and their prices and quantities belong to the
+        same update. None too if the loop has ended or does not get to it
+        within `timeout`.
+        """
+        loop = self._loop
+        if loop is None or self.imbalance(symbol) is None:
+            return None
+        coro = self._top(symbol, n)
+        try:
+            fut = asyncio.run_coroutine_threadsafe(coro, loop)
+        except RuntimeError:                        # loop closed: the feed has stopped
+            coro.close()
+            return None
+        try:
+            return fut.result(timeout)
+        except concurrent.futures.TimeoutError:     # loop stalled, or stopped before running it
+            fut.cancel()
+            return None
+
+    async def _top(self, symbol: str, n: int):
+        book = self.books[symbol]
+        return book.top(n) if book.synced else None
+
+    async def _run(self, reconnect: bool = True):
+        self._loop = asyncio.get_running_loop()
+        try:
+            await self._serve(reconnect)
+        finally:
+            self._loop = None                       # top() stops scheduling onto this loop
+
+    async def _serve(self, reconnect: bool):
+        while not self._stop.is_set():
+            for book in self.books.values():
+                book.reset()
+                self._publish(book)
+            self._pending.clear()
+            try:
+                async for symbol, event in self.stream_fn(self.symbols):
+                    if self._stop.is_set():
+                        return
+                    self._on_event(symbol, event)
+            except Exception as e:
+                logger.warning(f"Depth stream dropped: {e}")
+            if not reconnect:                       # replay: finish outstanding snapshots and stop
+                while self._pending:
+                    await asyncio.sleep(0.01)
+                return
+            if not self._stop.is_set():
+                await asyncio.sleep(self.reconnect_delay)
+
+    def _on_event(self, symbol: str, event: Dict):
+        book = self.books.get(symbol)
+        if book is None:
+            return
+        if symbol in self._pending:                 # snapshot in flight
+            buf = self._pending[symbol]
+            buf.append(event)
+            if len(buf) > self._BUFFER_MAX:
+                del buf[:len(buf) - self._BUFFER_MAX]
+            return
+        if book.apply(event):
+            self._publish(book)
+            return
+        self._publish(book)
+        self._pending[symbol] = [event]
+        asyncio.get_running_loop().create_task(self._resync(symbol))
+
+    async def _resync(self, symbol: str):
+        self.resyncs += 1
+        try:
+            snapshot = await asyncio.get_running_loop().run_in_executor(None, self.snapshot_fn, symbol)
+        except Exception as e:
+            logger.warning(f"Depth snapshot for {symbol} failed: {e}")
+            await asyncio.sleep(self.reconnect_delay)
+            self._pending.pop(symbol, None)         # the next event triggers another attempt
+            return
+        book = self.books[symbol]
+        book.load_snapshot(snapshot)
+        for event in self._pending.pop(symbol, []):
+            if not book.apply(event):
+                self._publish(book)
+                # The buffer does not reach back to the snapshot; start over
+                self._pending[symbol] = []
+                asyncio.get_running_loop().create_task(self._resync(symbol))
+                return
+        self._publish(book)
+
+    def _publish(self, book: OrderBook):
+        if self.shared is not None:
+            self.shared.publish(book)
+
+
+class SharedImbalance:
+    """
+    The imbalance() side of an OrderBookFeed for other processes: one
+    float64 row per symbol (updated_at, then the bid share at each of
+    DEPTHS) in a shared array. The process running the feed publishes into
+    it after every change; readers get the feed's interface (symbols,
+    imbalance(), synced()) without a socket or REST snapshot of their own.
+    Pass it to child processes as a Process argument. A read racing a
+    publish may mix depths from two consecutive updates — each value is
+    still a real imbalance. updated_at is time.monotonic(), which is
+    system-wide on the platforms the bot runs on.
+    """
+
+    def __init__(self, symbols: Sequence[str], stale_after: float = 10.0, ctx=None, _buffer=None):
+        import multiprocessing
+        self.symbols     = [s.upper() for s in symbols]
+        self.stale_after = stale_after
+        self._rows   = {s: i for i, s in enumerate(self.symbols)}
+        self._buffer = _buffer
+        if _buffer is None:
+            self._buffer = (ctx or multiprocessing).RawArray('d', len(self.symbols) * (1 + len(DEPTHS)))
+        self._table = np.frombuffer(self._buffer, dtype=np.float64).reshape(len(self.symbols), -1)
+        if _buffer is None:
+            self._table[:, 0] = np.nan
+
+    def __reduce__(self):
+        return SharedImbalance, (self.symbols, self.stale_after, None, self._buffer)
+
+    def publish(self, book: OrderBook):
+        row = self._table[self._rows[book.symbol]]
+        if not book.synced:
+            row[0] = np.nan
+            return
+        row[1:] = [book.imbalance(d) for d in DEPTHS]
+        row[0]  = book.updated_at                  # stamp last: readers check it first
+
+    def imbalance(self, symbol: str, depth: int = 20) -> Optional[float]:
+        k = self._rows.get(symbol)
+        if k is None:
+            return None
+        row = self._table[k]
+        if not time.monotonic() - row[0] <= self.stale_after:   # NaN = unsynced
+            return None
+        return float(row[1 + DEPTHS.index(depth)])
+
+    def synced(self) -> int:
+        return sum(1 for s in self.symbols if self.imbalance(s) is not None)
+
+
+# ---------------------------------------------------------------------------
+# Snapshot files — compact, append-only top-N history for backtests
+# ---------------------------------------------------------------------------
+# A 32-byte header (magic, depth, symbol) followed by fixed-size records.
+# Prices are stored as the best bid/ask (float64) plus float32 distances
+# from them, quantities as float32: 24 + 16·depth bytes per snapshot
+# (344 at depth 20). Appending never rewrites earlier bytes, and a record cut
+# short by a crash is ignored on load.
+SNAPSHOT_MAGIC  = b'OBSNAP1\n'
+_HEADER_SIZE    = 32
+
+
+def snapshot_dtype(depth: int):
+    return np.dtype([('ts', '<i8'), ('best_bid', '<f8'), ('best_ask', '<f8'),
+                     ('bid_off', '<f4', (depth,)), ('bid_qty', '<f4', (depth,)),
+                     ('ask_off', '<f4', (depth,)), ('ask_qty', '<f4', (depth,))])
+
+
+class SnapshotWriter:
+    """Appends top-`depth` snapshots of one symbol to `path`, creating the header if new."""
+
+    def __init__(self, path: str, symbol: str, depth: int = 20):
+        self.depth = depth
+        self.dtype = snapshot_dtype(depth)
+        self._f    = open(path, 'ab')
+        if self._f.tell() == 0:
+            header = SNAPSHOT_MAGIC + depth.to_bytes(2, 'little') + symbol.encode()[:22].ljust(22, b'\0')
+            self._f.write(header)
+        else:
+            file_symbol, file_depth = read_header(path)
+            if file_depth != depth or file_symbol != symbol:
+                raise ValueError(f"{path} holds {file_symbol} depth {file_depth}, not {symbol} depth {depth}")
+        self._rec = np.zeros(1, dtype=self.dtype)
+
+    def append(self, ts_ms: int, bid_px, bid_qty, ask_px, ask_qty):
+        """One snapshot; sides shorter than `depth` are zero-padded."""
+        r = self._rec
+        r[:] = 0
+        nb, na = min(len(bid_px), self.depth), min(len(ask_px), self.depth)
+        r['ts'] = ts_ms
+        r['best_bid'] = bid_px[0] if nb else 0.0
+        r['best_ask'] = ask_px[0] if na else 0.0
+        r['bid_off'][0, :nb] = r['best_bid'][0] - np.asarray(bid_px[:nb], dtype=np.float64)
+        r['ask_off'][0, :na] = np.asarray(ask_px[:na], dtype=np.float64) - r['best_ask'][0]
+        r['bid_qty'][0, :nb] = bid_qty[:nb]
+        r['ask_qty'][0, :na] = ask_qty[:na]
+        self._f.write(r.tobytes())
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def read_header(path: str) -> Tuple[str, int]:
+    with open(path, 'rb') as f:
+        head = f.read(_HEADER_SIZE)
+    if len(head) < _HEADER_SIZE or not head.startswith(SNAPSHOT_MAGIC):
+        raise ValueError(f"{path} is not an order-book snapshot file")
+    depth  = int.from_bytes(head[8:10], 'little')
+    symbol = head[10:].rstrip(b'\0').decode()
+    return symbol, depth
+
+
+def load_snapshots(path: str):
+    """(symbol, records) — a read-only memory map of the complete records, oldest first."""
+    symbol, depth = read_header(path)
+    dtype = snapshot_dtype(depth)
+    count = (os.path.getsize(path) - _HEADER_SIZE) // dtype.itemsize
+    if count <= 0:
+        return symbol, np.zeros(0, dtype=dtype)
+    return symbol, np.memmap(path, dtype=dtype, mode='r', offset=_HEADER_SIZE, shape=(count,))
+
+
+def snapshot_imbalance(records, depth: Optional[int] = None) -> np.ndarray:
+    """Bid share of the top-`depth` quantity for every record (0.5 for an empty book)."""
+    d = depth or records.dtype['bid_qty'].shape[0]
+    b = records['bid_qty'][:, :d].sum(axis=1, dtype=np.float64)
+    a = records['ask_qty'][:, :d].sum(axis=1, dtype=np.float64)
+    total = b + a
+    return np.divide(b, total, out=np.full(len(records), 0.5), where=total > 0)
+
+
+def align_to_candles(records, open_times, step_ms: int, depth: Optional[int] = None,
+                     max_age_ms: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Imbalance as of each candle's close: the latest snapshot taken at or
+    before open_time + step and no older than `max_age_ms` (default one
+    candle). Returns (imbalance, covered) arrays; uncovered candles get 0.5.
+    """
+    ts     = np.asarray(records['ts'], dtype=np.int64)
+    closes = np.asarray(open_times, dtype=np.int64) + step_ms
+    imb    = snapshot_imbalance(records, depth)
+    idx    = np.searchsorted(ts, closes, side='right') - 1
+    has    = idx >= 0
+    safe   = np.where(has, idx, 0)
+    age    = closes - (ts[safe] if len(ts) else 0)
+    covered = has & (age <= (step_ms if max_age_ms is None else max_age_ms))
+    return np.where(covered, imb[safe] if len(imb) else 0.5, 0.5), covered
+
+
+def imbalance_scores(imbalance: np.ndarray) -> np.ndarray:
+    """The live +1/-1/0 order-book signal (bid share > 0.60 / < 0.40), vectorised."""
+    return np.where(imbalance > 0.60, 1, np.where(imbalance < 0.40, -1, 0)).astype(np.int8)
+
+# ---------------------------------------------------------------------------
+# Replay stand-in for the exchange
+# ---------------------------------------------------------------------------
+class ReplayExchange:
+    """
+    A synthetic book that changes a few levels per step and reports each
+    step as a Binance-style diff event with consecutive update ids. The true
+    book is kept, so a local book can be checked against it at any point.
+    """
+
+    def __init__(self, symbol: str = 'BTC', seed: int = 0, levels: int = 300,
+                 mid: float = 100.0, tick: float = 0.01):
+        self.symbol = symbol
+        self.rng    = random.Random(seed)
+        self.tick   = tick
+        self.mid    = mid
+        self.update_id = 1000
+        self._lock  = threading.Lock()             # snapshots are taken from executor threads
+        self.bids: Dict[str, float] = {}
+        self.asks: Dict[str, float] = {}
+        for i in range(1, levels + 1):
+            self.bids[self._px(mid - i * tick)] = self._qty()
+            self.asks[self._px(mid + i * tick)] = self._qty()
+
+    def _px(self, p: float) -> str:
+        return f"{round(p / self.tick) * self.tick:.8f}"
+
+    def _qty(self) -> float:
+        return round(self.rng.uniform(0.1, 10.0), 4)
+
+    def snapshot(self, symbol: Optional[str] = None, limit: int = 1000) -> Dict:
+        with self._lock:
+            bids = sorted(self.bids.items(), key=lambda kv: -float(kv[0]))[:limit]
+            asks = sorted(self.asks.items(), key=lambda kv: float(kv[0]))[:limit]
+            last = self.update_id
+        return {'lastUpdateId': last,
+                'bids': [[p, f"{q:.8f}"] for p, q in bids],
+                'asks': [[p, f"{q:.8f}"] for p, q in asks]}
+
+    def step(self, changes: int = 6) -> Dict:
+        """Mutate the true book and return the diff event describing it."""
+        with self._lock:
+            return self._step(changes)
+
+    def _step(self, changes: int) -> Dict:
+        first = self.update_id + 1
+        b, a = [], []
+        for _ in range(changes):
+            self.update_id += 1
+            bid  = self.rng.random() < 0.5
+            book, out = (self.bids, b) if bid else (self.asks, a)
+            dist = self.rng.randint(1, 40) * self.tick
+            px   = self._px(self.mid - dist if bid else self.mid + dist)
+            qty  = 0.0 if (px in book and self.rng.random() < 0.3) else self._qty()
+            if qty:
+                book[px] = qty
+            else:
+                book.pop(px, None)
+            out.append([px, f"{qty:.8f}"])
+        return {'e': 'depthUpdate', 's': f"{self.symbol}USDT",
+                'U': first, 'u': self.update_id, 'b': b, 'a': a}
+
+    def true_imbalance(self, depth: int = 20) -> float:
+        b = sum(q for _, q in sorted(self.bids.items(), key=lambda kv: -float(kv[0]))[:depth])
+        a = sum(q for _, q in sorted(self.asks.items(), key=lambda kv: float(kv[0]))[:depth])
+        return b / (b + a) if b + a > 0 else 0.5
+
+    async def stream(self, steps: int, drop: Sequence[int] = (), delay: float = 0.0):
+        """Stream-function stand-in: `steps` events, silently losing those whose index is in `drop`."""
+        for i in range(steps):
+            event = self.step()
+            if i not in drop:
+                yield self.symbol, event
+            await asyncio.sleep(delay)
+
+
+# ---------------------------------------------------------------------------
+# Self-check against the replay exchange
+# ---------------------------------------------------------------------------
+def _same_top(book: OrderBook, ex: ReplayExchange, n: int = 20) -> bool:
+    snap = ex.snapshot(limit=n)
+    bp, bq, ap, aq = book.top(n)
+    want = [np.array(snap[k], dtype=np.float64).reshape(-1, 2) for k in ('bids', 'asks')]
+    return (np.array_equal(bp, want[0][:, 0]) and np.array_equal(bq, want[0][:, 1])
+            and np.array_equal(ap, want[1][:, 0]) and np.array_equal(aq, want[1][:, 1]))
+
+
+def _validate() -> bool:
+    ok = True
+
+    # 1. Snapshot + diffs, with events from before the snapshot replayed too
+    ex = ReplayExchange(seed=1)
+    early = [ex.step() for _ in range(5)]
+    book = OrderBook('BTC')
+    book.load_snapshot(ex.snapshot())
+    early_ok = all(book.apply(e) for e in early)
+    steps_ok = True
+    for _ in range(3000):
+        steps_ok &= book.apply(ex.step()) and _same_top(book, ex)
+    imb_ok = all(abs(book.imbalance(d) - ex.true_imbalance(d)) < 1e-12 for d in DEPTHS)
+    print(f"  diff replay: stale events {'ok' if early_ok else 'FAIL'}, "
+          f"3000 events {'ok' if steps_ok else 'MISMATCH'}, imbalance {'ok' if imb_ok else 'MISMATCH'}")
+    ok &= early_ok and steps_ok and imb_ok
+
+    # 2. A lost event is detected, and a reload recovers
+    ex.step()
+    gap_ok = not book.apply(ex.step()) and not book.synced
+    book.load_snapshot(ex.snapshot())
+    gap_ok &= book.apply(ex.step()) and _same_top(book, ex)
+    print(f"  gap detection / resync: {'ok' if gap_ok else 'FAIL'}")
+    ok &= gap_ok
+
+    # 3. The feed: buffered events during snapshots, dropped events → resync
+    ex   = ReplayExchange(seed=2)
+    feed = OrderBookFeed(['BTC'], snapshot_fn=lambda s: ex.snapshot(),
+                         stream_fn=lambda symbols: ex.stream(2000, drop=(500, 1500)),
+                         shared=SharedImbalance(['BTC']))
+    asyncio.run(feed._run(reconnect=False))
+    feed_ok = (feed.imbalance('BTC') is not None and _same_top(feed.books['BTC'], ex)
+               and feed.resyncs == 3
+               and all(feed.shared.imbalance('BTC', d) == feed.imbalance('BTC', d) for d in DEPTHS))
+    print(f"  feed with 2 lost events: {feed.resyncs} syncs, book {'ok' if feed_ok else 'MISMATCH'}")
+    ok &= feed_ok
+
+    # 3b. Samples taken from another thread while events apply match a state the book went through
+    ex     = ReplayExchange(seed=5)
+    states = set()
+    ended  = threading.Event()
+
+    def _key(top):
+        return b''.join(a.tobytes() for a in top)
+
+    async def recorded(symbols):
+        async for symbol, event in ex.stream(1000, delay=0.001):
+            yield symbol, event
+            states.add(_key(feed.books['BTC'].top(20)))     # event applied by now, on this loop
+        ended.set()
+    feed = OrderBookFeed(['BTC'], snapshot_fn=lambda s: ex.snapshot(), stream_fn=recorded)
+    thread = threading.Thread(target=lambda: asyncio.run(feed._run(reconnect=False)))
+    thread.start()
+    samples = []
+    while not ended.is_set() and thread.is_alive():
+        top = feed.top('BTC', 20)
+        if top is not None:
+            samples.append(_key(top))
+        time.sleep(0.0005)
+    thread.join()
+    top_ok = len(samples) > 50 and all(k in states for k in samples)
+    print(f"  cross-thread top(): {len(samples)} samples, {'consistent' if top_ok else 'TORN'}")
+    ok &= top_ok
+
+    # 4. Cost per event
+    book = OrderBook('BTC')
+    ex   = ReplayExchange(seed=3, levels=1000)
+    book.load_snapshot(ex.snapshot())
+    events = [ex.step() for _ in range(5000)]
+    t0 = time.perf_counter()
+    for e in events:
+        book.apply(e)
+    per = (time.perf_counter() - t0) / len(events)
+    t0 = time.perf_counter()
+    for _ in range(100000):
+        book.imbalance(20)
+    print(f"  apply {per * 1e6:.1f}µs/event (1000 levels), "
+          f"imbalance read {(time.perf_counter() - t0) / 100000 * 1e9:.0f}ns")
+
+    # 5. Snapshot files: round trip, torn tail, candle alignment
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'BTC.obs')
+        ex   = ReplayExchange(seed=4)
+        book = OrderBook('BTC')
+        book.load_snapshot(ex.snapshot())
+        w = SnapshotWriter(path, 'BTC', 20)
+        want, stamps = [], []
+        t0_ms = 1_700_000_000_000
+        for i in range(600):                        # one snapshot every 10 s for 100 minutes
+            book.apply(ex.step())
+            stamps.append(t0_ms + i * 10_000)
+            w.append(stamps[-1], *book.top(20))
+            want.append(book.imbalance(20))
+        w.close()
+        with open(path, 'ab') as f:
+            f.write(b'\x01' * 100)                  # a record cut short by a crash
+        symbol, rec = load_snapshots(path)
+        got = snapshot_imbalance(rec)
+        bp  = rec['best_bid'][-1] - rec['bid_off'][-1].astype(np.float64)
+        file_ok = (symbol == 'BTC' and len(rec) == 600
+                   and np.allclose(got, want, rtol=0, atol=1e-6)
+                   and np.allclose(bp, book.top(20)[0], rtol=0, atol=1e-6))
+        opens = t0_ms - 60_000 + np.arange(0, 120) * 60_000
+        imb, covered = align_to_candles(rec, opens, 60_000)
+        # candle k closes at t0 + k·60 s → snapshot 6k is the latest at or before it
+        k = np.arange(100)
+        align_ok = (covered[:101].all() and not covered[101:].any()
+                    and np.array_equal(imb[:100], got[6 * k]))
+        print(f"  snapshot file ({rec.dtype.itemsize} B/record): round trip {'ok' if file_ok else 'MISMATCH'}, "
+              f"candle alignment {'ok' if align_ok else 'MISMATCH'}")
+        ok &= file_ok and align_ok
+    return ok
+
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(0 if _validate() else 1)
@@ -0,0 +1,92 @@
+"""
+record_orderbook.py — record top-N order-book snapshots for backtesting the OB signal.
+
+Each symbol gets one append-only file (<dir>/<SYMBOL>.obs, format in
+orderbook.py) with a snapshot every --every seconds. With `websockets`
+installed the books are kept locally from the diff-depth stream and a
+sample costs no request; otherwise /depth is polled (weight 5 per symbol and
+sample, kept inside the per-minute budget).
+
+Usage:
+  python record_orderbook.py BTC ETH SOL --every 5
+  python backtest_real.py --file "BTCUSDT-1m-*.csv" --ob ob_data/BTC.obs
+"""
+
+import argparse
+import os
+import signal
+import time
+
+import numpy as np
+import requests
+
+from klines import WeightLimiter, depth_weight
+from orderbook import OrderBookFeed, SnapshotWriter, WEBSOCKETS_AVAILABLE
+
+BINANCE_API = "https://api.binance.com/api/v3"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('symbols', nargs='+', help='Base assets, e.g. BTC ETH (quoted in USDT)')
+    parser.add_argument('--every', type=float, default=5.0, help='Seconds between snapshots')
+    parser.add_argument('--depth', type=int, default=20, help='Levels per side')
+    parser.add_argument('--dir',   default='ob_data')
+    parser.add_argument('--rest',  action='store_true', help='Poll /depth even if websockets is installed')
+    args = parser.parse_args()
+
+    symbols = [s.upper() for s in args.symbols]
+    os.makedirs(args.dir, exist_ok=True)
+    weights = WeightLimiter(5000, share=1000)       # leave most of the IP budget to the bot
+
+    def depth(symbol: str, limit: int) -> dict:
+        weights.acquire(depth_weight(limit))
+        r = requests.get(f"{BINANCE_API}/depth",
+                         params={'symbol': f"{symbol}USDT", 'limit': limit}, timeout=10)
+        weights.update(r.headers)
+        r.raise_for_status()
+        return r.json()
+
+    feed = None
+    if WEBSOCKETS_AVAILABLE and not args.rest:
+        feed = OrderBookFeed(symbols, lambda s: depth(s, 1000))
+        feed.start()
+    writers = {s: SnapshotWriter(os.path.join(args.dir, f"{s}.obs"), s, args.depth) for s in symbols}
+    print(f"Recording {', '.join(symbols)} every {args.every:g}s "
+          f"({'local books' if feed else 'REST /depth'}) → {args.dir}/")
+
+    stop = []
+    signal.signal(signal.SIGTERM, lambda *_: stop.append(1))
+    written = 0
+    try:
+        while not stop:
+            # Sample on wall-clock multiples of --every so files line up across symbols
+            time.sleep(args.every - time.time() % args.every)
+            ts_ms = int(time.time() * 1000)
+            for s in symbols:
+                try:
+                    if feed is not None:
+                        top = feed.top(s, args.depth)   # copied on the feed's loop, between events
+                        if top is None:                 # not synced (yet) — skip rather than record junk
+                            continue
+                        writers[s].append(ts_ms, *top)
+                    else:
+                        d  = depth(s, args.depth)
+                        b  = np.array(d['bids'], dtype=np.float64).reshape(-1, 2)
+                        a  = np.array(d['asks'], dtype=np.float64).reshape(-1, 2)
+                        writers[s].append(ts_ms, b[:, 0], b[:, 1], a[:, 0], a[:, 1])
+                    written += 1
+                except Exception as e:
+                    print(f"  {s}: snapshot failed ({e})")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for w in writers.values():
+            w.close()
+        if feed is not None:
+            feed.stop()
+        print(f"Stopped — {written:,} snapshots written.")
+
+
+if __name__ == '__main__':
+    main()